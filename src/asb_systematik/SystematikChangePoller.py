@@ -0,0 +1,72 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import logging
+from PyQt5.QtCore import QObject, QTimer
+from injector import singleton, inject
+from asb_systematik.SystematikTreeWidgetService import SystematikTreeWidgetService
+from asb_systematik.SystematikDbWorker import SystematikDbWorker
+
+logger = logging.getLogger(__name__)
+
+@singleton
+class SystematikChangePoller(QObject):
+    """
+    Reads the change log in the background and applies the changes
+    of other users to the tree of the service. Without change log in
+    the database (see SystematikChangeTracking) nothing happens.
+    """
+
+    POLL_INTERVAL_MS = 10 * 1000
+
+    # The ids of the change log are handed out before the commit, so
+    # on PostgreSQL a lower id may become visible after a higher one.
+    # Reading the last entries again catches these, applying a change
+    # twice does no harm.
+    OVERLAP = 100
+
+    @inject
+    def __init__(self, tree_widget_service: SystematikTreeWidgetService, db_worker: SystematikDbWorker):
+
+        super().__init__()
+        self.tree_widget_service = tree_widget_service
+        self.db_worker = db_worker
+        self._task = None
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.poll)
+        # The service asks for a poll when its tree differs
+        # from the database after an edit
+        tree_widget_service.add_poll_listener(self.poll)
+
+    def start(self, interval=None):
+
+        if interval is None:
+            interval = self.POLL_INTERVAL_MS
+        self.timer.start(interval)
+
+    def stop(self):
+
+        self.timer.stop()
+
+    def poll(self):
+
+        if self._task is not None and not self._task.done:
+            return
+        watermark = self.tree_widget_service.watermark
+        if watermark is None:
+            return
+        self._task = self.db_worker.submit(
+            lambda dao, task: self.tree_widget_service.fetch_changes(max(0, watermark - self.OVERLAP), dao),
+            self._changes_fetched, self._poll_failed)
+
+    def _changes_fetched(self, result):
+
+        watermark, changes = result
+        self.tree_widget_service.apply_changes(changes, watermark)
+
+    def _poll_failed(self, exception):
+
+        # Tried again with the next interval
+        logger.warning("Fehler beim Lesen der Änderungen: %s", exception)
@@ -0,0 +1,162 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+
+Installs the change log for the systematik table. Every insert,
+update and deletion is recorded by triggers in systematik_changes,
+together with the identifier the row had before the change. The
+GUI polls the log (SystematikDao.fetch_changes_since) to follow
+the changes of other users.
+
+The usage tables get a change log of their own, for the replica, and
+the indexes for the usage checks.
+'''
+import os
+from sqlalchemy.engine.create import create_engine
+from sqlalchemy.sql.expression import text
+from asb_systematik.SystematikDao import CHANGE_TABLE, REFERENCE_INDEX_STATEMENTS,\
+    USAGE_CHANGE_TABLE, USAGE_CHANGE_KEYS
+
+POSTGRESQL_STATEMENTS = (
+    "create table if not exists %s (" % CHANGE_TABLE +
+    "id bigserial primary key, " +
+    "systematik_id integer not null, " +
+    "operation char(1) not null, " +
+    "punkt varchar, roemisch integer, sub integer, " +
+    "changed_at timestamp not null default now())",
+    """create or replace function systematik_log_change() returns trigger as $$
+begin
+    if (TG_OP = 'INSERT') then
+        insert into %(table)s (systematik_id, operation) values (NEW.id, 'I');
+        return NEW;
+    elsif (TG_OP = 'UPDATE') then
+        insert into %(table)s (systematik_id, operation, punkt, roemisch, sub)
+            values (NEW.id, 'U', OLD.punkt, OLD.roemisch, OLD.sub);
+        return NEW;
+    else
+        insert into %(table)s (systematik_id, operation, punkt, roemisch, sub)
+            values (OLD.id, 'D', OLD.punkt, OLD.roemisch, OLD.sub);
+        return OLD;
+    end if;
+end;
+$$ language plpgsql""" % {'table': CHANGE_TABLE},
+    "drop trigger if exists systematik_change_trigger on systematik",
+    "create trigger systematik_change_trigger after insert or update or delete on systematik " +
+    "for each row execute procedure systematik_log_change()"
+)
+
+SQLITE_STATEMENTS = (
+    "create table if not exists %s (" % CHANGE_TABLE +
+    "id integer primary key autoincrement, " +
+    "systematik_id integer not null, " +
+    "operation char(1) not null, " +
+    "punkt varchar, roemisch integer, sub integer, " +
+    "changed_at timestamp not null default current_timestamp)",
+    "create trigger if not exists systematik_insert_trigger after insert on systematik begin " +
+    "insert into %s (systematik_id, operation) values (new.id, 'I'); end" % CHANGE_TABLE,
+    "create trigger if not exists systematik_update_trigger after update on systematik begin " +
+    "insert into %s (systematik_id, operation, punkt, roemisch, sub) " % CHANGE_TABLE +
+    "values (new.id, 'U', old.punkt, old.roemisch, old.sub); end",
+    "create trigger if not exists systematik_delete_trigger after delete on systematik begin " +
+    "insert into %s (systematik_id, operation, punkt, roemisch, sub) " % CHANGE_TABLE +
+    "values (old.id, 'D', old.punkt, old.roemisch, old.sub); end"
+)
+
+# The key column is passed to the function as trigger argument
+POSTGRESQL_USAGE_STATEMENTS = (
+    "create table if not exists %s (" % USAGE_CHANGE_TABLE +
+    "id bigserial primary key, " +
+    "table_name varchar not null, " +
+    "row_key integer, " +
+    "changed_at timestamp not null default now())",
+    """create or replace function usage_log_change() returns trigger as $$
+begin
+    if (TG_OP = 'INSERT' or TG_OP = 'UPDATE') then
+        insert into %(table)s (table_name, row_key) values (TG_TABLE_NAME, (to_jsonb(NEW)->>TG_ARGV[0])::integer);
+    end if;
+    if (TG_OP = 'UPDATE' or TG_OP = 'DELETE') then
+        insert into %(table)s (table_name, row_key) values (TG_TABLE_NAME, (to_jsonb(OLD)->>TG_ARGV[0])::integer);
+    end if;
+    return null;
+end;
+$$ language plpgsql""" % {'table': USAGE_CHANGE_TABLE}) +\
+    tuple(["drop trigger if exists %s_change_trigger on %s" % (table, table) for table, key in USAGE_CHANGE_KEYS]) +\
+    tuple(["create trigger %s_change_trigger after insert or update or delete on %s " % (table, table) +
+           "for each row execute procedure usage_log_change('%s')" % key for table, key in USAGE_CHANGE_KEYS])
+
+SQLITE_USAGE_STATEMENTS = (
+    "create table if not exists %s (" % USAGE_CHANGE_TABLE +
+    "id integer primary key autoincrement, " +
+    "table_name varchar not null, " +
+    "row_key integer, " +
+    "changed_at timestamp not null default current_timestamp)",) +\
+    tuple(["create trigger if not exists %s_insert_trigger after insert on %s begin " % (table, table) +
+           "insert into %s (table_name, row_key) values ('%s', new.%s); end" % (USAGE_CHANGE_TABLE, table, key)
+           for table, key in USAGE_CHANGE_KEYS]) +\
+    tuple(["create trigger if not exists %s_update_trigger after update on %s begin " % (table, table) +
+           "insert into %s (table_name, row_key) values ('%s', old.%s), ('%s', new.%s); end" %
+           (USAGE_CHANGE_TABLE, table, key, table, key)
+           for table, key in USAGE_CHANGE_KEYS]) +\
+    tuple(["create trigger if not exists %s_delete_trigger after delete on %s begin " % (table, table) +
+           "insert into %s (table_name, row_key) values ('%s', old.%s); end" % (USAGE_CHANGE_TABLE, table, key)
+           for table, key in USAGE_CHANGE_KEYS])
+
+class UnsupportedDatabaseException(Exception):
+    pass
+
+def install_change_tracking(engine):
+    """
+    Creates the change log table and the triggers. May be
+    called again on an installed database.
+    """
+
+    _execute_statements(engine, POSTGRESQL_STATEMENTS, SQLITE_STATEMENTS)
+
+def install_usage_change_tracking(engine):
+    """
+    Creates the change log of the usage tables and its triggers.
+    The replica (see SystematikReplica) then copies only the logged
+    rows instead of comparing the whole tables.
+    """
+
+    _execute_statements(engine, POSTGRESQL_USAGE_STATEMENTS, SQLITE_USAGE_STATEMENTS)
+
+def _execute_statements(engine, postgresql_statements, sqlite_statements):
+
+    if engine.dialect.name == 'postgresql':
+        statements = postgresql_statements
+    elif engine.dialect.name == 'sqlite':
+        statements = sqlite_statements
+    else:
+        raise UnsupportedDatabaseException("Keine Änderungsverfolgung für %s" % engine.dialect.name)
+    with engine.begin() as connection:
+        for statement in statements:
+            # No parameters, so the driver does no % formatting
+            connection.execution_options(no_parameters=True).exec_driver_sql(statement)
+
+def install_reference_indexes(engine):
+    """
+    Creates the indexes for the usage checks (see
+    SystematikDao.normalize_reference_sql) on the usage tables.
+    """
+
+    with engine.begin() as connection:
+        for statement in REFERENCE_INDEX_STATEMENTS:
+            connection.execution_options(no_parameters=True).exec_driver_sql(statement)
+
+def purge_changes(engine, watermark, table=CHANGE_TABLE):
+    """
+    Removes the change log entries up to the watermark. With
+    table=USAGE_CHANGE_TABLE from the log of the usage tables.
+    """
+
+    with engine.begin() as connection:
+        connection.execute(text("delete from %s where id <= :watermark" % table), {'watermark': watermark})
+
+if __name__ == '__main__':
+
+    engine = create_engine(os.environ['DB_URL'])
+    install_change_tracking(engine)
+    install_usage_change_tracking(engine)
+    install_reference_indexes(engine)
@@ -3,19 +3,51 @@ Created on 30.06.2021
 
 @author: michael
 '''
+import logging
 import re
 from injector import singleton, inject, Module, provider, Injector
 from sqlalchemy.engine.base import Connection, Engine
 from sqlalchemy.sql.schema import Table, MetaData, Column, UniqueConstraint
 from sqlalchemy.sql.sqltypes import String, Integer
-from sqlalchemy.sql.expression import select, insert, update, and_, text, delete
+from sqlalchemy.sql.expression import select, insert, update, and_, text, delete,\
+    bindparam
+from sqlalchemy.sql.functions import func
 from sqlalchemy.engine.create import create_engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy import inspect
 import os
-import roman
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures.thread import ThreadPoolExecutor
+from collections import deque
+from bisect import bisect_left, bisect_right
+from functools import lru_cache, total_ordering, wraps
+from asb_systematik.SystematikIdentifierParser import parse_identifier_string,\
+    parse_many, to_roman, IdentifierParseError
+from asb_systematik.SystematikStatementCache import SystematikStatementCache
+from asb_systematik.SystematikInstrumentation import INSTRUMENTATION
+
+logger = logging.getLogger(__name__)
 
 NODE_TYPE_NORMAL = 0
 NODE_TYPE_VIRTUAL = 1
 
+TRAVERSAL_PREORDER = 0
+TRAVERSAL_POSTORDER = 1
+TRAVERSAL_LEVELORDER = 2
+
+PREORDER_GAP = 1 << 64
+
+IDENTIFIER_CACHE_SIZE = 1 << 17
+
+FETCH_BATCH_SIZE = 2000
+
+ID_QUERY_BATCH_SIZE = 1000
+
+NATURAL_PART_PATTERN = re.compile(r'(\d*)(.*)')
+
 ALEXANDRIA_METADATA = MetaData()
 
 SYSTEMATIK_TABLE = Table(
@@ -47,9 +79,25 @@ class DeletionForbiddenException(Exception):
 
     pass
 
+def _natural_part_key(part):
+    
+    if part.isdigit():
+        return (int(part), "")
+    matcher = NATURAL_PART_PATTERN.match(part)
+    if matcher.group(1) == "":
+        return (-1, part)
+    return (int(matcher.group(1)), matcher.group(2))
+
+@total_ordering
 class SystematikIdentifier:
+    """
+    Identifiers are immutable and interned, so the string, the hash and the
+    sort key are computed only once per identifier.
+    """
+    
+    __slots__ = ('punkt', 'roemisch', 'sub', '_string', '_hash', '_sort_key')
 
-    def __init__(self, punkt, roemisch=None, sub=None):
+    def __new__(cls, punkt, roemisch=None, sub=None):
         """
         Initialization is possible in two ways: Either with
         punkt, roemisch and sub like in the database.
@@ -57,47 +105,54 @@ class SystematikIdentifier:
         part, then this string will be split.
         """
         
-        self.roemisch = roemisch
-        if self.roemisch == 0:
-            self.roemisch = None
-        self.sub = sub
-        if self.sub == 0:
-            self.sub = None
-        if punkt is None:
-            self.punkt = None
-            return
-        
-        self.punkt = self._sanitize_punkt(punkt)
-        
-        matcher = re.match('.*[IVX-].*', self.punkt)
-        if matcher is not None:
-            self._reinit_from_full_string()
-            
-    def _sanitize_punkt(self, punkt):
+        if roemisch == 0:
+            roemisch = None
+        if sub == 0:
+            sub = None
+        if punkt is not None:
+            punkt, roemisch, sub = cls._parse_punkt(punkt, roemisch, sub)
+        return _intern_identifier(punkt, roemisch, sub)
+    
+    @classmethod
+    def _create(cls, punkt, roemisch, sub):
+        
+        identifier = object.__new__(cls)
+        object.__setattr__(identifier, 'punkt', punkt)
+        object.__setattr__(identifier, 'roemisch', roemisch)
+        object.__setattr__(identifier, 'sub', sub)
+        object.__setattr__(identifier, '_string', identifier._format())
+        object.__setattr__(identifier, '_hash', hash((punkt, roemisch, sub)))
+        object.__setattr__(identifier, '_sort_key', identifier._calculate_sort_key())
+        return identifier
+    
+    @classmethod
+    def _parse_punkt(cls, punkt, roemisch, sub):
         
-        if punkt is None:
-            return None
-        # whitespace
-        punkt = re.sub('\s+', '', punkt)
-        # trailing dots
-        punkt = re.sub('\.$', '', punkt)
+        parsed_punkt, parsed_roemisch, parsed_sub = parse_identifier_string(punkt)
+        if parsed_roemisch is None and parsed_sub is None:
+            return parsed_punkt, roemisch, sub
+        return parsed_punkt, parsed_roemisch, parsed_sub
+    
+    @staticmethod
+    def parse_many(strings):
+        """
+        Batch parsing of full identifier strings, see
+        SystematikIdentifierParser.parse_many().
+        """
         
-        return punkt
+        return parse_many(strings, _intern_identifier)
+    
+    def __setattr__(self, name, value):
         
-    def _reinit_from_full_string(self):
+        raise AttributeError("SystematikIdentifier is immutable")
+
+    def __delattr__(self, name):
         
-        punkte = self.punkt.split('.')
-        self.punkt = '.'.join(punkte[:-1])
+        raise AttributeError("SystematikIdentifier is immutable")
+    
+    def __reduce__(self):
         
-        subsplit = punkte[-1].split('-')
-        if len(subsplit) == 2:
-            self.sub = int(subsplit[1])
-        else:
-            self.sub = None
-        if self.is_roman(subsplit[0]):
-            self.roemisch = roman.fromRoman(subsplit[0])
-        else:
-            self.punkt = "%s.%s" % (self.punkt, subsplit[0])        
+        return (SystematikIdentifier, (self.punkt, self.roemisch, self.sub))
         
     def is_root(self):
         
@@ -122,7 +177,7 @@ class SystematikIdentifier:
         if len(punkte) == 1:
             return SystematikIdentifier(None)
         
-        return '.'.join(punkte[:-1])
+        return SystematikIdentifier('.'.join(punkte[:-1]))
     
     def _get_next_sibling(self):
         
@@ -164,6 +219,21 @@ class SystematikIdentifier:
                 SystematikIdentifier(self.punkt, sub=1),
                 ]
     
+    def _get_sort_key(self):
+        
+        return self._sort_key
+    
+    def _calculate_sort_key(self):
+        """
+        Natural ordering: points are compared numerically part by part,
+        a point comes before its roman and sub points.
+        """
+        
+        if self.punkt is None:
+            return ((), 0, 0)
+        return (tuple([_natural_part_key(part) for part in self.punkt.split('.')]),
+                self._db_roemisch(), self._db_sub())
+    
     def _db_roemisch(self):
         
         if self.roemisch is None:
@@ -176,32 +246,52 @@ class SystematikIdentifier:
             return 0
         return self.sub
 
-    def __str__(self):
+    def _format(self):
         
         if self.sub is not None:
             if self.roemisch is None:
                 return "%s-%d" % (self.punkt, self.sub)
             else:
-                return "%s.%s-%d" % (self.punkt, roman.toRoman(self.roemisch), self.sub)
+                return "%s.%s-%d" % (self.punkt, to_roman(self.roemisch), self.sub)
         if self.roemisch is not None:
-            return "%s.%s" % (self.punkt, roman.toRoman(self.roemisch))
+            return "%s.%s" % (self.punkt, to_roman(self.roemisch))
         if self.punkt is None:
             return "Rootnode"
         return self.punkt
+
+    def __str__(self):
+        
+        return self._string
     
     def __eq__(self, other):
         
+        if self is other:
+            return True
+        if not isinstance(other, SystematikIdentifier):
+            return NotImplemented
         return other.punkt == self.punkt and other.roemisch == self.roemisch and other.sub == self.sub
     
+    def __lt__(self, other):
+        
+        if not isinstance(other, SystematikIdentifier):
+            return NotImplemented
+        return self._sort_key < other._sort_key
+    
     def __hash__(self):
         
-        return hash("%s" % self)
+        return self._hash
         
     parent = property(_get_parent_identifier)
     next_sibling = property(_get_next_sibling)
     child_options = property(_get_child_options)
     db_roemisch = property(_db_roemisch)
     db_sub = property(_db_sub)
+    sort_key = property(_get_sort_key)
+        
+@lru_cache(maxsize=IDENTIFIER_CACHE_SIZE)
+def _intern_identifier(punkt, roemisch, sub):
+    
+    return SystematikIdentifier._create(punkt, roemisch, sub)
         
 class SystematikNode:
     """
@@ -308,60 +398,447 @@ class SystematikNode:
             return SystematikIdentifier(points[0])
         
 class SystematikTreeIterator:
+    """
+    Iterates over the nodes below (and including) the given root node.
+    All orders work with an explicit stack or queue, so each node
+    is touched exactly once.
+    """
     
-    def __init__(self, root_node):
-        self.stack = [root_node]
+    def __init__(self, root_node, order=TRAVERSAL_PREORDER):
+        
+        if order == TRAVERSAL_PREORDER:
+            self._generator = self._preorder(root_node)
+        elif order == TRAVERSAL_POSTORDER:
+            self._generator = self._postorder(root_node)
+        elif order == TRAVERSAL_LEVELORDER:
+            self._generator = self._levelorder(root_node)
+        else:
+            raise ValueError("Unknown traversal order %s" % order)
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        if not self.stack: raise StopIteration
-        node = self.stack.pop(0)
-        self.stack = node.children + self.stack
-        return node
+        return next(self._generator)
+    
+    def _preorder(self, root_node):
+        
+        stack = [root_node]
+        pop = stack.pop
+        extend = stack.extend
+        while stack:
+            node = pop()
+            yield node
+            if node.children:
+                extend(reversed(node.children))
+
+    def _postorder(self, root_node):
+        
+        # Entries are (node, index of the next child to visit)
+        stack = [(root_node, 0)]
+        while stack:
+            node, child_index = stack[-1]
+            if child_index < len(node.children):
+                stack[-1] = (node, child_index + 1)
+                stack.append((node.children[child_index], 0))
+            else:
+                stack.pop()
+                yield node
+
+    def _levelorder(self, root_node):
+        
+        queue = deque((root_node,))
+        popleft = queue.popleft
+        extend = queue.extend
+        while queue:
+            node = popleft()
+            yield node
+            extend(node.children)
+
+class SystematikTreeIndex:
+    """
+    Maps identifiers to nodes and keeps preorder entry and exit
+    numbers for every node. A node is below another node exactly if
+    its interval lies within the interval of the other node. The numbers
+    are spaced with large gaps, so nodes can be added and removed without
+    renumbering the rest of the tree.
+    """
+    
+    def __init__(self, rootnode):
+        
+        self.rootnode = rootnode
+        self.renumber()
+        
+    def renumber(self):
+        
+        self._nodes = {}
+        self._intervals = {}
+        self._entries = []
+        self._ordered_nodes = []
+        counter = 0
+        stack = [(self.rootnode, False)]
+        while stack:
+            node, visited = stack.pop()
+            counter += PREORDER_GAP
+            if visited:
+                entry = self._intervals[node.identifier][0]
+                self._intervals[node.identifier] = (entry, counter)
+                continue
+            self._nodes[node.identifier] = node
+            self._intervals[node.identifier] = (counter, None)
+            self._entries.append(counter)
+            self._ordered_nodes.append(node)
+            stack.append((node, True))
+            stack.extend([(child, False) for child in reversed(node.children)])
+            
+    def add(self, node):
+        """
+        Adds a node that has already been linked into the tree.
+        """
+        
+        if node.previous_sibling is not None:
+            lower = self._intervals[node.previous_sibling.identifier][1]
+        else:
+            lower = self._intervals[node.parent.identifier][0]
+        if node.next_sibling is not None:
+            upper = self._intervals[node.next_sibling.identifier][0]
+        else:
+            upper = self._intervals[node.parent.identifier][1]
+        if upper - lower < 3 or len(node.children) > 0:
+            # The gap is used up (or a whole subtree is added), so
+            # we have to start over.
+            self.renumber()
+            return
+        
+        entry = lower + (upper - lower) // 3
+        position = bisect_left(self._entries, entry)
+        self._entries.insert(position, entry)
+        self._ordered_nodes.insert(position, node)
+        self._nodes[node.identifier] = node
+        self._intervals[node.identifier] = (entry, lower + 2 * (upper - lower) // 3)
+
+    def remove(self, node):
+        """
+        Removes the node and everything below it from the index.
+        """
+        
+        start, end = self._get_range(node.identifier)
+        for removed in self._ordered_nodes[start:end]:
+            del(self._nodes[removed.identifier])
+            del(self._intervals[removed.identifier])
+        del(self._entries[start:end])
+        del(self._ordered_nodes[start:end])
+        
+    def get(self, identifier):
+        
+        return self._nodes.get(identifier)
+    
+    def is_descendant(self, identifier, ancestor_identifier):
+        
+        if identifier not in self._intervals or ancestor_identifier not in self._intervals:
+            return False
+        entry, exit = self._intervals[identifier]
+        ancestor_entry, ancestor_exit = self._intervals[ancestor_identifier]
+        return ancestor_entry < entry and exit < ancestor_exit
+    
+    def get_descendants(self, identifier):
+        """
+        Returns all nodes below the given identifier in preorder.
+        """
+        
+        if identifier not in self._intervals:
+            return []
+        start, end = self._get_range(identifier)
+        return self._ordered_nodes[start + 1:end]
+    
+    def _get_range(self, identifier):
+        
+        entry, exit = self._intervals[identifier]
+        return bisect_left(self._entries, entry), bisect_right(self._entries, exit)
+
+    def __contains__(self, identifier):
+        
+        return identifier in self._nodes
+    
+    def __len__(self):
+        
+        return len(self._nodes)
+
+class SystematikTreeBuildResult:
+    
+    def __init__(self, rootnode, orphans, duplicates):
+        
+        self.rootnode = rootnode
+        self.orphans = orphans
+        self.duplicates = duplicates
+        
+    def is_complete(self):
+        
+        return len(self.orphans) == 0 and len(self.duplicates) == 0
+
+class SystematikTreeBuilder:
+    """
+    Links the nodes into a tree. The nodes are sorted once by their
+    identifier, so every parent is linked before its children and the
+    children of a node arrive in their final order. Gaps in the numbering
+    do not matter, nodes without parent are returned as orphans.
+    """
+    
+    def build(self, rootnode: SystematikNode, nodes) -> SystematikTreeBuildResult:
+        
+        linked = {rootnode.identifier: rootnode}
+        orphans = []
+        duplicates = []
+        for node in sorted(nodes, key=lambda node: node.identifier.sort_key):
+            identifier = node.identifier
+            if identifier in linked:
+                duplicates.append(node)
+                continue
+            parent = linked.get(identifier.parent)
+            if parent is None:
+                orphans.append(node)
+                continue
+            node.parent = parent
+            if len(parent.children) > 0:
+                previous_sibling = parent.children[-1]
+                previous_sibling.next_sibling = node
+                node.previous_sibling = previous_sibling
+            parent.children.append(node)
+            linked[identifier] = node
+        return SystematikTreeBuildResult(rootnode, orphans, duplicates)
 
 class SystematikTree:
     
-    def __init__(self, node_hash):
+    def __init__(self, nodes):
+        """
+        nodes may be a dictionary identifier -> node (as it has
+        been used historically) or any iterable of nodes.
+        """
         
-        self.rootnode = SystematikNode(SystematikIdentifier(None), "Archiv Soziale Bewegungen")
-        node_hash = self._append_next_node(self.rootnode, node_hash)
-        try:
-            assert(len(node_hash) == 0)
-        except AssertionError:
-            for node in node_hash.values():
-                print(node)
+        if isinstance(nodes, dict):
+            nodes = nodes.values()
+        self.version = 0
+        self.content_version = 0
+        self._flat_preorder = None
+        self._flat_preorder_version = None
+        self._fingerprint = None
+        self._fingerprint_versions = None
+        rootnode = SystematikNode(SystematikIdentifier(None), "Archiv Soziale Bewegungen")
+        self.build_result = SystematikTreeBuilder().build(rootnode, nodes)
+        self.rootnode = self.build_result.rootnode
+        self.orphans = self.build_result.orphans
+        self.index = SystematikTreeIndex(self.rootnode)
                 
     def find_node(self, identifier):
         
-        for node in self.iterator:
-            if node.identifier == identifier:
-                return node
-        return None
+        return self.index.get(identifier)
+    
+    def is_descendant(self, identifier, ancestor_identifier):
+        
+        return self.index.is_descendant(identifier, ancestor_identifier)
+    
+    def get_descendants(self, identifier):
+        
+        return self.index.get_descendants(identifier)
+    
+    def add_node(self, node: SystematikNode):
+        """
+        Inserts the node at its sorted position below node.parent.
+        """
+        
+        parent = node.parent
+        sort_key = node.identifier.sort_key
+        position = len(parent.children)
+        while position > 0 and parent.children[position - 1].identifier.sort_key > sort_key:
+            position -= 1
+        if position > 0:
+            node.previous_sibling = parent.children[position - 1]
+            node.previous_sibling.next_sibling = node
+        if position < len(parent.children):
+            node.next_sibling = parent.children[position]
+            node.next_sibling.previous_sibling = node
+        parent.children.insert(position, node)
+        self.index.add(node)
+        self.mark_changed()
+        
+    def remove_node(self, node: SystematikNode):
+        
+        if node.previous_sibling is not None:
+            node.previous_sibling.next_sibling = node.next_sibling
+        if node.next_sibling is not None:
+            node.next_sibling.previous_sibling = node.previous_sibling
+        node.parent.children.remove(node)
+        self.index.remove(node)
+        node.previous_sibling = None
+        node.next_sibling = None
+        self.mark_changed()
                 
-    def _append_next_node(self, current_node: SystematikNode, node_hash):
-        
-        # There are missing siblings in the chain, so we look a bit ahead
-        for next_sibling_identifier in current_node.identifier.get_next_siblings():
-            if next_sibling_identifier in node_hash:
-                next_sibling = node_hash[next_sibling_identifier]
-                del(node_hash[next_sibling_identifier])
-                next_sibling.previous_sibling = current_node
-                current_node.next_sibling = next_sibling
-                next_sibling.parent = current_node.parent
-                next_sibling.parent.children.append(next_sibling)
-                node_hash = self._append_next_node(next_sibling, node_hash)
-                break
-        for child_identifier in current_node.identifier.child_options:
-            if child_identifier in node_hash:
-                child = node_hash[child_identifier]
-                del(node_hash[child_identifier])
-                current_node.children.append(child)
-                child.parent = current_node
-                node_hash = self._append_next_node(child, node_hash)
-                break
-        return node_hash
+    def apply_changes(self, changes):
+        """
+        Applies SystematikChange objects (see SystematikDao.fetch_changes_since).
+        A change describes the current state of a row, so applying it
+        twice does no harm. Returns the parents whose children have
+        changed and the nodes whose data has changed.
+        """
+        
+        parents = []
+        changed_nodes = []
+        for change in changes:
+            current = change.node
+            # An orphan of the row is replaced by its current state
+            self.orphans = [orphan for orphan in self.orphans if orphan.id != change.systematik_id]
+            self.build_result.duplicates = [duplicate for duplicate in self.build_result.duplicates
+                                            if duplicate.id != change.systematik_id]
+            for identifier in change.old_identifiers:
+                if current is not None and identifier == current.identifier:
+                    continue
+                node = self.find_node(identifier)
+                if node is not None and node is not self.rootnode and node.id == change.systematik_id:
+                    parents.append(node.parent)
+                    self.remove_node(node)
+                    # The rows below keep their identifiers, so they lose
+                    # their parent, like in a fresh load of the table
+                    self.orphans.extend(self._detach_descendants(node))
+            if current is None:
+                continue
+            node = self.find_node(current.identifier)
+            if node is None:
+                if self._link_node(current):
+                    parents.append(current.parent)
+                else:
+                    self.orphans.append(current)
+            elif node.id not in (None, change.systematik_id):
+                # Another row has the same identifier
+                self.build_result.duplicates.append(current)
+            elif self._copy_data(current, node):
+                self.mark_content_changed(node)
+                changed_nodes.append(node)
+        # Parents may have arrived after their children
+        for orphan in sorted(self.orphans, key=lambda orphan: orphan.identifier.sort_key):
+            if self._link_node(orphan):
+                self.orphans.remove(orphan)
+                parents.append(orphan.parent)
+        return parents, changed_nodes
+    
+    def _detach_descendants(self, node):
+        """
+        Unlinks all nodes below node (which is not in the tree
+        any more) and returns them.
+        """
+        
+        descendants = []
+        stack = list(node.children)
+        while stack:
+            descendant = stack.pop()
+            stack.extend(descendant.children)
+            descendant.parent = None
+            descendant.children = []
+            descendant.previous_sibling = None
+            descendant.next_sibling = None
+            descendants.append(descendant)
+        node.children = []
+        return descendants
+    
+    def _link_node(self, node):
+        
+        parent = self.find_node(node.identifier.parent)
+        if parent is None:
+            return False
+        node.parent = parent
+        self.add_node(node)
+        return True
+    
+    def _copy_data(self, source: SystematikNode, target: SystematikNode):
+        
+        changed = False
+        for attribute in ('id', 'beschreibung', 'kommentar', 'entfernt', 'startjahr',
+                          'endjahr', 'nodetype', 'digistate'):
+            value = getattr(source, attribute)
+            if getattr(target, attribute) != value:
+                setattr(target, attribute, value)
+                changed = True
+        return changed
+    
+    def mark_changed(self):
+        """
+        Must be called after the structure of the tree has been
+        changed, so cached traversals will be rebuilt.
+        """
+        
+        self.version += 1
+    
+    def mark_content_changed(self, node: SystematikNode):
+        """
+        Must be called after the data (not the position) of a
+        node has been changed.
+        """
+        
+        self.content_version += 1
+        
+    def traverse(self, order=TRAVERSAL_PREORDER, start_node=None):
+        
+        if start_node is None:
+            start_node = self.rootnode
+        return SystematikTreeIterator(start_node, order)
+    
+    def get_node_count(self):
+        """
+        Number of nodes read from the database, including
+        the ones that could not be linked into the tree.
+        """
+        
+        return len(self.index) - 1 + len(self.orphans) + len(self.build_result.duplicates)
+    
+    def get_fingerprint(self):
+        """
+        The fingerprint (see SystematikDao.fetch_fingerprint) the
+        systematik table has if it holds exactly the nodes of the tree.
+        Cached until the next call of mark_changed() or
+        mark_content_changed().
+        """
+        
+        versions = (self.version, self.content_version)
+        if self._fingerprint_versions != versions:
+            nodes = [entry[0] for entry in self.get_flat_preorder()[1:]]
+            nodes.extend(self.orphans)
+            nodes.extend(self.build_result.duplicates)
+            max_id = 0
+            checksum = 0
+            for node in nodes:
+                row = node_to_row(node)
+                max_id = max(max_id, row[0])
+                checksum += get_row_checksum(row)
+            self._fingerprint = (len(nodes), max_id, checksum)
+            self._fingerprint_versions = versions
+        return self._fingerprint
+    
+    def get_flat_preorder(self):
+        """
+        Returns a list of (node, depth, parent index) tuples in preorder. The
+        parent index points into the same list, it is -1 for the root node.
+        The list is cached until the next call of mark_changed().
+        """
+        
+        if self._flat_preorder_version != self.version:
+            self._flat_preorder = self._build_flat_preorder()
+            self._flat_preorder_version = self.version
+        return self._flat_preorder
+    
+    def _build_flat_preorder(self):
+        
+        flat = []
+        append = flat.append
+        stack = [(self.rootnode, 0, -1)]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            node, depth, parent_index = pop()
+            index = len(flat)
+            append((node, depth, parent_index))
+            children = node.children
+            for child_index in range(len(children) - 1, -1, -1):
+                push((children[child_index], depth + 1, index))
+        return flat
     
     def _get_iterator(self):
         
@@ -369,29 +846,330 @@ class SystematikTree:
     
     def __str__(self):
 
-        string = ""        
-        for node in self.iterator:
-            string += "%s: %s\n" % (node.identifier, node.beschreibung)
-        return string
+        return "".join(["%s: %s\n" % (node.identifier, node.beschreibung) for node in self.iterator])
     
     iterator = property(_get_iterator)
         
     
+class SystematikUsage:
+    """
+    Number of records that reference a Systematik point, per table.
+    """
+    
+    def __init__(self, broschueren=0, zeitschriften=0, dokumente=0, verweise=0):
+        
+        self.broschueren = broschueren
+        self.zeitschriften = zeitschriften
+        self.dokumente = dokumente
+        self.verweise = verweise
+        
+    def get_total(self):
+        
+        return self.broschueren + self.zeitschriften + self.dokumente + self.verweise
+    
+    def is_used(self):
+        
+        return self.get_total() > 0
+    
+    def __str__(self):
+        
+        parts = []
+        if self.broschueren > 0:
+            parts.append("%d Broschüren" % self.broschueren)
+        if self.zeitschriften > 0:
+            parts.append("%d Zeitschriften" % self.zeitschriften)
+        if self.dokumente > 0:
+            parts.append("%d Alexandria-Dokumente" % self.dokumente)
+        if self.verweise > 0:
+            parts.append("%d Alexandria-Verweise" % self.verweise)
+        if len(parts) == 0:
+            return "nicht benutzt"
+        return ", ".join(parts)
+    
+USAGE_SOURCE_BROSCHUERE, USAGE_SOURCE_ZEITSCHRIFT, USAGE_SOURCE_DOKUMENT, USAGE_SOURCE_VERWEIS = range(4)
+
+class SystematikChange:
+    """
+    All changes of one row of the systematik table since a watermark:
+    the identifiers the row had before (for updates and deletions)
+    and the current node or None if the row has been deleted.
+    """
+    
+    def __init__(self, systematik_id):
+        
+        self.systematik_id = systematik_id
+        self.old_identifiers = []
+        self.node = None
+        
+    def is_deleted(self):
+        
+        return self.node is None
+    
+CHANGE_TABLE = 'systematik_changes'
+
+# Change log of the usage tables: the key of every inserted, updated
+# or deleted row. sverweis has no key of its own, its rows are logged
+# (and copied) by document.
+USAGE_CHANGE_TABLE = 'usage_changes'
+USAGE_CHANGE_KEYS = (
+    ('broschueren', 'id'),
+    ('zeitschriften', 'id'),
+    ('dokument', 'hauptnr'),
+    ('sverweis', 'hauptnr'),
+)
+
+def normalize_reference_sql(column):
+    """
+    SQL expression for a reference to the Systematik without spaces
+    and trailing dots. All queries for usages compare and group by
+    this expression, so " 2.1" and "2.1." are a usage of 2.1 for all
+    of them. Other spellings the identifier parser accepts (like the
+    sub point 0 in "1.IV-0") are no usage, JoinChecker reports them
+    as malformed.
+    """
+    
+    return "rtrim(replace(%s, ' ', ''), '.')" % column
+
+def normalize_reference(reference):
+    """
+    The same as normalize_reference_sql() for a string.
+    """
+    
+    return reference.replace(' ', '').rstrip('.')
+
+# (table, column) of the references to the Systematik, the roman and
+# sub numbers of sverweis are in their own columns
+REFERENCE_COLUMNS = (
+    ('broschueren', 'systematik1'),
+    ('broschueren', 'systematik2'),
+    ('zeitschriften', 'systematik1'),
+    ('zeitschriften', 'systematik2'),
+    ('zeitschriften', 'systematik3'),
+    ('dokument', 'standort'),
+    ('sverweis', 'systematik'),
+)
+
+# Without these indexes every usage check reads the whole tables
+REFERENCE_INDEX_STATEMENTS = tuple([
+    "create index if not exists %s_%s_normalized on %s ((%s))" % (table, column, table, normalize_reference_sql(column))
+    for table, column in REFERENCE_COLUMNS])
+
+BROSCHUERE_REFERENCE = "(%s = :reference or %s = :reference)" % (
+    normalize_reference_sql('systematik1'), normalize_reference_sql('systematik2'))
+ZEITSCHRIFT_REFERENCE = "(%s = :reference or %s = :reference or %s = :reference)" % (
+    normalize_reference_sql('systematik1'), normalize_reference_sql('systematik2'),
+    normalize_reference_sql('systematik3'))
+DOKUMENT_REFERENCE = "%s = :reference" % normalize_reference_sql('standort')
+VERWEIS_REFERENCE = "(%s = :punkt and coalesce(roemisch, 0) = :roemisch and coalesce(sub, 0) = :sub)" % \
+    normalize_reference_sql('systematik')
+
+IS_USED_SQL = "select case when " +\
+    "exists (select 1 from broschueren where %s) " % BROSCHUERE_REFERENCE +\
+    "or exists (select 1 from zeitschriften where %s) " % ZEITSCHRIFT_REFERENCE +\
+    "or exists (select 1 from dokument where %s) " % DOKUMENT_REFERENCE +\
+    "or exists (select 1 from sverweis where %s) " % VERWEIS_REFERENCE +\
+    "then 1 else 0 end"
+
+# The limited selects are wrapped, because SQLite does not allow
+# a limit in the parts of a union
+FIRST_USAGE_SQL = "select source, titel, hauptnr from (" +\
+    "select * from (select %d as source, titel, cast(null as integer) as hauptnr from broschueren " % USAGE_SOURCE_BROSCHUERE +\
+    "where %s limit 1) b " % BROSCHUERE_REFERENCE +\
+    "union all select * from (select %d as source, titel, cast(null as integer) as hauptnr from zeitschriften " % USAGE_SOURCE_ZEITSCHRIFT +\
+    "where %s limit 1) z " % ZEITSCHRIFT_REFERENCE +\
+    "union all select * from (select %d as source, cast(null as varchar) as titel, hauptnr from dokument " % USAGE_SOURCE_DOKUMENT +\
+    "where %s limit 1) d " % DOKUMENT_REFERENCE +\
+    "union all select * from (select %d as source, cast(null as varchar) as titel, hauptnr from sverweis " % USAGE_SOURCE_VERWEIS +\
+    "where %s limit 1) v" % VERWEIS_REFERENCE +\
+    ") usages order by source limit 1"
+
+IS_USED_MANY_SQL = " union ".join(
+    ["select %d, %s, 0, 0 from %s where %s in :references" % (source, normalize_reference_sql(column), table,
+                                                              normalize_reference_sql(column))
+     for source, table, column in ((USAGE_SOURCE_BROSCHUERE, 'broschueren', 'systematik1'),
+                                   (USAGE_SOURCE_BROSCHUERE, 'broschueren', 'systematik2'),
+                                   (USAGE_SOURCE_ZEITSCHRIFT, 'zeitschriften', 'systematik1'),
+                                   (USAGE_SOURCE_ZEITSCHRIFT, 'zeitschriften', 'systematik2'),
+                                   (USAGE_SOURCE_ZEITSCHRIFT, 'zeitschriften', 'systematik3'),
+                                   (USAGE_SOURCE_DOKUMENT, 'dokument', 'standort'))] +
+    ["select %d, %s, coalesce(roemisch, 0), coalesce(sub, 0) from sverweis where %s in :punkte" % (
+        USAGE_SOURCE_VERWEIS, normalize_reference_sql('systematik'), normalize_reference_sql('systematik'))])
+
+UPDATABLE_COLUMNS = ('beschreibung', 'kommentar', 'entfernt', 'startjahr', 'nodetype', 'endjahr')
+
+def _create_identifier_condition():
+    
+    return and_(SYSTEMATIK_TABLE.c.punkt == bindparam('key_punkt'),
+                SYSTEMATIK_TABLE.c.roemisch == bindparam('key_roemisch'),
+                SYSTEMATIK_TABLE.c.sub == bindparam('key_sub'))
+
+STATEMENT_CACHE = SystematikStatementCache(os.environ.get('DB_PREPARED_STATEMENTS', '0') == '1')
+
+STATEMENT_CACHE.register('fetch_by_identifier',
+                         lambda: select([SYSTEMATIK_TABLE]).where(_create_identifier_condition()))
+STATEMENT_CACHE.register('fetch_by_id',
+                         lambda: select([SYSTEMATIK_TABLE]).where(SYSTEMATIK_TABLE.c.id == bindparam('key_id')))
+# Server side cursor, where the database supports it
+STATEMENT_CACHE.register('fetch_all',
+                         lambda: select([SYSTEMATIK_TABLE]).execution_options(stream_results=True),
+                         preparable=False)
+# The primary key of the insert is only known to a normally executed statement
+STATEMENT_CACHE.register('insert_node', lambda: insert(SYSTEMATIK_TABLE), preparable=False)
+STATEMENT_CACHE.register('update_node',
+                         lambda: update(SYSTEMATIK_TABLE).values(
+                             dict([(column, bindparam('new_%s' % column)) for column in UPDATABLE_COLUMNS])).\
+                             where(_create_identifier_condition()))
+STATEMENT_CACHE.register('delete_node',
+                         lambda: delete(SYSTEMATIK_TABLE).where(_create_identifier_condition()))
+# Cheap change detection without reading the rows: the weighted lengths
+# of the text columns and the numbers change with almost every edit
+STATEMENT_CACHE.register('fingerprint', lambda: text(
+    "select count(*), coalesce(max(id), 0), coalesce(sum((id % 997 + 1) * (" +
+    "length(punkt) + coalesce(roemisch, 0) * 3 + coalesce(sub, 0) * 5 + " +
+    "coalesce(length(beschreibung), 0) * 7 + coalesce(length(kommentar), 0) * 11 + " +
+    "coalesce(length(entfernt), 0) * 13 + coalesce(startjahr, 0) * 17 + " +
+    "coalesce(endjahr, 0) * 19 + coalesce(nodetype, 0) * 23 + coalesce(digistate, 0) * 29)), 0) " +
+    "from systematik"))
+STATEMENT_CACHE.register('watermark', lambda: text(
+    "select coalesce(max(id), 0) from %s" % CHANGE_TABLE))
+STATEMENT_CACHE.register('changes_since', lambda: text(
+    "select c.id, c.punkt, c.roemisch, c.sub, c.systematik_id, " +
+    "s.id, s.punkt, s.roemisch, s.sub, s.beschreibung, s.kommentar, s.entfernt, " +
+    "s.startjahr, s.endjahr, s.nodetype, s.digistate " +
+    "from %s c left outer join systematik s on s.id = c.systematik_id " % CHANGE_TABLE +
+    "where c.id > :watermark order by c.id"))
+STATEMENT_CACHE.register('usage_watermark', lambda: text(
+    "select coalesce(max(id), 0) from %s" % USAGE_CHANGE_TABLE))
+STATEMENT_CACHE.register('usage_log_start', lambda: text(
+    "select min(id) from %s" % USAGE_CHANGE_TABLE))
+STATEMENT_CACHE.register('usage_changes_since', lambda: text(
+    "select id, table_name, row_key from %s where id > :watermark order by id" % USAGE_CHANGE_TABLE))
+STATEMENT_CACHE.register('ids_for_punkte',
+                         lambda: select([SYSTEMATIK_TABLE.c.id, SYSTEMATIK_TABLE.c.punkt,
+                                         SYSTEMATIK_TABLE.c.roemisch, SYSTEMATIK_TABLE.c.sub]).\
+                             where(SYSTEMATIK_TABLE.c.punkt.in_(bindparam('punkte', expanding=True))),
+                         preparable=False)
+STATEMENT_CACHE.register('count_nodes', lambda: select([func.count()]).select_from(SYSTEMATIK_TABLE))
+STATEMENT_CACHE.register('exists',
+                         lambda: select([SYSTEMATIK_TABLE.c.id]).where(_create_identifier_condition()))
+STATEMENT_CACHE.register('is_used', lambda: text(IS_USED_SQL))
+STATEMENT_CACHE.register('first_usage', lambda: text(FIRST_USAGE_SQL))
+STATEMENT_CACHE.register('is_used_many',
+                         lambda: text(IS_USED_MANY_SQL).bindparams(bindparam('references', expanding=True),
+                                                                   bindparam('punkte', expanding=True)),
+                         preparable=False)
+STATEMENT_CACHE.register('usage_count_broschueren', lambda: text(
+    "select ref, count(distinct id) from (" +
+    "select id, %s as ref from broschueren " % normalize_reference_sql('systematik1') +
+    "union all select id, %s as ref from broschueren) refs " % normalize_reference_sql('systematik2') +
+    "group by ref"))
+STATEMENT_CACHE.register('usage_count_zeitschriften', lambda: text(
+    "select ref, count(distinct id) from (" +
+    "select id, %s as ref from zeitschriften " % normalize_reference_sql('systematik1') +
+    "union all select id, %s as ref from zeitschriften " % normalize_reference_sql('systematik2') +
+    "union all select id, %s as ref from zeitschriften) refs " % normalize_reference_sql('systematik3') +
+    "group by ref"))
+STATEMENT_CACHE.register('usage_count_dokumente', lambda: text(
+    "select ref, count(*) from (select %s as ref from dokument) refs group by ref" %
+    normalize_reference_sql('standort')))
+STATEMENT_CACHE.register('usage_count_verweise', lambda: text(
+    "select ref, roemisch, sub, count(*) from (" +
+    "select %s as ref, coalesce(roemisch, 0) as roemisch, coalesce(sub, 0) as sub from sverweis) refs " %
+    normalize_reference_sql('systematik') +
+    "group by ref, roemisch, sub"))
+
+def create_nodes(rows):
+    """
+    Generator for nodes from rows in the column
+    order of SYSTEMATIK_TABLE.
+    """
+    
+    for id, punkt, roemisch, sub, beschreibung, kommentar, entfernt,\
+            startjahr, endjahr, nodetype, digistate in rows:
+        yield SystematikNode(SystematikIdentifier(punkt, roemisch, sub), beschreibung,
+                             kommentar, entfernt, startjahr, endjahr,
+                             nodetype, digistate, id)
+
+def node_to_row(node: SystematikNode):
+    
+    identifier = node.identifier
+    return (node.id, identifier.punkt, identifier.db_roemisch, identifier.db_sub,
+            node.beschreibung, node.kommentar, node.entfernt, node.startjahr,
+            node.endjahr, node.nodetype, node.digistate)
+
+def get_row_checksum(row):
+    """
+    Part of a row in the checksum of SystematikDao.fetch_fingerprint(),
+    calculated like the fingerprint statement does.
+    """
+
+    systematik_id, punkt, roemisch, sub, beschreibung, kommentar, entfernt, startjahr, endjahr, nodetype, digistate = row
+    return (systematik_id % 997 + 1) * (
+        len(punkt) + (roemisch or 0) * 3 + (sub or 0) * 5 +
+        len(beschreibung or "") * 7 + len(kommentar or "") * 11 +
+        len(entfernt or "") * 13 + (startjahr or 0) * 17 +
+        (endjahr or 0) * 19 + (nodetype or 0) * 23 + (digistate or 0) * 29)
+
+def in_unit_of_work(method):
+    """
+    Runs a dao method in the unit of work of the current
+    thread or, if there is none, in a new one.
+    """
+    
+    @wraps(method)
+    def run_in_unit_of_work(self, *args, **kwargs):
+        with self.unit_of_work():
+            return method(self, *args, **kwargs)
+    return run_in_unit_of_work
+
 @singleton        
 class SystematikDao:
+    """
+    The dao does not keep a connection. Every unit of work checks
+    out a connection from the pool of the engine and runs in one
+    transaction. A unit of work belongs to a thread, so the dao may
+    be used from several threads at the same time.
+    """
 
     @inject
-    def __init__(self, connection: Connection):
+    def __init__(self, engine: Engine):
 
-        self.connection = connection
+        self.engine = engine
+        self.statement_cache = STATEMENT_CACHE
+        self._local = threading.local()
+        
+    @contextmanager
+    def unit_of_work(self):
+        """
+        All dao calls inside the with block share the connection and
+        the transaction. Nested units of work join the outer one.
+        """
+        
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            yield connection
+            return
+        with self.engine.begin() as connection:
+            self._local.connection = connection
+            try:
+                yield connection
+            finally:
+                self._local.connection = None
+                
+    def _get_connection(self):
+        
+        return getattr(self._local, 'connection', None)
     
+    connection = property(_get_connection)
+        
+    def _execute(self, name, parameters=None):
+        
+        return self.statement_cache.execute(self.connection, name, parameters)
+    
+    @in_unit_of_work
     def fetch_by_identifier_object(self, identifier: SystematikIdentifier):
         
-        stmt = select([SYSTEMATIK_TABLE]).where(
-            and_(SYSTEMATIK_TABLE.c.punkt == identifier.punkt,
-                 SYSTEMATIK_TABLE.c.roemisch == identifier.db_roemisch,
-                 SYSTEMATIK_TABLE.c.sub == identifier.db_sub))
-        record = self.connection.execute(stmt).fetchone()
+        record = self._execute('fetch_by_identifier', self._get_key_parameters(identifier)).fetchone()
         
         try:
             syst = self._map_to_node(record)
@@ -399,10 +1177,10 @@ class SystematikDao:
             raise NoDataException
         return syst
     
+    @in_unit_of_work
     def fetch_by_id(self, id: Integer) -> SystematikNode:
         
-        stmt = select([SYSTEMATIK_TABLE]).where(SYSTEMATIK_TABLE.c.id == id)
-        record = self.connection.execute(stmt).fetchone()
+        record = self._execute('fetch_by_id', {'key_id': id}).fetchone()
         
         try:
             syst = self._map_to_node(record)
@@ -410,179 +1188,466 @@ class SystematikDao:
             raise NoDataException
         return syst
 
+    @in_unit_of_work
     def fetch_tree(self, tree_implementation):
         
-        result = self.connection.execute(select([SYSTEMATIK_TABLE]))
-        nodes = {}
-        for row in result.fetchall():
-            node = self._map_to_node(row)
-            nodes[node.identifier] = node
-        return tree_implementation(nodes)
+        return tree_implementation(self.iterate_nodes())
+    
+    def iterate_nodes(self):
+        """
+        Generator for all nodes of the table. The rows are streamed
+        in batches of FETCH_BATCH_SIZE and unpacked by position
+        (in the column order of SYSTEMATIK_TABLE).
+        """
+        
+        with self.unit_of_work():
+            result = self._execute('fetch_all')
+            try:
+                while True:
+                    rows = result.fetchmany(FETCH_BATCH_SIZE)
+                    if len(rows) == 0:
+                        break
+                    yield from create_nodes(rows)
+            finally:
+                result.close()
 
     def _map_to_node(self, record):
 
-        identifier = SystematikIdentifier(record[SYSTEMATIK_TABLE.c.punkt],
-                                          record[SYSTEMATIK_TABLE.c.roemisch],
-                                          record[SYSTEMATIK_TABLE.c.sub])
+        identifier = SystematikIdentifier(record['punkt'],
+                                          record['roemisch'],
+                                          record['sub'])
         return SystematikNode(identifier=identifier,
-                            beschreibung=record[SYSTEMATIK_TABLE.c.beschreibung], 
-                            kommentar=record[SYSTEMATIK_TABLE.c.kommentar],
-                            entfernt=record[SYSTEMATIK_TABLE.c.entfernt],
-                            startjahr=record[SYSTEMATIK_TABLE.c.startjahr],
-                            endjahr=record[SYSTEMATIK_TABLE.c.endjahr],
-                            nodetype=record[SYSTEMATIK_TABLE.c.nodetype],
-                            digistate=record[SYSTEMATIK_TABLE.c.digistate],
-                            id=record[SYSTEMATIK_TABLE.c.id]
+                            beschreibung=record['beschreibung'], 
+                            kommentar=record['kommentar'],
+                            entfernt=record['entfernt'],
+                            startjahr=record['startjahr'],
+                            endjahr=record['endjahr'],
+                            nodetype=record['nodetype'],
+                            digistate=record['digistate'],
+                            id=record['id']
                             )
     
+    def _get_key_parameters(self, identifier):
+        
+        return {'key_punkt': identifier.punkt,
+                'key_roemisch': identifier.db_roemisch,
+                'key_sub': identifier.db_sub}
+    
+    def _get_insert_parameters(self, node):
+        
+        return {'punkt': node.identifier.punkt,
+                'roemisch': node.identifier.db_roemisch,
+                'sub': node.identifier.db_sub,
+                'beschreibung': node.beschreibung,
+                'kommentar': node.kommentar,
+                'entfernt': node.entfernt,
+                'startjahr': node.startjahr,
+                'endjahr': node.endjahr,
+                'nodetype': node.nodetype,
+                'digistate': node.digistate}
+    
+    def _get_update_parameters(self, node):
+        
+        parameters = self._get_key_parameters(node.identifier)
+        for column in UPDATABLE_COLUMNS:
+            parameters['new_%s' % column] = getattr(node, column)
+        return parameters
+    
+    @in_unit_of_work
     def insert_node(self, node):
         
-        stmt = insert(SYSTEMATIK_TABLE).\
-            values(punkt=node.identifier.punkt, roemisch=node.identifier.db_roemisch,
-                   sub=node.identifier.db_sub, beschreibung=node.beschreibung,
-                   kommentar=node.kommentar,
-                   entfernt=node.entfernt,
-                   startjahr=node.startjahr,
-                   endjahr=node.endjahr,
-                   nodetype=node.nodetype,
-                   digistate=node.digistate
-                   )
-        self.connection.execute(stmt)
+        result = self._execute('insert_node', self._get_insert_parameters(node))
+        node.id = result.inserted_primary_key[0]
+        
+    @in_unit_of_work
+    def insert_nodes(self, nodes):
+        """
+        Inserts all nodes with one executemany statement in one
+        transaction. The generated ids are read afterwards.
+        """
+        
+        nodes = list(nodes)
+        if len(nodes) == 0:
+            return
+        self._execute('insert_node', [self._get_insert_parameters(node) for node in nodes])
+        ids = self.fetch_ids([node.identifier for node in nodes])
+        for node in nodes:
+            node.id = ids.get(node.identifier)
+            
+    @in_unit_of_work
+    def update_nodes(self, nodes):
+        """
+        Updates all nodes with one executemany statement
+        in one transaction.
+        """
         
+        parameters = [self._get_update_parameters(node) for node in nodes]
+        if len(parameters) > 0:
+            self._execute('update_node', parameters)
+            
+    @in_unit_of_work
+    def upsert_nodes(self, nodes):
+        """
+        Updates the nodes that already exist and inserts the others,
+        all in one transaction. Returns the lists of inserted and
+        updated nodes.
+        """
+        
+        nodes = list(nodes)
+        existing = self.fetch_ids([node.identifier for node in nodes])
+        inserted = [node for node in nodes if node.identifier not in existing]
+        updated = [node for node in nodes if node.identifier in existing]
+        for node in updated:
+            node.id = existing[node.identifier]
+        self.update_nodes(updated)
+        self.insert_nodes(inserted)
+        return inserted, updated
+    
+    @in_unit_of_work
+    def fetch_ids(self, identifiers):
+        """
+        Returns a dictionary identifier -> id for the given
+        identifiers that exist in the database.
+        """
+        
+        identifiers = set(identifiers)
+        punkte = list(set([identifier.punkt for identifier in identifiers]))
+        ids = {}
+        for start in range(0, len(punkte), ID_QUERY_BATCH_SIZE):
+            result = self._execute('ids_for_punkte', {'punkte': punkte[start:start + ID_QUERY_BATCH_SIZE]})
+            for id, punkt, roemisch, sub in result:
+                identifier = SystematikIdentifier(punkt, roemisch, sub)
+                if identifier in identifiers:
+                    ids[identifier] = id
+        return ids
+        
+    @in_unit_of_work
     def delete_node(self, node):
         
         if node.next_sibling is not None:
-            raise DeletionForbiddenException()
+            raise DeletionForbiddenException("Es sind noch Einträge nach diesem Eintrag vorhanden")
         
         if len(node.children) > 0:
-            raise DeletionForbiddenException()
+            raise DeletionForbiddenException("Der Eintrag hat noch Untereinträge")
         
         if self.is_used(node.identifier):
-            raise DeletionForbiddenException()
+            raise DeletionForbiddenException("Der Eintrag wird benutzt")
         
-        stmt = delete(SYSTEMATIK_TABLE).where(SYSTEMATIK_TABLE.c.punkt == node.identifier.punkt,
-                                              SYSTEMATIK_TABLE.c.roemisch == node.identifier.db_roemisch,
-                                              SYSTEMATIK_TABLE.c.sub == node.identifier.db_sub)
-        self.connection.execute(stmt)
+        self._execute('delete_node', self._get_key_parameters(node.identifier))
         
+    @in_unit_of_work
     def update_node(self, node):
         
-        roemisch = node.identifier.roemisch
-        if roemisch is None:
-            roemisch = 0
-        sub = node.identifier.sub
-        if sub is None:
-            sub = 0
-        stmt = update(SYSTEMATIK_TABLE).\
-            values(beschreibung=node.beschreibung,
-                   kommentar=node.kommentar,
-                   entfernt=node.entfernt,
-                   startjahr=node.startjahr,
-                   nodetype=node.nodetype,
-                   endjahr=node.endjahr).\
-            where(and_(SYSTEMATIK_TABLE.c.punkt == node.identifier.punkt,
-                       SYSTEMATIK_TABLE.c.roemisch == roemisch,
-                       SYSTEMATIK_TABLE.c.sub == sub))
-        self.connection.execute(stmt)
+        self._execute('update_node', self._get_update_parameters(node))
     
-    def exists(self, identifier):
-
-        stmt = text("select 1 from systematik where punkt = '%s' and roemisch = %d and sub = %d" % 
-                    (identifier.punkt, identifier.db_roemisch, identifier.db_sub))
-        result = self.connection.execute(stmt)
-        for row in result.fetchall():
-            return True
+    @in_unit_of_work
+    def fetch_fingerprint(self):
+        """
+        Returns (row count, max id, checksum) of the systematik table.
+        """
         
-        return False
+        count, max_id, checksum = self._execute('fingerprint').first()
+        return (count, max_id, int(checksum))
+    
+    @in_unit_of_work
+    def has_change_tracking(self):
+        """
+        True if the change log table (see SystematikChangeTracking)
+        exists in the database.
+        """
+        
+        return inspect(self.connection).has_table(CHANGE_TABLE)
+    
+    @in_unit_of_work
+    def fetch_watermark(self):
+        """
+        The id of the last entry in the change log.
+        """
+        
+        return self._execute('watermark').scalar()
+    
+    @in_unit_of_work
+    def fetch_changes_since(self, watermark):
+        """
+        Returns the new watermark and one SystematikChange for every
+        row that has been inserted, updated or deleted after the given
+        watermark. Rows that have been changed several times appear
+        only once, with their current state.
+        """
+        
+        changes = {}
+        malformed = set()
+        result = self._execute('changes_since', {'watermark': watermark})
+        for row in result:
+            watermark = row[0]
+            change = changes.get(row[4])
+            if change is None:
+                change = SystematikChange(row[4])
+                changes[row[4]] = change
+            if row[1] is not None:
+                try:
+                    change.old_identifiers.append(SystematikIdentifier(row[1], row[2], row[3]))
+                except IdentifierParseError:
+                    # A malformed point has never been in the tree
+                    pass
+            if row[5] is not None and change.node is None and row[4] not in malformed:
+                try:
+                    change.node = next(create_nodes((row[5:],)))
+                except IdentifierParseError as e:
+                    # Handled like a deletion, the row can't be in the tree
+                    logger.warning("Fehlerhafter Systematikpunkt mit id %d: %s", row[4], e)
+                    malformed.add(row[4])
+        return watermark, list(changes.values())
+    
+    @in_unit_of_work
+    def has_usage_change_tracking(self):
+        """
+        True if the change log of the usage tables (see
+        SystematikChangeTracking) exists in the database.
+        """
+        
+        return inspect(self.connection).has_table(USAGE_CHANGE_TABLE)
+    
+    @in_unit_of_work
+    def fetch_usage_watermark(self):
+        
+        return self._execute('usage_watermark').scalar()
+    
+    @in_unit_of_work
+    def fetch_usage_log_start(self):
+        """
+        The id of the first entry in the change log of the usage
+        tables, None if it is empty. Entries before it have been
+        removed by purge_changes().
+        """
+        
+        return self._execute('usage_log_start').scalar()
+    
+    @in_unit_of_work
+    def fetch_usage_changes_since(self, watermark):
+        """
+        Returns the new watermark and a dictionary table -> set of
+        keys (see USAGE_CHANGE_KEYS) of the rows in the usage tables
+        that have been changed after the given watermark.
+        """
+        
+        changed_keys = {}
+        for watermark, table, key in self._execute('usage_changes_since', {'watermark': watermark}):
+            changed_keys.setdefault(table, set()).add(key)
+        return watermark, changed_keys
     
+    @in_unit_of_work
+    def count_nodes(self):
+        
+        return self._execute('count_nodes').scalar()
+    
+    @in_unit_of_work
+    def exists(self, identifier):
+
+        return self._execute('exists', self._get_key_parameters(identifier)).first() is not None
+
+    @in_unit_of_work
     def is_used(self, identifier):
         """Systematik identifiers are used in a lot of places, without constraint. This
         checks all of these places, if the given identifier is used."""
         
-        stmt = text("select 1 where exists (select 1 from broschueren where systematik1 = " + 
-                    "'%s' or systematik2 = '%s')" % (identifier, identifier))
-        result = self.connection.execute(stmt)
-        for row in result.fetchall():
-            return True
-    
-        stmt = text("select 1 where exists (select 1 from zeitschriften where systematik1 = '%s' " % identifier +
-                    "or systematik2 = '%s' or systematik3 = '%s')" % (identifier, identifier))
-        result = self.connection.execute(stmt)
-        for row in result.fetchall():
-            return True
+        return self._execute('is_used', self._get_usage_parameters(identifier)).scalar() == 1
+
+    @in_unit_of_work
+    def is_used_many(self, identifiers):
+        """
+        Returns the set of the given identifiers that are used
+        somewhere. The whole list is checked with one query.
+        """
         
-        stmt = text("select 1 where exists (select 1 from dokument where standort = '%s')" % identifier)
-        result = self.connection.execute(stmt)
-        for row in result.fetchall():
-            return True
+        identifiers = set(identifiers)
+        if len(identifiers) == 0:
+            return set()
+        references = dict([("%s" % identifier, identifier) for identifier in identifiers])
+        punkte = set([identifier.punkt for identifier in identifiers])
+        
+        used = set()
+        result = self._execute('is_used_many', {'references': list(references.keys()),
+                                                'punkte': list(punkte)})
+        for source, reference, roemisch, sub in result:
+            if source == USAGE_SOURCE_VERWEIS:
+                try:
+                    identifier = SystematikIdentifier(reference, roemisch, sub)
+                except IdentifierParseError:
+                    continue
+                if identifier in identifiers:
+                    used.add(identifier)
+            else:
+                used.add(references[reference])
+        return used
 
-        stmt = text("select 1 where exists (select 1 from sverweis where systematik = '%s' and roemisch = %d and sub = %d)" % 
-                    (identifier.punkt, identifier.db_roemisch, identifier.db_sub))
-        result = self.connection.execute(stmt)
-        for row in result.fetchall():
-            return True
+    def _get_usage_parameters(self, identifier):
+        
+        return {'reference': "%s" % identifier,
+                'punkt': identifier.punkt,
+                'roemisch': identifier.db_roemisch,
+                'sub': identifier.db_sub}
 
-        return False
+    @in_unit_of_work
+    def fetch_usage_map(self):
+        """
+        Counts the usages of all Systematik points with one aggregate
+        query per table. The references are normalized like in all
+        usage queries (see normalize_reference_sql), so the map agrees
+        with is_used() and find_first_usage(). Other references are
+        ignored (see JoinChecker).
+        """
+        
+        usage_map = {}
+        
+        def add_count(identifier, attribute, count):
+            usage = usage_map.get(identifier)
+            if usage is None:
+                usage = SystematikUsage()
+                usage_map[identifier] = usage
+            setattr(usage, attribute, getattr(usage, attribute) + count)
+        
+        def add_counts(rows, attribute):
+            rows = [row for row in rows if row[0] is not None and row[0] != '']
+            parse_results = SystematikIdentifier.parse_many([row[0] for row in rows])
+            for row, parse_result in zip(rows, parse_results):
+                # Only the exact spelling is a usage for the queries
+                if parse_result.is_valid() and "%s" % parse_result.identifier == row[0]:
+                    add_count(parse_result.identifier, attribute, row[1])
+        
+        add_counts(self._execute('usage_count_broschueren'), 'broschueren')
+        add_counts(self._execute('usage_count_zeitschriften'), 'zeitschriften')
+        add_counts(self._execute('usage_count_dokumente'), 'dokumente')
+        
+        result = self._execute('usage_count_verweise')
+        for punkt, roemisch, sub, count in result:
+            if punkt is None:
+                continue
+            try:
+                identifier = SystematikIdentifier(punkt, roemisch, sub)
+            except IdentifierParseError:
+                continue
+            if identifier.punkt == punkt:
+                add_count(identifier, 'verweise', count)
+            
+        return usage_map
 
     def get_first_usage(self, identifier):
         
-        brosch_titel = self.get_first_brosch_usage(identifier)
-        if brosch_titel != None:
-            return "Broschüre \"%s\"" % brosch_titel
-        zeitsch_titel = self.get_first_zeitsch_usage(identifier)
-        if zeitsch_titel != None:
-            return "Zeitschrift \"%s\"" % zeitsch_titel
-        alex_id = self.get_first_alexandria_usage(identifier)
-        if alex_id != None:
-            return "Alexandria-Dokument Nr. %d" % alex_id
-        
-        raise Exception("Keine Nutzung für Systematikpunkt %s gefunden!" % identifier)
+        usage = self.find_first_usage(identifier)
+        if usage is None:
+            raise Exception("Keine Nutzung für Systematikpunkt %s gefunden!" % identifier)
+        return usage
 
-    def get_first_zeitsch_usage(self, identifier):
+    @in_unit_of_work
+    def find_first_usage(self, identifier):
+        """
+        Returns the description of the first usage or None if the
+        identifier is not used. All places are searched with a single
+        statement, the earlier sources win.
+        """
+        
+        row = self._execute('first_usage', self._get_usage_parameters(identifier)).first()
+        if row is None:
+            return None
+        if row['source'] == USAGE_SOURCE_BROSCHUERE:
+            return "Broschüre \"%s\"" % row['titel']
+        if row['source'] == USAGE_SOURCE_ZEITSCHRIFT:
+            return "Zeitschrift \"%s\"" % row['titel']
+        return "Alexandria-Dokument Nr. %d" % row['hauptnr']
+    
+    def fetch_root_node(self, node: SystematikNode):
+        
+        root_node_identifier = node.get_main_point_identifier()
+        return self.fetch_by_identifier_object(root_node_identifier)
 
-        stmt = text("select titel from zeitschriften where systematik1 = '%s' " % identifier +
-                    "or systematik2 = '%s' or systematik3 = '%s' limit 1" % (identifier, identifier))
-        result = self.connection.execute(stmt)
-        for row in result.fetchall():
-            return row['titel']
-        return None
+INSTRUMENTATION.instrument_class(SystematikDao, 'dao')
+INSTRUMENTATION.add_statistics_provider('statement_cache', STATEMENT_CACHE.get_statistics)
 
-    def get_first_brosch_usage(self, identifier):
+class SystematikUsageCache:
+    """
+    Keeps the usage map of the dao and reads it again when it
+    is older than max_age seconds.
+    """
+    
+    def __init__(self, dao: SystematikDao, max_age=600):
+        
+        self.dao = dao
+        self.max_age = max_age
+        self._usage_map = None
+        self._timestamp = None
+        
+    def get_usage_map(self):
+        
+        if self._usage_map is None or time.monotonic() - self._timestamp > self.max_age:
+            self.refresh()
+        return self._usage_map
+    
+    def refresh(self):
+        
+        self._usage_map = self.dao.fetch_usage_map()
+        self._timestamp = time.monotonic()
+        
+    def get_usage(self, identifier):
+        
+        usage = self.get_usage_map().get(identifier)
+        if usage is None:
+            return SystematikUsage()
+        return usage
 
-        stmt = text("select titel from broschueren where systematik1 = " + 
-                    "'%s' or systematik2 = '%s' limit 1" % (identifier, identifier))
-        result = self.connection.execute(stmt)
-        for row in result.fetchall():
-            return row['titel']
-        return None
+class JoinCheckResult:
+    """
+    Result of the check of one reference column. malformed is a list
+    of (value, row count, error), dangling a list of (value, row count)
+    for references to points that do not exist.
+    """
     
-    def get_first_alexandria_usage(self, identifier):
+    def __init__(self, table, column):
+        
+        self.table = table
+        self.column = column
+        self.distinct_values = 0
+        self.rows = 0
+        self.malformed = []
+        self.dangling = []
         
-        stmt = text("select hauptnr from dokument where standort = '%s' limit 1" % identifier)
-        result = self.connection.execute(stmt)
-        for row in result.fetchall():
-            return row['hauptnr']
+    def get_malformed_rows(self):
         
-        stmt = text("select hauptnr from sverweis where systematik = '%s' and roemisch = %d and sub = %d limit 1" % 
-                    (identifier.punkt, identifier.db_roemisch, identifier.db_sub))
-        result = self.connection.execute(stmt)
-        for row in result.fetchall():
-            return row['hauptnr']
+        return sum([count for value, count, error in self.malformed])
+
+    def get_dangling_rows(self):
         
-        return None
+        return sum([count for value, count in self.dangling])
     
-    def fetch_root_node(self, node: SystematikNode):
+    def is_ok(self):
         
-        root_node_identifier = node.get_main_point_identifier()
-        return self.fetch_by_identifier_object(root_node_identifier)
+        return len(self.malformed) == 0 and len(self.dangling) == 0
+        
+    def __str__(self):
+        
+        lines = ["%s.%s: %d Werte in %d Zeilen, %d fehlerhaft (%d Zeilen), %d ohne Systematikpunkt (%d Zeilen)" %
+                 (self.table, self.column, self.distinct_values, self.rows,
+                  len(self.malformed), self.get_malformed_rows(),
+                  len(self.dangling), self.get_dangling_rows())]
+        for value, count, error in self.malformed:
+            lines.append("    Fehlerhaft: %r (%d Zeilen): %s" % (value, count, error))
+        for value, count in self.dangling:
+            lines.append("    Existiert nicht: %s (%d Zeilen)" % (value, count))
+        return "\n".join(lines)
 
-@singleton    
+@singleton
 class JoinChecker:
+    """
+    Checks the references to the Systematik in the other tables. Every
+    distinct value of a column is read once (with the number of rows
+    using it), parsed once and looked up in the set of existing points.
+    The columns are checked in parallel, each on its own connection.
+    """
     
     @inject
-    def __init__(self, connection: Connection):
+    def __init__(self, engine: Engine):
 
-        self.connection = connection
+        self.engine = engine
         
         self.columns = [
             {"id": "hauptnr", "table": "dokument", "column": "standort"},
@@ -593,31 +1658,128 @@ class JoinChecker:
             {"id": "id", "table": "broschueren", "column": "systematik2"}
         ]
         
+    def fetch_identifiers(self):
+        
+        identifiers = set()
+        with self.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(
+                select([SYSTEMATIK_TABLE.c.punkt, SYSTEMATIK_TABLE.c.roemisch, SYSTEMATIK_TABLE.c.sub]))
+            while True:
+                rows = result.fetchmany(FETCH_BATCH_SIZE)
+                if len(rows) == 0:
+                    break
+                for punkt, roemisch, sub in rows:
+                    try:
+                        identifiers.add(SystematikIdentifier(punkt, roemisch, sub))
+                    except IdentifierParseError:
+                        # A broken point can't be referenced correctly
+                        pass
+        return identifiers
+        
+    def check_column(self, column, identifiers, parse_results=None):
+        """
+        Checks one column. parse_results may be shared between
+        the columns, so a value is parsed only once.
+        """
+        
+        if parse_results is None:
+            parse_results = {}
+        check_result = JoinCheckResult(column['table'], column['column'])
+        stmt = text("select %s, count(*) from %s where %s is not null and %s <> '' group by %s" %
+                    (column['column'], column['table'], column['column'], column['column'], column['column']))
+        with self.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(stmt)
+            while True:
+                rows = result.fetchmany(FETCH_BATCH_SIZE)
+                if len(rows) == 0:
+                    break
+                new_values = [value for value, count in rows if value not in parse_results]
+                for value, parse_result in zip(new_values, SystematikIdentifier.parse_many(new_values)):
+                    parse_results[value] = parse_result
+                for value, count in rows:
+                    check_result.distinct_values += 1
+                    check_result.rows += count
+                    parse_result = parse_results[value]
+                    if not parse_result.is_valid():
+                        check_result.malformed.append((value, count, parse_result.error))
+                    elif "%s" % parse_result.identifier != normalize_reference(value):
+                        # The usage checks would not find this reference
+                        check_result.malformed.append((value, count, "Schreibweise von %s" % parse_result.identifier))
+                    elif parse_result.identifier not in identifiers:
+                        check_result.dangling.append((value, count))
+        return check_result
+        
+    def check(self, max_workers=None):
+        """
+        Returns a JoinCheckResult per column.
+        """
+        
+        identifiers = self.fetch_identifiers()
+        parse_results = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.check_column, column, identifiers, parse_results)
+                       for column in self.columns]
+            return [future.result() for future in futures]
+        
     def run_check(self):
         
-        for column in self.columns:
-            stmt = text("select %s as id, %s as systematik from %s" % (column['id'], column['column'], column['table']))
-            result = self.connection.execute(stmt)
-            for row in result.fetchall():
-                punkt = row['systematik']
-                if punkt is None or punkt == '':
-                    continue
-                try:
-                    identifier = SystematikIdentifier(punkt)
-                except Exception:
-                    print("Fehler in tabelle %s bei id %s: %s" % (column['table'], row['id'], row['systematik']))
+        check_results = self.check()
+        for check_result in check_results:
+            print(check_result)
+        return check_results
         
+def get_engine_options(db_url):
+    """
+    Pool configuration from the environment:
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_PRE_PING (0/1),
+    DB_POOL_RECYCLE (seconds) and DB_STATEMENT_TIMEOUT
+    (milliseconds, PostgreSQL only).
+    """
+    
+    url = make_url(db_url)
+    options = {'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',
+               'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '1800'))}
+    # SQLite files do not use a queue pool
+    if url.get_backend_name() != 'sqlite':
+        options['pool_size'] = int(os.environ.get('DB_POOL_SIZE', '5'))
+        options['max_overflow'] = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT', '0'))
+    if statement_timeout > 0 and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {'options': '-c statement_timeout=%d' % statement_timeout}
+    return options
+
 class AlexandriaDbModule(Module):
 
     @singleton
     @provider
     def provide_engine(self) -> Engine:
-        return create_engine(os.environ['DB_URL'])
+        db_url = os.environ['DB_URL']
+        return create_engine(db_url, **get_engine_options(db_url))
 
     @singleton
+    @provider
+    @inject
+    def provide_dao(self, engine: Engine) -> SystematikDao:
+        """
+        With DB_REPLICA (path of a SQLite file) the dao works on a
+        local read-only copy of the database, see SystematikReplica.
+        With DB_REPLICA_WRITES=primary writes go to the database of
+        DB_URL, otherwise they are refused.
+        """
+        replica_path = os.environ.get('DB_REPLICA')
+        if replica_path is None:
+            return SystematikDao(engine)
+        # Imported here, the replica module depends on this one
+        from asb_systematik.SystematikReplica import create_replica_dao
+        return create_replica_dao(engine, replica_path, os.environ.get('DB_REPLICA_WRITES') == 'primary')
+
     @provider
     @inject
     def provide_connection(self, engine: Engine) -> Connection:
+        """
+        Every injection checks out an own connection from the pool,
+        the receiver has to close it.
+        """
         return engine.connect()
 
 if __name__ == '__main__':
@@ -625,4 +1787,5 @@ if __name__ == '__main__':
     injector = Injector([AlexandriaDbModule])
 
     join_checker = injector.get(JoinChecker)
-    join_checker.run_check()
+    if not all([check_result.is_ok() for check_result in join_checker.run_check()]):
+        sys.exit(1)
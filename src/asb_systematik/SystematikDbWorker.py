@@ -0,0 +1,168 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import threading
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from injector import singleton, inject
+from asb_systematik.SystematikDao import SystematikDao
+
+class TaskCancelledException(Exception):
+
+    pass
+
+class SystematikDbTask:
+    """
+    Handle for an operation running in the SystematikDbWorker. The
+    operation is called with the SystematikDao in its own unit of work
+    and the task itself, so it can report progress and check for
+    cancellation between its queries.
+    """
+
+    def __init__(self, operation, on_finished=None, on_failed=None, on_cancelled=None, on_progress=None):
+
+        self.operation = operation
+        self.on_finished = on_finished
+        self.on_failed = on_failed
+        self.on_cancelled = on_cancelled
+        self.on_progress = on_progress
+        self.cancelled = False
+        self.done = False
+        self._worker = None
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """
+        Marks the task as cancelled. A statement that is running on
+        a PostgreSQL connection is cancelled on the server.
+        """
+
+        with self._lock:
+            self.cancelled = True
+            connection = self._connection
+        if connection is None:
+            return
+        try:
+            dbapi_connection = connection.connection.connection
+            if hasattr(dbapi_connection, 'cancel'):
+                dbapi_connection.cancel()
+        except Exception:
+            # Nothing running any more
+            pass
+
+    def check_cancelled(self):
+
+        if self.cancelled:
+            raise TaskCancelledException()
+
+    def report_progress(self, done, total):
+
+        if self._worker is not None and not self.cancelled:
+            self._worker._progress.emit(self, done, total)
+
+    def _set_connection(self, connection):
+
+        with self._lock:
+            self._connection = connection
+
+class _SystematikDbRunnable(QRunnable):
+
+    def __init__(self, worker, task: SystematikDbTask):
+
+        super().__init__()
+        self.worker = worker
+        self.task = task
+
+    def run(self):
+
+        task = self.task
+        if task.cancelled:
+            self.worker._cancelled.emit(task)
+            return
+        dao = self.worker.dao
+        try:
+            with dao.unit_of_work() as connection:
+                task._set_connection(connection)
+                result = task.operation(dao, task)
+        except Exception as e:
+            if task.cancelled:
+                self.worker._cancelled.emit(task)
+            else:
+                self.worker._failed.emit(task, e)
+            return
+        finally:
+            task._set_connection(None)
+        if task.cancelled:
+            self.worker._cancelled.emit(task)
+        else:
+            self.worker._finished.emit(task, result)
+
+@singleton
+class SystematikDbWorker(QObject):
+    """
+    Runs SystematikDao operations on a thread pool, every operation
+    in its own unit of work (connection and transaction). The callbacks of a task are called on
+    the thread of the worker (the GUI thread).
+    """
+
+    MAX_THREADS = 2
+
+    _finished = pyqtSignal(object, object)
+    _failed = pyqtSignal(object, object)
+    _cancelled = pyqtSignal(object)
+    _progress = pyqtSignal(object, int, int)
+
+    @inject
+    def __init__(self, dao: SystematikDao):
+
+        super().__init__()
+        self.dao = dao
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(self.MAX_THREADS)
+        self._running_tasks = set()
+        self._finished.connect(self._task_finished)
+        self._failed.connect(self._task_failed)
+        self._cancelled.connect(self._task_cancelled)
+        self._progress.connect(self._task_progress)
+
+    def submit(self, operation, on_finished=None, on_failed=None, on_cancelled=None, on_progress=None) -> SystematikDbTask:
+
+        task = SystematikDbTask(operation, on_finished, on_failed, on_cancelled, on_progress)
+        task._worker = self
+        self._running_tasks.add(task)
+        self.thread_pool.start(_SystematikDbRunnable(self, task))
+        return task
+
+    def wait_for_done(self, msecs=-1):
+
+        return self.thread_pool.waitForDone(msecs)
+
+    def _task_finished(self, task, result):
+
+        self._complete(task)
+        if task.on_finished is not None:
+            task.on_finished(result)
+
+    def _task_failed(self, task, exception):
+
+        self._complete(task)
+        if task.on_failed is not None:
+            task.on_failed(exception)
+
+    def _task_cancelled(self, task):
+
+        self._complete(task)
+        if task.on_cancelled is not None:
+            task.on_cancelled()
+
+    def _task_progress(self, task, done, total):
+
+        if task.on_progress is not None and not task.cancelled:
+            task.on_progress(done, total)
+
+    def _complete(self, task):
+
+        task.done = True
+        self._running_tasks.discard(task)
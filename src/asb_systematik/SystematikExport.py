@@ -0,0 +1,251 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import argparse
+import csv
+import html
+import json
+import os
+import sys
+from injector import Injector
+from asb_systematik.SystematikDao import SystematikTree, SystematikDao,\
+    SystematikIdentifier, AlexandriaDbModule
+from asb_systematik.SystematikSnapshot import SystematikSnapshotStore
+
+class SystematikExporter:
+    """
+    Base class of the exporters. export() calls open_node() for every
+    node in preorder and close_node() after all descendants of the node
+    have been handled. depth is the depth in the tree, 0 for the root.
+    """
+
+    extension = None
+
+    def __init__(self, output):
+
+        self.output = output
+
+    def start(self, tree: SystematikTree):
+
+        pass
+
+    def open_node(self, node, depth):
+
+        pass
+
+    def close_node(self, node, depth):
+
+        pass
+
+    def finish(self, tree: SystematikTree):
+
+        pass
+
+def export(tree: SystematikTree, exporters, start_node=None):
+    """
+    Runs all exporters with one traversal of the tree (or of
+    the subtree below start_node).
+    """
+
+    if start_node is None:
+        start_node = tree.rootnode
+    for exporter in exporters:
+        exporter.start(tree)
+    stack = [(start_node, 0, False)]
+    pop = stack.pop
+    push = stack.append
+    while stack:
+        node, depth, is_open = pop()
+        if is_open:
+            for exporter in exporters:
+                exporter.close_node(node, depth)
+            continue
+        for exporter in exporters:
+            exporter.open_node(node, depth)
+        push((node, depth, True))
+        children = node.children
+        for child_index in range(len(children) - 1, -1, -1):
+            push((children[child_index], depth + 1, False))
+    for exporter in exporters:
+        exporter.finish(tree)
+
+def get_label(node):
+
+    if node.identifier.punkt is None:
+        return node.beschreibung
+    return "%s: %s" % (node.identifier, node.beschreibung)
+
+class HtmlExporter(SystematikExporter):
+
+    extension = 'html'
+
+    def start(self, tree):
+
+        self.output.write("<!DOCTYPE html>\n<html lang=\"de\">\n<head>\n<meta charset=\"utf-8\">\n" +
+                          "<title>%s</title>\n</head>\n<body>\n" % html.escape(tree.rootnode.beschreibung))
+
+    def open_node(self, node, depth):
+
+        if depth == 0 and node.identifier.punkt is None:
+            self.output.write("<h1>%s</h1>\n" % html.escape(node.beschreibung))
+        else:
+            self.output.write("<li id=\"%s\">%s" % (html.escape("%s" % node.identifier), html.escape(get_label(node))))
+        if len(node.children) > 0:
+            self.output.write("\n<ul>\n")
+
+    def close_node(self, node, depth):
+
+        if len(node.children) > 0:
+            self.output.write("</ul>\n")
+        if depth > 0 or node.identifier.punkt is not None:
+            self.output.write("</li>\n")
+
+    def finish(self, tree):
+
+        self.output.write("</body>\n</html>\n")
+
+class MarkdownExporter(SystematikExporter):
+    """
+    Normal points become headings, roman points and sub points
+    list items.
+    """
+
+    extension = 'md'
+
+    def start(self, tree):
+
+        self._in_list = False
+
+    def open_node(self, node, depth):
+
+        if node.is_sub():
+            # Nested only below roman points, four spaces
+            # would make a code block after a heading
+            indent = "    " if node.is_roman() else ""
+            self.output.write("%s- %s\n" % (indent, get_label(node)))
+            self._in_list = True
+        elif node.is_roman():
+            self.output.write("- **%s**: %s\n" % (node.identifier, node.beschreibung))
+            self._in_list = True
+        else:
+            if self._in_list:
+                # Ends the list
+                self.output.write("\n")
+                self._in_list = False
+            self.output.write("%s %s\n\n" % ("#" * min(depth + 1, 6), get_label(node)))
+
+class CsvExporter(SystematikExporter):
+
+    extension = 'csv'
+
+    HEADER = ('systematikpunkt', 'beschreibung', 'kommentar', 'entfernt', 'startjahr', 'endjahr', 'nodetype', 'tiefe')
+
+    def start(self, tree):
+
+        self.writer = csv.writer(self.output, delimiter=';')
+        self.writer.writerow(self.HEADER)
+
+    def open_node(self, node, depth):
+
+        if node.identifier.punkt is None:
+            return
+        self.writer.writerow(("%s" % node.identifier, node.beschreibung, node.kommentar, node.entfernt,
+                              node.startjahr, node.endjahr, node.nodetype, depth))
+
+class JsonExporter(SystematikExporter):
+    """
+    Nested objects with the key children, written while
+    traversing instead of building the whole structure.
+    """
+
+    extension = 'json'
+
+    def start(self, tree):
+
+        # One entry per open node: has a child been written already
+        self._has_children = []
+
+    def open_node(self, node, depth):
+
+        if len(self._has_children) > 0:
+            if self._has_children[-1]:
+                self.output.write(",")
+            self._has_children[-1] = True
+        identifier = None if node.identifier.punkt is None else "%s" % node.identifier
+        data = json.dumps({'systematikpunkt': identifier,
+                           'beschreibung': node.beschreibung,
+                           'kommentar': node.kommentar,
+                           'entfernt': node.entfernt,
+                           'startjahr': node.startjahr,
+                           'endjahr': node.endjahr}, ensure_ascii=False)
+        self.output.write("%s, \"children\": [" % data[:-1])
+        self._has_children.append(False)
+
+    def close_node(self, node, depth):
+
+        self._has_children.pop()
+        self.output.write("]}")
+
+    def finish(self, tree):
+
+        self.output.write("\n")
+
+class TexExporter(SystematikExporter):
+    """
+    Adapter for the LaTeX document of SystematikReporting.
+    """
+
+    extension = 'tex'
+
+    def start(self, tree):
+
+        # SystematikReporting sets the locale on import, so
+        # it is only imported when LaTeX is exported
+        from asb_systematik.SystematikReporting import SystematikTexRenderer
+        self.renderer = SystematikTexRenderer()
+        self.rootnode = tree.rootnode
+        self.output.write(self.renderer.get_prefix())
+
+    def open_node(self, node, depth):
+
+        if depth == 0 and node is not self.rootnode:
+            # Subtree export, the title comes from the root
+            self.output.write(self.renderer.get_node_tex(self.rootnode))
+        self.output.write(self.renderer.get_node_tex(node))
+
+    def finish(self, tree):
+
+        self.output.write(self.renderer.get_postfix())
+
+EXPORTERS = dict([(exporter.extension, exporter) for exporter in
+                  (HtmlExporter, MarkdownExporter, CsvExporter, JsonExporter, TexExporter)])
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Exportiert die Systematik in mehrere Formate")
+    parser.add_argument('-f', '--format', nargs='+', choices=sorted(EXPORTERS.keys()),
+                        default=sorted(EXPORTERS.keys()), help="Formate, voreingestellt sind alle")
+    parser.add_argument('-d', '--directory', default="/tmp", help="Ausgabeverzeichnis")
+    parser.add_argument('-n', '--name', default="systematik", help="Dateiname ohne Endung")
+    parser.add_argument('-s', '--subtree', help="Nur diesen Systematikpunkt mit seinen Unterpunkten ausgeben")
+    args = parser.parse_args()
+
+    injector = Injector([AlexandriaDbModule])
+    dao = injector.get(SystematikDao)
+    tree = injector.get(SystematikSnapshotStore).fetch_tree(dao, SystematikTree)
+    start_node = None
+    if args.subtree is not None:
+        start_node = tree.find_node(SystematikIdentifier(args.subtree))
+        if start_node is None:
+            print("Systematikpunkt %s existiert nicht" % args.subtree)
+            sys.exit(1)
+
+    files = [open(os.path.join(args.directory, "%s.%s" % (args.name, extension)), "w", encoding='utf-8', newline='')
+             for extension in args.format]
+    try:
+        export(tree, [EXPORTERS[extension](output) for extension, output in zip(args.format, files)], start_node)
+    finally:
+        for output in files:
+            output.close()
@@ -0,0 +1,179 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import unicodedata
+from asb_systematik.SystematikDao import SystematikTree
+
+def normalize_text(text):
+    """
+    Upper case without diacritics, so that "mull" finds "Müll".
+    """
+
+    if text is None:
+        return ""
+    text = text.upper()
+    if text.isascii():
+        return text
+    return "".join([character for character in unicodedata.normalize('NFKD', text)
+                    if not unicodedata.combining(character)])
+
+class SystematikFilterResult:
+    """
+    Visibility of all nodes for one query. The positions are the
+    positions in the flat preorder array of the tree.
+    """
+
+    def __init__(self, query, nodes, visible, changed):
+
+        self.query = query
+        self.nodes = nodes
+        self.visible = visible
+        self.changed = changed
+
+    def get_changed_nodes(self):
+        """
+        Returns (node, visible) tuples for all nodes whose visibility
+        differs from the previous result.
+        """
+
+        return [(self.nodes[position], self.visible[position] == 1) for position in self.changed]
+
+class SystematikFilterEngine:
+    """
+    Evaluates the description filter on the flat preorder array of
+    the tree. A node is visible if its description or the description
+    of one of its descendants contains the query. If a query extends
+    the previous one, only the previous matches are searched again.
+    """
+
+    STEP_SIZE = 4096
+
+    def __init__(self, tree: SystematikTree):
+
+        self.tree = tree
+        self._version = None
+        self._content_version = None
+
+    def set_tree(self, tree: SystematikTree):
+
+        self.tree = tree
+        self._version = None
+        self._content_version = None
+
+    def _prepare(self):
+
+        if self._version != self.tree.version:
+            flat = self.tree.get_flat_preorder()
+            self._nodes = [entry[0] for entry in flat]
+            self._parents = [entry[2] for entry in flat]
+            self._positions = dict([(node, position) for position, node in enumerate(self._nodes)])
+            self._version = self.tree.version
+            self._content_version = None
+            # Nothing is known about what is displayed
+            self._visible = None
+        if self._content_version != self.tree.content_version:
+            self._normalized = [normalize_text(node.beschreibung) for node in self._nodes]
+            self._content_version = self.tree.content_version
+            self._query = None
+            self._matches = None
+
+    def get_position(self, node):
+
+        self._prepare()
+        return self._positions.get(node)
+
+    def filter(self, query, displayed=None) -> SystematikFilterResult:
+        """
+        displayed may be the visibility that is actually shown at the
+        moment (for example after an interrupted update). The changes of
+        the result are calculated against it instead of against the
+        previous result.
+        """
+
+        steps = self.filter_steps(query, displayed)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as stop:
+                return stop.value
+
+    def filter_steps(self, query, displayed=None):
+        """
+        Generator version of filter() for callers that must not block:
+        it yields after every STEP_SIZE positions and returns the
+        SystematikFilterResult. The state of the engine only changes
+        at the end, so a pass that is not run to its end does no harm.
+        """
+
+        self._prepare()
+        query = normalize_text(query)
+        nodes = self._nodes
+        normalized = self._normalized
+        size = len(nodes)
+
+        if query == "":
+            matches = None
+            visible = bytearray(b'\x01') * size
+        elif self._matches is not None and query.startswith(self._query):
+            candidates = self._matches
+            matches = []
+            for start in range(0, len(candidates), self.STEP_SIZE):
+                matches.extend([position for position in candidates[start:start + self.STEP_SIZE]
+                                if query in normalized[position]])
+                yield
+            visible = self._mark_with_ancestors(matches)
+        else:
+            matches = []
+            for start in range(0, size, self.STEP_SIZE):
+                matches.extend([position for position in range(start, min(start + self.STEP_SIZE, size))
+                                if query in normalized[position]])
+                yield
+            visible = yield from self._propagate(matches)
+
+        previous = self._visible
+        if displayed is not None and len(displayed) == size:
+            previous = displayed
+        if previous is None:
+            changed = range(0, size)
+        else:
+            changed = []
+            for start in range(0, size, self.STEP_SIZE):
+                changed.extend([position for position in range(start, min(start + self.STEP_SIZE, size))
+                                if visible[position] != previous[position]])
+                yield
+
+        self._query = query
+        self._matches = matches
+        self._visible = visible
+        return SystematikFilterResult(query, nodes, visible, changed)
+
+    def _propagate(self, matches):
+        """
+        Single pass in reverse preorder: every child is handled before
+        its parent, so the flags move up to the root.
+        """
+
+        visible = bytearray(len(self._nodes))
+        for position in matches:
+            visible[position] = 1
+        parents = self._parents
+        for position in range(len(visible) - 1, 0, -1):
+            if visible[position]:
+                visible[parents[position]] = 1
+            if position % self.STEP_SIZE == 0:
+                yield
+        visible[0] = 1
+        return visible
+
+    def _mark_with_ancestors(self, matches):
+
+        visible = bytearray(len(self._nodes))
+        visible[0] = 1
+        parents = self._parents
+        for position in matches:
+            while not visible[position]:
+                visible[position] = 1
+                position = parents[position]
+        return visible
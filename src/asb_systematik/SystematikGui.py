@@ -3,14 +3,18 @@ import sys
 from PyQt5.QtWidgets import QWidget, QApplication, QGroupBox, \
     QHBoxLayout, QVBoxLayout, QPushButton, QLabel, QLineEdit,\
     QDialog, QDialogButtonBox, QMessageBox, QRadioButton,\
-    QPlainTextEdit, QCheckBox
+    QPlainTextEdit, QCheckBox, QProgressDialog
 from injector import Injector, inject
 from asb_systematik.SystematikTreeWidgetService import SystematikTreeWidgetService,\
-    NoSelectionException, SystematikQTreeWidgetItem
-from PyQt5 import sip, QtCore
+    NoSelectionException
+from PyQt5 import QtCore
 from PyQt5.QtCore import QSize
 from asb_systematik.SystematikDao import AlexandriaDbModule, NODE_TYPE_VIRTUAL,\
-    NODE_TYPE_NORMAL
+    NODE_TYPE_NORMAL, DeletionForbiddenException
+from asb_systematik.SystematikDbWorker import SystematikDbWorker
+from asb_systematik.SystematikChangePoller import SystematikChangePoller
+from asb_systematik.SystematikReplicaSyncer import SystematikReplicaSyncer
+from asb_systematik.SystematikInstrumentation import INSTRUMENTATION
 
 class NewSubpointSelectionDialog(QDialog):
     
@@ -162,11 +166,32 @@ class Window(QWidget):
     
     PUNKT, BESCHREIBUNG = range(2)
     
+    USAGE_REFRESH_MS = 10 * 60 * 1000
+    WRITE_PROGRESS_DELAY_MS = 500
+    
     @inject
-    def __init__(self, tree_widget_service: SystematikTreeWidgetService):
+    def __init__(self, tree_widget_service: SystematikTreeWidgetService, db_worker: SystematikDbWorker,
+                 change_poller: SystematikChangePoller, replica_syncer: SystematikReplicaSyncer):
         super().__init__()
         self.tree_widget_service = tree_widget_service
-        self.tree_widget = tree_widget_service.create_tree_widget()
+        self.db_worker = db_worker
+        self.change_poller = change_poller
+        self.replica_syncer = replica_syncer
+        self._prefetch_task = None
+        self._prefetched_usage = None
+        self._write_task = None
+        self._write_buttons = []
+        self.tree_widget = tree_widget_service.create_tree_view()
+        self.tree_widget.node_selected.connect(self.prefetch_usage)
+        self._usage_timer = QtCore.QTimer(self)
+        self._usage_timer.timeout.connect(self.refresh_usage_map)
+        self._usage_timer.start(self.USAGE_REFRESH_MS)
+        self.refresh_usage_map()
+        if tree_widget_service.is_from_snapshot():
+            self.db_worker.submit(lambda dao, task: self.tree_widget_service.reconcile_tree(dao),
+                                  self.tree_widget_service.tree_reconciled, self._show_error)
+        self.change_poller.start()
+        self.replica_syncer.start()
         self.create_widgets()
         self.setGeometry(400, 400, 1300, 600)
         self.setWindowTitle("ASB Systematik")
@@ -205,6 +230,7 @@ class Window(QWidget):
         buttonGroup.addWidget(editButton)
         buttonGroup.addWidget(newSubButton)
         buttonGroup.addWidget(deleteButton)
+        self._write_buttons = [editButton, newSubButton, deleteButton]
 
         
         mainLayout = QVBoxLayout()
@@ -215,8 +241,11 @@ class Window(QWidget):
         
         self.show()
     
+    @INSTRUMENTATION.instrument_slot('gui.edit_description')
     def edit_description(self):
 
+        if self.is_writing():
+            return
         try:
             item_widget = self.tree_widget.first_selected()
             
@@ -236,7 +265,7 @@ class Window(QWidget):
                    item_widget.startjahr != old_startjahr or \
                    item_widget.nodetype != old_nodetype or \
                    item_widget.endjahr != old_endjahr:
-                    self.tree_widget_service.save(item_widget)
+                    self._save_in_background(item_widget)
             else:
                 # Reset after cancel
                 item_widget.beschreibung = old_description
@@ -259,8 +288,11 @@ class Window(QWidget):
             msg.setIcon(QMessageBox.Critical)
             msg.exec()
             
+    @INSTRUMENTATION.instrument_slot('gui.new_sub_point')
     def new_sub_point(self):
 
+        if self.is_writing():
+            return
         try:
             parent_widget = self.tree_widget.first_selected()
             possible_children = parent_widget.systematik_node.get_possible_children()
@@ -277,17 +309,15 @@ class Window(QWidget):
                     selected = dlg.get_selected()
                     if selected is None:
                         return
-                    child_widget = SystematikQTreeWidgetItem(parent_widget, selected)
+                    child_widget = self.tree_widget.create_child_item(parent_widget, selected)
                 else:
                     return
             else:
-                child_widget = SystematikQTreeWidgetItem(parent_widget, possible_children[0])
+                child_widget = self.tree_widget.create_child_item(parent_widget, possible_children[0])
             parent_widget.setExpanded(True)
             dlg = DescriptionEditDialog(child_widget)
             if dlg.exec():
-                self.tree_widget_service.save(child_widget)
-            else:
-                sip.delete(child_widget)
+                self._save_in_background(child_widget)
             
         except NoSelectionException as e:
             msg = QMessageBox(self)
@@ -302,8 +332,11 @@ class Window(QWidget):
             msg.setIcon(QMessageBox.Critical)
             msg.exec()
     
+    @INSTRUMENTATION.instrument_slot('gui.delete_point')
     def delete_point(self):
 
+        if self.is_writing():
+            return
         try:
             selected_widget = self.tree_widget.first_selected()
             node = selected_widget.systematik_node
@@ -328,27 +361,17 @@ class Window(QWidget):
                 msg.setIcon(QMessageBox.Critical)
                 msg.exec()
                 return
-            if self.tree_widget_service.is_used(selected_widget):
-                msg = QMessageBox(self)
-                msg.setWindowTitle("Fehler!")
-                usage = self.tree_widget_service.first_usage(selected_widget)
-                msg.setText("Der Eintrag wird benutzt und kann nicht\ngelöscht werden!\n(%s)" % usage)
-                msg.setIcon(QMessageBox.Critical)
-                msg.exec()
-                return
-            
-            dlg = QMessageBox(self)
-            dlg.setWindowTitle("Bestätigung")
-            dlg.setText('Willst du wirklich den Systematikpunkt\n"%s"\nlöschen?' % node)
-            dlg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
-            dlg.setIcon(QMessageBox.Question)
-            button = dlg.exec()
-
-            if button == QMessageBox.Yes:
-                self.tree_widget_service.delete(selected_widget)
-                sip.delete(selected_widget)
+            # The prefetched usage and the usage map are only hints,
+            # the usage is checked again right before deleting
+            if self._prefetched_usage is not None and self._prefetched_usage[0] is node:
+                is_used = self._prefetched_usage[1] is not None
             else:
-                pass
+                usage = self.tree_widget.model().get_usage(node)
+                is_used = usage is None or usage.is_used()
+            if is_used:
+                self._check_usage_and_delete(selected_widget)
+            else:
+                self._confirm_deletion(selected_widget, None)
 
         except NoSelectionException as e:
             msg = QMessageBox(self)
@@ -363,6 +386,186 @@ class Window(QWidget):
             msg.setIcon(QMessageBox.Critical)
             msg.exec()
         
+    def _check_usage_and_delete(self, item_widget):
+        
+        node = item_widget.systematik_node
+        progress = QProgressDialog("Prüfe, ob der Eintrag benutzt wird...", "Abbrechen", 0, 0, self)
+        progress.setWindowTitle("Bitte warten")
+        progress.setWindowModality(QtCore.Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        
+        def usage_found(usage):
+            progress.hide()
+            self._confirm_deletion(item_widget, usage)
+            
+        def check_failed(exception):
+            progress.hide()
+            self._show_error(exception)
+            
+        task = self.db_worker.submit(
+            lambda dao, task: self.tree_widget_service.get_usage(node, dao, task),
+            usage_found, check_failed, progress.hide)
+        progress.canceled.connect(task.cancel)
+        progress.show()
+        
+    def _confirm_deletion(self, item_widget, usage):
+        
+        node = item_widget.systematik_node
+        if usage is not None:
+            self._show_usage(usage)
+            return
+        
+        dlg = QMessageBox(self)
+        dlg.setWindowTitle("Bestätigung")
+        dlg.setText('Willst du wirklich den Systematikpunkt\n"%s"\nlöschen?' % node)
+        dlg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+        dlg.setIcon(QMessageBox.Question)
+        button = dlg.exec()
+
+        if button != QMessageBox.Yes:
+            return
+        
+        tree = self.tree_widget_service.tree
+        
+        def delete_node(dao, task):
+            # Someone might have used the entry since the last check
+            task.report_progress(0, 3)
+            usage = self.tree_widget_service.get_usage(node, dao, task)
+            if usage is not None:
+                return usage, None
+            task.report_progress(1, 3)
+            dao.delete_node(node)
+            task.report_progress(2, 3)
+            return None, self.tree_widget_service.fetch_fingerprint(dao)
+        
+        def node_deleted(result):
+            usage, fingerprint = result
+            self._prefetched_usage = None
+            if usage is not None:
+                self._show_usage(usage)
+                return
+            self.tree_widget_service.node_deleted(item_widget, fingerprint, tree)
+            
+        def delete_failed(exception):
+            if isinstance(exception, DeletionForbiddenException):
+                msg = QMessageBox(self)
+                msg.setWindowTitle("Fehler!")
+                msg.setText("Der Eintrag kann nicht gelöscht werden!\n%s" % exception)
+                msg.setIcon(QMessageBox.Critical)
+                msg.exec()
+            else:
+                self._show_error(exception)
+            
+        self._submit_write("Lösche den Eintrag...", delete_node, node_deleted, delete_failed)
+        
+    def _show_usage(self, usage):
+        
+        msg = QMessageBox(self)
+        msg.setWindowTitle("Fehler!")
+        msg.setText("Der Eintrag wird benutzt und kann nicht\ngelöscht werden!\n(%s)" % usage)
+        msg.setIcon(QMessageBox.Critical)
+        msg.exec()
+        
+    def _save_in_background(self, item_widget):
+        
+        node = item_widget.systematik_node
+        tree = self.tree_widget_service.tree
+        
+        def write_node(dao, task):
+            task.report_progress(0, 2)
+            inserted = self.tree_widget_service.write_node(node, dao)
+            task.report_progress(1, 2)
+            return inserted, self.tree_widget_service.fetch_fingerprint(dao)
+        
+        def node_saved(result):
+            inserted, fingerprint = result
+            self.tree_widget_service.node_saved(item_widget, inserted, fingerprint, tree)
+            
+        def save_failed(exception):
+            self._show_error(exception)
+            
+        self._submit_write("Speichere den Eintrag...", write_node, node_saved, save_failed)
+        
+    def _submit_write(self, label, operation, on_finished, on_failed):
+        """
+        Runs a writing operation with the db worker. Until it is done,
+        the progress dialog shows its steps and the buttons that write
+        are disabled, so a new point can't be written twice (the second
+        one would see the first one in the table and overwrite it).
+        A write can't be cancelled, it might already be committed.
+        """
+        
+        progress = QProgressDialog(label, None, 0, 0, self)
+        progress.setCancelButton(None)
+        progress.setWindowTitle("Bitte warten")
+        progress.setWindowModality(QtCore.Qt.WindowModal)
+        progress.setMinimumDuration(self.WRITE_PROGRESS_DELAY_MS)
+        
+        def progress_changed(done, total):
+            progress.setMaximum(total)
+            progress.setValue(done)
+        
+        def write_finished(result):
+            self._write_done(progress)
+            on_finished(result)
+            
+        def write_failed(exception):
+            self._write_done(progress)
+            on_failed(exception)
+            
+        self._set_write_buttons_enabled(False)
+        self._write_task = self.db_worker.submit(operation, write_finished, write_failed,
+                                                 lambda: self._write_done(progress), progress_changed)
+        
+    def _write_done(self, progress):
+        
+        progress.reset()
+        self._write_task = None
+        self._set_write_buttons_enabled(True)
+        
+    def _set_write_buttons_enabled(self, enabled):
+        
+        for button in self._write_buttons:
+            button.setEnabled(enabled)
+            
+    def is_writing(self):
+        
+        return self._write_task is not None
+        
+    def refresh_usage_map(self):
+        
+        self.db_worker.submit(lambda dao, task: dao.fetch_usage_map(),
+                              self.tree_widget.model().set_usage_map)
+        
+    def prefetch_usage(self, node):
+        """
+        Checks the usage of the selected node in the background,
+        so a deletion can be confirmed without waiting.
+        """
+        
+        if self._prefetch_task is not None and not self._prefetch_task.done:
+            self._prefetch_task.cancel()
+        self._prefetched_usage = None
+        self._prefetch_task = None
+        if len(node.children) > 0 or node.next_sibling is not None:
+            # Can't be deleted anyway
+            return
+        
+        def usage_found(usage):
+            self._prefetched_usage = (node, usage)
+            
+        self._prefetch_task = self.db_worker.submit(
+            lambda dao, task: self.tree_widget_service.get_usage(node, dao, task),
+            usage_found)
+        
+    def _show_error(self, exception):
+        
+        msg = QMessageBox(self)
+        msg.setWindowTitle("Fehler!")
+        msg.setText("Fehler:\n%s" % exception)
+        msg.setIcon(QMessageBox.Critical)
+        msg.exec()
+        
     def expand_tree(self):
         
         self.tree_widget.expand_all()
@@ -371,9 +574,10 @@ class Window(QWidget):
         
         self.tree_widget.collapse_all()
         
+    @INSTRUMENTATION.instrument_slot('gui.filter_changed')
     def filter_changed(self, filter_text):
         
-        self.tree_widget.filter(filter_text.upper())
+        self.tree_widget.schedule_filter(filter_text.upper())
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -0,0 +1,140 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import re
+from functools import lru_cache
+
+ROMAN_MAXIMUM = 4999
+PARSE_CACHE_SIZE = 1 << 16
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+FULL_STRING_PATTERN = re.compile(r'[IVX-]')
+
+ROMAN_NUMERAL_MAP = (('M', 1000), ('CM', 900), ('D', 500), ('CD', 400),
+                     ('C', 100), ('XC', 90), ('L', 50), ('XL', 40),
+                     ('X', 10), ('IX', 9), ('V', 5), ('IV', 4), ('I', 1))
+
+def _calculate_roman(number):
+
+    result = ""
+    for numeral, value in ROMAN_NUMERAL_MAP:
+        while number >= value:
+            result += numeral
+            number -= value
+    return result
+
+# Index is the number, so ROMAN_NUMERALS[0] is unused
+ROMAN_NUMERALS = tuple([_calculate_roman(number) for number in range(0, ROMAN_MAXIMUM + 1)])
+ROMAN_VALUES = dict([(numeral, number) for number, numeral in enumerate(ROMAN_NUMERALS) if number > 0])
+
+class IdentifierParseError(Exception):
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+class IdentifierParseResult:
+    """
+    Result of parsing one string in parse_many(). Either identifier
+    or error is set.
+    """
+
+    def __init__(self, raw, identifier=None, error=None):
+
+        self.raw = raw
+        self.identifier = identifier
+        self.error = error
+
+    def is_valid(self):
+
+        return self.error is None
+
+def to_roman(number: int) -> str:
+
+    if not isinstance(number, int) or number < 1 or number > ROMAN_MAXIMUM:
+        raise IdentifierParseError("Zahl %s kann nicht römisch dargestellt werden" % number)
+    return ROMAN_NUMERALS[number]
+
+def from_roman(numeral: str) -> int:
+
+    try:
+        return ROMAN_VALUES[numeral]
+    except KeyError:
+        raise IdentifierParseError("Ungültige römische Zahl: %s" % numeral)
+
+def sanitize_punkt(punkt: str) -> str:
+    """
+    Removes all whitespace and one trailing dot.
+    """
+
+    punkt = WHITESPACE_PATTERN.sub('', punkt)
+    if punkt.endswith('.'):
+        punkt = punkt[:-1]
+    return punkt
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_identifier_string(string: str):
+    """
+    Splits a full identifier string like 1.2.IV-3 into the
+    tuple (punkt, roemisch, sub). Missing parts are None.
+    Raises IdentifierParseError for malformed strings.
+    """
+
+    punkt = sanitize_punkt(string)
+    if FULL_STRING_PATTERN.search(punkt) is None:
+        return punkt, None, None
+
+    dot_position = punkt.rfind('.')
+    prefix = punkt[:dot_position] if dot_position >= 0 else ''
+    last = punkt[dot_position + 1:]
+
+    subsplit = last.split('-')
+    if len(subsplit) > 2:
+        raise IdentifierParseError("Mehr als ein Unterpunkt in %s" % string)
+    sub = None
+    if len(subsplit) == 2:
+        try:
+            sub = int(subsplit[1])
+        except ValueError:
+            raise IdentifierParseError("Ungültiger Unterpunkt in %s" % string)
+        if sub == 0:
+            sub = None
+
+    head = subsplit[0]
+    if head == '':
+        raise IdentifierParseError("Leerer Systematikpunkt in %s" % string)
+    if head[0] in ("I", "V", "X", "L", "C"):
+        if prefix == '':
+            raise IdentifierParseError("Römische Zahl ohne Systematikpunkt in %s" % string)
+        return prefix, from_roman(head), sub
+    if prefix == '':
+        return head, None, sub
+    return "%s.%s" % (prefix, head), None, sub
+
+def parse_many(strings, factory=None):
+    """
+    Parses every string of the iterable and returns a list of
+    IdentifierParseResult objects in the same order. Errors are
+    reported per item and do not stop the batch. If given,
+    factory is called with (punkt, roemisch, sub) to create
+    the identifier, otherwise the tuple itself is returned.
+    """
+
+    results = []
+    append = results.append
+    for string in strings:
+        try:
+            parts = parse_identifier_string(string)
+        except IdentifierParseError as e:
+            append(IdentifierParseResult(string, error=e.message))
+            continue
+        except (TypeError, AttributeError):
+            append(IdentifierParseResult(string, error="Kein Systematikpunkt: %r" % (string,)))
+            continue
+        if factory is None:
+            append(IdentifierParseResult(string, parts))
+        else:
+            append(IdentifierParseResult(string, factory(*parts)))
+    return results
@@ -0,0 +1,204 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import argparse
+import csv
+import json
+import sys
+from injector import singleton, inject, Injector
+from asb_systematik.SystematikDao import SystematikDao, SystematikTree, SystematikNode,\
+    SystematikIdentifier, AlexandriaDbModule
+
+IDENTIFIER_COLUMNS = ('systematikpunkt', 'punkt', 'identifier')
+TEXT_COLUMNS = ('beschreibung', 'kommentar', 'entfernt')
+INTEGER_COLUMNS = ('startjahr', 'endjahr', 'nodetype')
+
+class SystematikImportError:
+
+    def __init__(self, line, raw, message):
+
+        self.line = line
+        self.raw = raw
+        self.message = message
+
+    def __str__(self):
+
+        return "Eintrag %s (%s): %s" % (self.line, self.raw, self.message)
+
+class SystematikImportException(Exception):
+
+    def __init__(self, errors):
+        super().__init__("%d Fehler beim Import" % len(errors))
+        self.errors = errors
+
+class SystematikImportRecord:
+    """
+    One entry of the import file. values contains only the
+    columns that are present in the file.
+    """
+
+    def __init__(self, line, raw_identifier, values):
+
+        self.line = line
+        self.raw_identifier = raw_identifier
+        self.values = values
+
+@singleton
+class SystematikImporter:
+    """
+    Imports Systematik points from CSV (with header line) or JSON (a
+    list of objects) files. The column systematikpunkt contains the
+    full identifier like 1.2.IV-3, further columns are beschreibung,
+    kommentar, entfernt, startjahr, endjahr and nodetype. Everything is
+    checked against the tree before anything is written; existing points
+    are updated, new ones inserted, all in one transaction.
+    """
+
+    @inject
+    def __init__(self, dao: SystematikDao):
+
+        self.dao = dao
+
+    def read(self, path):
+
+        if path.lower().endswith('.json'):
+            with open(path, encoding='utf-8') as json_file:
+                return self.read_json(json_file)
+        with open(path, encoding='utf-8', newline='') as csv_file:
+            return self.read_csv(csv_file)
+
+    def read_csv(self, csv_file):
+
+        sample = csv_file.read(4096)
+        csv_file.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(csv_file, dialect=dialect)
+        # The header is line 1
+        return [self._create_record(line, entry) for line, entry in enumerate(reader, 2)]
+
+    def read_json(self, json_file):
+
+        return [self._create_record(line, entry) for line, entry in enumerate(json.load(json_file), 1)]
+
+    def _create_record(self, line, entry):
+
+        values = dict([(key.strip().lower(), value) for key, value in entry.items() if key is not None])
+        raw_identifier = None
+        for column in IDENTIFIER_COLUMNS:
+            if column in values:
+                raw_identifier = values.pop(column)
+                break
+        return SystematikImportRecord(line, raw_identifier, values)
+
+    def validate(self, records, tree: SystematikTree):
+        """
+        Returns the nodes to write and the list of errors.
+        """
+
+        errors = []
+        nodes = []
+        identifiers = {}
+        parse_results = SystematikIdentifier.parse_many(
+            ["%s" % record.raw_identifier if record.raw_identifier is not None else None for record in records])
+        for record, parse_result in zip(records, parse_results):
+            if record.raw_identifier is None or "%s" % record.raw_identifier == '':
+                errors.append(SystematikImportError(record.line, record.raw_identifier, "Kein Systematikpunkt angegeben"))
+                continue
+            if not parse_result.is_valid():
+                errors.append(SystematikImportError(record.line, record.raw_identifier, parse_result.error))
+                continue
+            identifier = parse_result.identifier
+            if identifier in identifiers:
+                errors.append(SystematikImportError(record.line, record.raw_identifier,
+                                                    "Doppelt, schon in Eintrag %s" % identifiers[identifier]))
+                continue
+            identifiers[identifier] = record.line
+            node = self._create_node(record, identifier, tree.find_node(identifier), errors)
+            if node is not None:
+                nodes.append(node)
+
+        for node, line in [(node, identifiers[node.identifier]) for node in nodes]:
+            parent = node.identifier.parent
+            if tree.find_node(parent) is None and parent not in identifiers:
+                errors.append(SystematikImportError(line, node.identifier,
+                                                    "Übergeordneter Punkt %s existiert nicht" % parent))
+        return nodes, errors
+
+    def _create_node(self, record, identifier, existing: SystematikNode, errors):
+
+        values = {}
+        for column in TEXT_COLUMNS + INTEGER_COLUMNS:
+            if column in record.values:
+                values[column] = record.values[column]
+            elif existing is not None:
+                values[column] = getattr(existing, column)
+            else:
+                values[column] = None
+        for column in TEXT_COLUMNS:
+            if values[column] is not None:
+                values[column] = ("%s" % values[column]).strip()
+                if values[column] == '' and column != 'beschreibung':
+                    values[column] = None
+        for column in INTEGER_COLUMNS:
+            if values[column] is None or values[column] == '':
+                values[column] = None
+                continue
+            try:
+                values[column] = int(values[column])
+            except (TypeError, ValueError):
+                errors.append(SystematikImportError(record.line, record.raw_identifier,
+                                                    "Keine Zahl in %s: %s" % (column, values[column])))
+                return None
+        if values['beschreibung'] is None or values['beschreibung'] == '':
+            errors.append(SystematikImportError(record.line, record.raw_identifier, "Keine Beschreibung"))
+            return None
+        node = SystematikNode(identifier, **values)
+        if existing is not None:
+            node.digistate = existing.digistate
+            node.id = existing.id
+        return node
+
+    def import_records(self, records, tree: SystematikTree=None, dry_run=False):
+        """
+        Validates the records and writes them. Raises a
+        SystematikImportException with all errors if a record
+        is not valid, then nothing is written. Returns the
+        lists of inserted and updated nodes.
+        """
+
+        with self.dao.unit_of_work():
+            if tree is None:
+                tree = self.dao.fetch_tree(SystematikTree)
+            nodes, errors = self.validate(records, tree)
+            if len(errors) > 0:
+                raise SystematikImportException(errors)
+            if dry_run:
+                inserted = [node for node in nodes if tree.find_node(node.identifier) is None]
+                return inserted, [node for node in nodes if tree.find_node(node.identifier) is not None]
+            return self.dao.upsert_nodes(nodes)
+
+    def import_file(self, path, tree: SystematikTree=None, dry_run=False):
+
+        return self.import_records(self.read(path), tree, dry_run)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Importiert Systematikpunkte aus einer CSV- oder JSON-Datei")
+    parser.add_argument('file', help="CSV- oder JSON-Datei")
+    parser.add_argument('--dry-run', action='store_true', help="Nur prüfen, nichts schreiben")
+    args = parser.parse_args()
+
+    injector = Injector([AlexandriaDbModule])
+    importer = injector.get(SystematikImporter)
+    try:
+        inserted, updated = importer.import_file(args.file, dry_run=args.dry_run)
+    except SystematikImportException as e:
+        for error in e.errors:
+            print(error)
+        sys.exit(1)
+    print("%d neue, %d geänderte Systematikpunkte" % (len(inserted), len(updated)))
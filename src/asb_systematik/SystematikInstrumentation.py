@@ -0,0 +1,304 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+
+Opt-in measurements. With SYSTEMATIK_INSTRUMENTATION set to the path
+of a JSON file, the calls of the dao and the tree widget service and
+the GUI actions are timed, the database statements counted and the
+statistics written to the file on exit. Statements slower than
+SYSTEMATIK_SLOW_STATEMENT_MS (default 100) are logged with their
+parameters. SYSTEMATIK_PROFILE=1 additionally samples the stack of
+the GUI thread during the GUI actions.
+'''
+import atexit
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.engine.base import Engine
+
+SLOW_STATEMENTS_KEPT = 200
+
+PROFILE_INTERVAL = 0.005
+
+PROFILE_STACKS_KEPT = 50
+
+logger = logging.getLogger(__name__)
+
+class SystematikOperationStatistics:
+
+    def __init__(self):
+
+        self.calls = 0
+        self.errors = 0
+        self.wall_time = 0.0
+        self.max_wall_time = 0.0
+        self.cpu_time = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+
+    def to_dict(self):
+
+        return {'calls': self.calls,
+                'errors': self.errors,
+                'wall_time': self.wall_time,
+                'mean_wall_time': self.wall_time / self.calls if self.calls > 0 else 0.0,
+                'max_wall_time': self.max_wall_time,
+                'cpu_time': self.cpu_time,
+                'queries': self.queries,
+                'query_time': self.query_time}
+
+class _Measurement:
+
+    def __init__(self, name):
+
+        self.name = name
+        self.queries = 0
+        self.query_time = 0.0
+
+class SystematikInstrumentation:
+    """
+    Collects the statistics. Operations may be nested, the queries
+    are counted for all operations running on the thread, so the
+    numbers of an operation include those of the operations it calls.
+    cpu_time is the processor time of the thread: for the GUI actions
+    the difference to wall_time is mostly the time spent in dialogs.
+
+    When not enabled, the decorators return the functions unchanged.
+    """
+
+    def __init__(self, path=None, slow_statement_seconds=0.1, profile=False):
+
+        self.path = path
+        self.enabled = path is not None
+        self.slow_statement_seconds = slow_statement_seconds
+        self.profile = profile
+        self.operations = {}
+        self.slow_statements = deque(maxlen=SLOW_STATEMENTS_KEPT)
+        self.profiles = {}
+        self.statistics_providers = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._profiled_threads = {}
+        self._installed = False
+
+    def install(self):
+        """
+        Registers the statement events and the dump at exit.
+        """
+
+        if not self.enabled or self._installed:
+            return
+        self._installed = True
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        atexit.register(self.dump)
+        if self.profile:
+            sampler = threading.Thread(target=self._sample, name='systematik-profiler', daemon=True)
+            sampler.start()
+
+    def _get_active(self):
+
+        active = getattr(self._local, 'active', None)
+        if active is None:
+            active = []
+            self._local.active = active
+        return active
+
+    def _before_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+
+        connection.info.setdefault('systematik_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+
+        duration = time.perf_counter() - connection.info['systematik_query_start'].pop()
+        for measurement in self._get_active():
+            measurement.queries += 1
+            measurement.query_time += duration
+        if duration >= self.slow_statement_seconds:
+            active = self._get_active()
+            operation = active[-1].name if len(active) > 0 else None
+            parameter_string = repr(parameters)
+            if len(parameter_string) > 500:
+                parameter_string = parameter_string[:500] + "..."
+            logger.warning("Langsames Statement (%.3f s, %s): %s %s", duration, operation, statement, parameter_string)
+            self.slow_statements.append({'seconds': duration,
+                                         'operation': operation,
+                                         'statement': statement,
+                                         'parameters': parameter_string})
+
+    def measure(self, name, profile=False):
+
+        return _MeasurementContext(self, name, profile and self.profile)
+
+    def _start(self, name, profile):
+
+        measurement = _Measurement(name)
+        self._get_active().append(measurement)
+        if profile:
+            with self._lock:
+                self._profiled_threads[threading.get_ident()] = name
+        return measurement
+
+    def _stop(self, measurement, wall_time, cpu_time, failed, profile):
+
+        active = self._get_active()
+        active.remove(measurement)
+        if profile:
+            with self._lock:
+                self._profiled_threads.pop(threading.get_ident(), None)
+        with self._lock:
+            statistics = self.operations.get(measurement.name)
+            if statistics is None:
+                statistics = SystematikOperationStatistics()
+                self.operations[measurement.name] = statistics
+            statistics.calls += 1
+            if failed:
+                statistics.errors += 1
+            statistics.wall_time += wall_time
+            statistics.max_wall_time = max(statistics.max_wall_time, wall_time)
+            statistics.cpu_time += cpu_time
+            statistics.queries += measurement.queries
+            statistics.query_time += measurement.query_time
+
+    def instrument(self, name, profile=False):
+        """
+        Decorator for a function or method. Generator functions are
+        measured while they are consumed.
+        """
+
+        def decorator(function):
+
+            if not self.enabled:
+                return function
+            if inspect.isgeneratorfunction(function):
+                @wraps(function)
+                def measured_generator(*args, **kwargs):
+                    with self.measure(name, profile):
+                        yield from function(*args, **kwargs)
+                return measured_generator
+
+            @wraps(function)
+            def measured(*args, **kwargs):
+                with self.measure(name, profile):
+                    return function(*args, **kwargs)
+            return measured
+        return decorator
+
+    def instrument_slot(self, name):
+        """
+        Decorator for the methods connected to Qt signals. The signal
+        arguments the method does not take (like checked of
+        clicked) are dropped, PyQt can't see them through the wrapper.
+        """
+
+        def decorator(function):
+
+            if not self.enabled:
+                return function
+            argument_count = function.__code__.co_argcount
+
+            @wraps(function)
+            def measured(*args):
+                with self.measure(name, True):
+                    return function(*args[:argument_count])
+            return measured
+        return decorator
+
+    def instrument_class(self, cls, prefix):
+        """
+        Measures all public methods defined in the class itself.
+        """
+
+        if not self.enabled:
+            return cls
+        for attribute_name, attribute in list(cls.__dict__.items()):
+            if attribute_name.startswith('_') or not inspect.isfunction(attribute):
+                continue
+            # Context managers would only be measured while being created
+            if hasattr(attribute, '__wrapped__') and inspect.isgeneratorfunction(attribute.__wrapped__):
+                continue
+            setattr(cls, attribute_name, self.instrument("%s.%s" % (prefix, attribute_name))(attribute))
+        return cls
+
+    def add_statistics_provider(self, name, provider):
+        """
+        provider is called when dumping and returns
+        further statistics for the JSON file.
+        """
+
+        self.statistics_providers[name] = provider
+
+    def _sample(self):
+
+        while True:
+            time.sleep(PROFILE_INTERVAL)
+            with self._lock:
+                profiled_threads = list(self._profiled_threads.items())
+            if len(profiled_threads) == 0:
+                continue
+            frames = sys._current_frames()
+            for thread_id, name in profiled_threads:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+                    frame = frame.f_back
+                with self._lock:
+                    self.profiles.setdefault(name, Counter())[";".join(reversed(stack))] += 1
+
+    def get_statistics(self):
+
+        with self._lock:
+            statistics = {'operations': dict([(name, operation.to_dict())
+                                              for name, operation in sorted(self.operations.items())]),
+                          'slow_statements': list(self.slow_statements),
+                          'profiles': dict([(name, [{'samples': count, 'stack': stack}
+                                                    for stack, count in samples.most_common(PROFILE_STACKS_KEPT)])
+                                            for name, samples in self.profiles.items()])}
+        for name, provider in self.statistics_providers.items():
+            statistics[name] = provider()
+        return statistics
+
+    def dump(self, path=None):
+
+        if path is None:
+            path = self.path
+        with open(path, 'w') as statistics_file:
+            json.dump(self.get_statistics(), statistics_file, indent=2)
+
+class _MeasurementContext:
+
+    def __init__(self, instrumentation, name, profile):
+
+        self.instrumentation = instrumentation
+        self.name = name
+        self.profile = profile
+
+    def __enter__(self):
+
+        self.measurement = self.instrumentation._start(self.name, self.profile)
+        self.start = time.perf_counter()
+        self.start_cpu = time.thread_time()
+        return self.measurement
+
+    def __exit__(self, exception_type, exception, traceback):
+
+        self.instrumentation._stop(self.measurement, time.perf_counter() - self.start,
+                                   time.thread_time() - self.start_cpu, exception_type is not None, self.profile)
+        return False
+
+INSTRUMENTATION = SystematikInstrumentation(os.environ.get('SYSTEMATIK_INSTRUMENTATION'),
+                                            int(os.environ.get('SYSTEMATIK_SLOW_STATEMENT_MS', '100')) / 1000.0,
+                                            os.environ.get('SYSTEMATIK_PROFILE', '0') == '1')
+INSTRUMENTATION.install()
@@ -0,0 +1,425 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+
+Read-only local copy of the Systematik for slow connections. The
+systematik table and the columns of the usage tables that reference
+it are copied into a SQLite file. The GUI works on the copy, which
+is brought up to date whenever the central database is reachable.
+'''
+import logging
+import os
+import time
+from collections import Counter
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.engine.create import create_engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.expression import text, select, bindparam
+from asb_systematik.SystematikDao import SystematikDao, SYSTEMATIK_TABLE, FETCH_BATCH_SIZE,\
+    ID_QUERY_BATCH_SIZE, USAGE_CHANGE_KEYS, node_to_row, create_nodes, REFERENCE_INDEX_STATEMENTS
+from asb_systematik.SystematikIdentifierParser import IdentifierParseError
+from asb_systematik.SystematikChangeTracking import install_change_tracking
+from asb_systematik.SystematikInstrumentation import INSTRUMENTATION
+
+# Table, key column and the copied columns. sverweis has no key,
+# its rows are compared as a multiset.
+REPLICA_TABLES = (
+    ('broschueren', 'id', ('titel', 'systematik1', 'systematik2')),
+    ('zeitschriften', 'id', ('titel', 'systematik1', 'systematik2', 'systematik3')),
+    ('dokument', 'hauptnr', ('standort',)),
+    ('sverweis', None, ('hauptnr', 'systematik', 'roemisch', 'sub'))
+)
+
+REPLICA_STATEMENTS = (
+    "create table if not exists replica_state (name varchar primary key, value integer)",
+    "create table if not exists broschueren (id integer primary key, titel varchar, " +
+    "systematik1 varchar, systematik2 varchar)",
+    "create table if not exists zeitschriften (id integer primary key, titel varchar, " +
+    "systematik1 varchar, systematik2 varchar, systematik3 varchar)",
+    "create table if not exists dokument (hauptnr integer primary key, standort varchar)",
+    "create table if not exists sverweis (hauptnr integer, systematik varchar, roemisch integer, sub integer)",
+    "create index if not exists systematik_identifier on systematik (punkt, roemisch, sub)"
+) + REFERENCE_INDEX_STATEMENTS
+
+logger = logging.getLogger(__name__)
+
+# Like the change poller: entries of the change log may become
+# visible out of order, so the last ones are read again
+OVERLAP = 100
+
+class ReadOnlyReplicaException(Exception):
+    pass
+
+class ReplicaNotInitializedException(Exception):
+    pass
+
+class SystematikReplica:
+    """
+    Synchronizes the local copy with the primary database. For tables
+    with a change log in the primary database (see
+    SystematikChangeTracking) only the logged rows are read. Otherwise
+    the whole table is compared with the copy, the usage tables only
+    every full_sync_interval seconds. Only rows that differ from the
+    copy are written.
+
+    Rows of the systematik table with a malformed identifier are not
+    copied. They are logged and listed in malformed_rows, as (id,
+    error), after a comparison.
+
+    The copy has a change log of its own, so the change poller of the
+    GUI picks up what the synchronization changed.
+    """
+
+    def __init__(self, replica_engine: Engine, primary_dao: SystematikDao, full_sync_interval=600):
+
+        self.replica_engine = replica_engine
+        self.primary_dao = primary_dao
+        self.full_sync_interval = full_sync_interval
+        self.last_full_sync = None
+        self.malformed_rows = []
+
+    def create_schema(self):
+
+        SYSTEMATIK_TABLE.create(self.replica_engine, checkfirst=True)
+        with self.replica_engine.begin() as connection:
+            for statement in REPLICA_STATEMENTS:
+                connection.execute(text(statement))
+        install_change_tracking(self.replica_engine)
+
+    def get_state(self, connection, name):
+
+        return connection.execute(text("select value from replica_state where name = :name"),
+                                  {'name': name}).scalar()
+
+    def set_state(self, connection, name, value):
+
+        connection.execute(text("insert or replace into replica_state (name, value) values (:name, :value)"),
+                           {'name': name, 'value': value})
+
+    def is_initialized(self, connection):
+
+        return self.get_state(connection, 'synchronized') is not None
+
+    def sync(self, connection, full=None):
+        """
+        Brings the copy up to date, in the transaction of the given
+        connection to the copy. With full=None the usage tables are
+        compared only after full_sync_interval seconds. Returns the
+        number of written rows. Raises SQLAlchemyError if the primary
+        database is not reachable.
+        """
+
+        if full is None:
+            full = self.last_full_sync is None or time.time() - self.last_full_sync > self.full_sync_interval
+        with self.primary_dao.unit_of_work():
+            written = self.sync_systematik(connection, full)
+            written += self.sync_usages(connection, full)
+            if full:
+                self.last_full_sync = time.time()
+        self.set_state(connection, 'synchronized', int(time.time()))
+        return written
+
+    def sync_systematik(self, connection, compare=True):
+        """
+        Synchronizes the systematik table. Without change log in
+        the primary database this needs a comparison of all rows,
+        which is skipped if compare is False.
+        """
+
+        with self.primary_dao.unit_of_work() as primary_connection:
+            if not self.primary_dao.has_change_tracking():
+                return self._compare_systematik(connection, primary_connection) if compare else 0
+            watermark = self.get_state(connection, 'watermark')
+            if watermark is None or compare:
+                new_watermark = self.primary_dao.fetch_watermark()
+                written = self._compare_systematik(connection, primary_connection)
+            else:
+                new_watermark, changes = self.primary_dao.fetch_changes_since(max(0, watermark - OVERLAP))
+                new_watermark = max(watermark, new_watermark)
+                written = self._apply_changes(connection, changes)
+            self.set_state(connection, 'watermark', new_watermark)
+        return written
+
+    def sync_usages(self, connection, compare=True):
+        """
+        Synchronizes the usage tables. Without change log in the
+        primary database the tables are compared, which is skipped
+        if compare is False. With change log they are compared only
+        on the first synchronization and when the entries after the
+        watermark of the copy have been purged.
+        """
+
+        with self.primary_dao.unit_of_work() as primary_connection:
+            if not self.primary_dao.has_usage_change_tracking():
+                return self._compare_usage_tables(connection, primary_connection) if compare else 0
+            watermark = self.get_state(connection, 'usage_watermark')
+            log_start = self.primary_dao.fetch_usage_log_start()
+            if watermark is None or (log_start is not None and log_start > watermark + 1):
+                new_watermark = self.primary_dao.fetch_usage_watermark()
+                written = self._compare_usage_tables(connection, primary_connection)
+            else:
+                new_watermark, changed_keys = self.primary_dao.fetch_usage_changes_since(max(0, watermark - OVERLAP))
+                new_watermark = max(watermark, new_watermark)
+                written = 0
+                for table, key, columns in REPLICA_TABLES:
+                    written += self._copy_rows(connection, primary_connection, table, key, columns,
+                                               changed_keys.get(table, ()))
+            self.set_state(connection, 'usage_watermark', new_watermark)
+        return written
+
+    def _apply_changes(self, connection, changes):
+
+        rows = dict([(change.systematik_id, None if change.is_deleted() else node_to_row(change.node))
+                     for change in changes])
+        statement = select([SYSTEMATIK_TABLE]).where(SYSTEMATIK_TABLE.c.id.in_(bindparam('ids', expanding=True)))
+        ids = sorted(rows.keys())
+        local_rows = {}
+        for start in range(0, len(ids), ID_QUERY_BATCH_SIZE):
+            for row in connection.execute(statement, {'ids': ids[start:start + ID_QUERY_BATCH_SIZE]}):
+                local_rows[row[0]] = tuple(row)
+        # Changes read again because of the overlap are mostly in the copy already
+        deleted = [{'id': row_id} for row_id, row in rows.items() if row is None and row_id in local_rows]
+        changed = [row for row in rows.values() if row is not None and local_rows.get(row[0]) != row]
+        if len(deleted) > 0:
+            connection.execute(text("delete from systematik where id = :id"), deleted)
+        self._replace_systematik_rows(connection, changed)
+        return len(deleted) + len(changed)
+
+    def _replace_systematik_rows(self, connection, rows):
+
+        if len(rows) == 0:
+            return
+        columns = [column.name for column in SYSTEMATIK_TABLE.columns]
+        connection.execute(text("insert or replace into systematik (%s) values (%s)" %
+                                (", ".join(columns), ", ".join([":%s" % column for column in columns]))),
+                           [dict(zip(columns, row)) for row in rows])
+
+    def copy_nodes(self, connection, nodes):
+        """
+        Writes nodes that have just been written to the primary
+        database into the copy. Only the ids of nodes without id
+        are read from the primary database.
+        """
+
+        missing = [node.identifier for node in nodes if node.id is None]
+        ids = self.primary_dao.fetch_ids(missing) if len(missing) > 0 else {}
+        rows = []
+        for node in nodes:
+            row = node_to_row(node)
+            if row[0] is None:
+                row = (ids.get(node.identifier),) + row[1:]
+            if row[0] is not None:
+                rows.append(row)
+        self._replace_systematik_rows(connection, rows)
+
+    def _compare_systematik(self, connection, primary_connection):
+
+        local_rows = dict([(row[0], tuple(row)) for row in connection.execute(select([SYSTEMATIK_TABLE]))])
+        changed = []
+        self.malformed_rows = []
+        statement = "select %s from systematik" % ", ".join([column.name for column in SYSTEMATIK_TABLE.columns])
+        for row in self._stream(primary_connection, statement):
+            try:
+                row = node_to_row(next(create_nodes((row,))))
+            except IdentifierParseError as e:
+                # Left out like a deleted row, an older copy is removed
+                logger.warning("Fehlerhafter Systematikpunkt mit id %d wird nicht kopiert: %s", row[0], e)
+                self.malformed_rows.append((row[0], e.message))
+                continue
+            if local_rows.pop(row[0], None) != row:
+                changed.append(row)
+        if len(local_rows) > 0:
+            connection.execute(text("delete from systematik where id = :id"),
+                               [{'id': row_id} for row_id in local_rows.keys()])
+        self._replace_systematik_rows(connection, changed)
+        return len(changed) + len(local_rows)
+
+    def _stream(self, connection, statement):
+
+        result = connection.execution_options(stream_results=True).execute(text(statement))
+        try:
+            while True:
+                rows = result.fetchmany(FETCH_BATCH_SIZE)
+                if len(rows) == 0:
+                    break
+                for row in rows:
+                    yield tuple(row)
+        finally:
+            result.close()
+
+    def _compare_usage_tables(self, connection, primary_connection):
+
+        written = 0
+        for table, key, columns in REPLICA_TABLES:
+            written += self._compare_table(connection, primary_connection, table, key, columns)
+        return written
+
+    def _get_columns(self, key, columns):
+
+        if key is None:
+            return columns
+        return (key,) + columns
+
+    def _compare_table(self, connection, primary_connection, table, key, columns):
+
+        statement = "select %s from %s" % (", ".join(self._get_columns(key, columns)), table)
+        return self._write_differences(connection, table, key, columns, self._stream(connection, statement),
+                                       self._stream(primary_connection, statement))
+
+    def _copy_rows(self, connection, primary_connection, table, key, columns, row_keys):
+        """
+        Compares and copies the rows with the given keys of the
+        change log (see USAGE_CHANGE_KEYS).
+        """
+
+        statement = text("select %s from %s where %s in :row_keys" % (
+            ", ".join(self._get_columns(key, columns)), table, dict(USAGE_CHANGE_KEYS)[table])).\
+            bindparams(bindparam('row_keys', expanding=True))
+        row_keys = sorted([row_key for row_key in row_keys if row_key is not None])
+        written = 0
+        for start in range(0, len(row_keys), ID_QUERY_BATCH_SIZE):
+            parameters = {'row_keys': row_keys[start:start + ID_QUERY_BATCH_SIZE]}
+            local_rows = [tuple(row) for row in connection.execute(statement, parameters)]
+            primary_rows = [tuple(row) for row in primary_connection.execute(statement, parameters)]
+            written += self._write_differences(connection, table, key, columns, local_rows, primary_rows)
+        return written
+
+    def _write_differences(self, connection, table, key, columns, local_rows, primary_rows):
+        """
+        Turns local_rows in the copy into primary_rows. The local rows
+        are read completely before the first primary row. Rows with key
+        are compared by key. Rows without key are compared as multiset:
+        surplus copies are deleted, missing ones inserted. Returns the
+        number of written rows.
+        """
+
+        if key is None:
+            surplus = Counter(local_rows)
+            surplus.subtract(primary_rows)
+            missing = list((-surplus).elements())
+            surplus = +surplus
+            if len(surplus) > 0:
+                # "is" matches null values, too
+                condition = " and ".join(["%s is :%s" % (column, column) for column in columns])
+                connection.execute(text("delete from %s where rowid in (select rowid from %s where %s limit :surplus)" %
+                                        (table, table, condition)),
+                                   [dict(list(zip(columns, row)) + [('surplus', count)]) for row, count in surplus.items()])
+            self._insert_rows(connection, table, columns, missing)
+            return sum(surplus.values()) + len(missing)
+
+        local_rows = dict([(row[0], row) for row in local_rows])
+        changed = []
+        for row in primary_rows:
+            if local_rows.pop(row[0], None) != row:
+                changed.append(row)
+        if len(local_rows) > 0:
+            connection.execute(text("delete from %s where %s = :key" % (table, key)),
+                               [{'key': row_key} for row_key in local_rows.keys()])
+        self._insert_rows(connection, table, (key,) + columns, changed, "insert or replace")
+        return len(changed) + len(local_rows)
+
+    def _insert_rows(self, connection, table, columns, rows, command="insert"):
+
+        if len(rows) == 0:
+            return
+        connection.execute(text("%s into %s (%s) values (%s)" %
+                                (command, table, ", ".join(columns), ", ".join([":%s" % column for column in columns]))),
+                           [dict(zip(columns, row)) for row in rows])
+
+class SystematikReplicaDao(SystematikDao):
+    """
+    Reads from the local copy. Writes are refused or, with
+    route_writes, executed on the primary database and then
+    synchronized into the copy.
+    """
+
+    def __init__(self, engine: Engine, replica: SystematikReplica, route_writes=False):
+
+        super().__init__(engine)
+        self.replica = replica
+        self.route_writes = route_writes
+        self.online = True
+
+    def sync(self, full=None):
+
+        with self.unit_of_work() as connection:
+            return self.replica.sync(connection, full)
+
+    def try_sync(self, full=None):
+        """
+        Synchronizes if the primary database is reachable. Returns
+        False if it is not, the copy is used as it is.
+        """
+
+        try:
+            self.sync(full)
+        except SQLAlchemyError as e:
+            if self.online:
+                logger.warning("Zentrale Datenbank nicht erreichbar, die lokale Kopie wird verwendet: %s", e)
+            self.online = False
+            return False
+        self.online = True
+        return True
+
+    def _write(self, method_name, argument, nodes):
+
+        if not self.route_writes:
+            raise ReadOnlyReplicaException("Die lokale Kopie der Systematik kann nicht geändert werden")
+        result = getattr(self.replica.primary_dao, method_name)(argument)
+        # Only the written rows are copied. A synchronization would
+        # compare the whole table over the slow connection if the
+        # primary database has no change log.
+        with self.unit_of_work() as connection:
+            if method_name == 'delete_node':
+                self._execute('delete_node', self._get_key_parameters(argument.identifier))
+            else:
+                self.replica.copy_nodes(connection, nodes)
+        return result
+
+    def insert_node(self, node):
+
+        return self._write('insert_node', node, [node])
+
+    def insert_nodes(self, nodes):
+
+        nodes = list(nodes)
+        return self._write('insert_nodes', nodes, nodes)
+
+    def update_nodes(self, nodes):
+
+        nodes = list(nodes)
+        return self._write('update_nodes', nodes, nodes)
+
+    def upsert_nodes(self, nodes):
+
+        nodes = list(nodes)
+        return self._write('upsert_nodes', nodes, nodes)
+
+    def delete_node(self, node):
+
+        return self._write('delete_node', node, [node])
+
+    def update_node(self, node):
+
+        return self._write('update_node', node, [node])
+
+INSTRUMENTATION.instrument_class(SystematikReplicaDao, 'dao')
+
+def create_replica_dao(primary_engine: Engine, replica_path, route_writes=False):
+    """
+    The dao for the local copy in replica_path. On the first start
+    the primary database has to be reachable.
+    """
+
+    replica_engine = create_engine("sqlite:///%s" % os.path.abspath(replica_path))
+    replica = SystematikReplica(replica_engine, SystematikDao(primary_engine),
+                                int(os.environ.get('DB_REPLICA_SYNC_INTERVAL', '600')))
+    replica.create_schema()
+    dao = SystematikReplicaDao(replica_engine, replica, route_writes)
+    if not dao.try_sync(True):
+        with dao.unit_of_work() as connection:
+            if not replica.is_initialized(connection):
+                raise ReplicaNotInitializedException(
+                    "Die lokale Kopie %s ist leer und die zentrale Datenbank nicht erreichbar" % replica_path)
+    return dao
@@ -0,0 +1,70 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import logging
+from PyQt5.QtCore import QObject, QTimer
+from injector import singleton, inject
+from asb_systematik.SystematikDao import SystematikDao
+from asb_systematik.SystematikDbWorker import SystematikDbWorker
+from asb_systematik.SystematikChangePoller import SystematikChangePoller
+from asb_systematik.SystematikReplica import SystematikReplicaDao
+
+logger = logging.getLogger(__name__)
+
+@singleton
+class SystematikReplicaSyncer(QObject):
+    """
+    Brings the local copy (see SystematikReplica) up to date in the
+    background, on its own timer. The change poller reads what the
+    synchronization wrote from the change log of the copy. Without
+    local copy nothing happens.
+    """
+
+    SYNC_INTERVAL_MS = 60 * 1000
+
+    @inject
+    def __init__(self, dao: SystematikDao, db_worker: SystematikDbWorker, change_poller: SystematikChangePoller):
+
+        super().__init__()
+        self.dao = dao
+        self.db_worker = db_worker
+        self.change_poller = change_poller
+        self._task = None
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.sync)
+
+    def is_active(self):
+
+        return isinstance(self.dao, SystematikReplicaDao)
+
+    def start(self, interval=None):
+
+        if not self.is_active():
+            return
+        if interval is None:
+            interval = self.SYNC_INTERVAL_MS
+        self.timer.start(interval)
+
+    def stop(self):
+
+        self.timer.stop()
+
+    def sync(self):
+
+        if not self.is_active() or (self._task is not None and not self._task.done):
+            return
+        # try_sync() logs when the primary database is not reachable
+        self._task = self.db_worker.submit(lambda dao, task: dao.try_sync(),
+                                           self._synced, self._sync_failed)
+
+    def _synced(self, online):
+
+        if online:
+            self.change_poller.poll()
+
+    def _sync_failed(self, exception):
+
+        # Tried again with the next interval
+        logger.warning("Fehler beim Abgleich der lokalen Kopie: %s", exception)
@@ -4,14 +4,27 @@ Created on 27.07.2021
 @author: michael
 '''
 from asb_systematik.SystematikDao import SystematikTree, SystematikDao,\
-    AlexandriaDbModule
+    AlexandriaDbModule, SystematikIdentifier, SystematikNode, TRAVERSAL_PREORDER
+import argparse
 import datetime
+import hashlib
+import io
+import marshal
+import os
+import sys
 import locale
-import roman
+from concurrent.futures.process import ProcessPoolExecutor
 from injector import Injector
+from asb_systematik.SystematikIdentifierParser import to_roman
+from asb_systematik.SystematikSnapshot import SystematikSnapshotStore,\
+    get_cache_directory
 
 locale.setlocale(locale.LC_ALL, 'de_DE.UTF-8')
 
+# Change this when the LaTeX of the nodes changes, so the
+# cached parts are not used any more
+TEX_PART_VERSION = 1
+
 def tex_sanitizing(text: str) -> str:
     
     text = text.replace("&", "\\&")
@@ -19,12 +32,14 @@ def tex_sanitizing(text: str) -> str:
     text = text.replace('"', "``")
     return text
 
-class SystematikTexTree(SystematikTree):
-
-
-    def __init__(self, node_hash):
-        
-        super().__init__(node_hash)
+class SystematikTexRenderer:
+    """
+    Creates the LaTeX document fragment by fragment. The nodes have
+    to be passed in preorder, the renderer keeps track of the open
+    lists.
+    """
+    
+    def __init__(self):
         
         self.itemlist_open = False
         self.descriptionlist_open = False
@@ -58,64 +73,263 @@ class SystematikTexTree(SystematikTree):
         
         return tex
 
-    def _get_string(self, node):
+    def get_closing_tex(self):
+        """
+        Closes the open lists, the same way get_node_tex() does
+        before a normal point.
+        """
+        
+        tex = ""
+        if self.itemlist_open:
+            tex += "\n\\end{itemize}\n"
+            self.itemlist_open = False
+        if self.descriptionlist_open:
+            tex += "\n\\end{description}\n"
+            self.descriptionlist_open = False
+        return tex
+
+    def get_node_tex(self, node):
+        """
+        The LaTeX fragment of a single node, including the commands
+        that close or open the surrounding lists.
+        """
         
-        string = ""
+        fragments = []
 
         if not node.is_sub() and self.itemlist_open:
-            string += "\n\\end{itemize}\n"
+            fragments.append("\n\\end{itemize}\n")
             self.itemlist_open = False
             
         if not node.is_roman() and self.descriptionlist_open:
-            string += "\n\\end{description}\n"
+            fragments.append("\n\\end{description}\n")
             self.descriptionlist_open = False
 
         if node.is_sub():
             if not self.itemlist_open:
-                string += "\n\\begin{itemize}\n"
+                fragments.append("\n\\begin{itemize}\n")
                 self.itemlist_open = True
-            string += "\\item %s\n\n" % tex_sanitizing(node.beschreibung)
+            fragments.append("\\item %s\n\n" % tex_sanitizing(node.beschreibung))
         
         elif node.is_roman():
             if not self.descriptionlist_open:
-                string += "\n\\begin{description}\n"
+                fragments.append("\n\\begin{description}\n")
                 self.descriptionlist_open = True
-            string += "\\item[{%s}:] %s\n\n" % (roman.toRoman(node.identifier.roemisch), tex_sanitizing(node.beschreibung))
+            fragments.append("\\item[{%s}:] %s\n\n" % (to_roman(node.identifier.roemisch), tex_sanitizing(node.beschreibung)))
         
         else:
             depth = node.get_depth()
             if depth == 0:
-                string += """\\title{%s}
+                fragments.append("""\\title{%s}
 \\date{%s}
 \\maketitle
-""" % (tex_sanitizing(node.beschreibung), datetime.date.today().strftime("%d. %B %Y"))
+""" % (tex_sanitizing(node.beschreibung), datetime.date.today().strftime("%d. %B %Y")))
             elif depth == 1:
-                string += "\pagebreak{}\part*{%s: %s}\n\setcounter{page}{1}\n\ihead{%s: %s}\n" % (node.identifier, tex_sanitizing(node.beschreibung), node.identifier, tex_sanitizing(node.beschreibung))
+                fragments.append("\\pagebreak{}\\part*{%s: %s}\n\\setcounter{page}{1}\n\\ihead{%s: %s}\n" % (node.identifier, tex_sanitizing(node.beschreibung), node.identifier, tex_sanitizing(node.beschreibung)))
             elif depth == 2:
-                string += "\section*{%s: %s}\n" % (node.identifier, tex_sanitizing(node.beschreibung))
+                fragments.append("\\section*{%s: %s}\n" % (node.identifier, tex_sanitizing(node.beschreibung)))
             elif depth == 3:
-                string += "\subsection*{%s: %s}\n" % (node.identifier, tex_sanitizing(node.beschreibung))
+                fragments.append("\\subsection*{%s: %s}\n" % (node.identifier, tex_sanitizing(node.beschreibung)))
             elif depth == 4:
-                string += "\subsubsection*{%s: %s}\n" % (node.identifier, tex_sanitizing(node.beschreibung))
+                fragments.append("\\subsubsection*{%s: %s}\n" % (node.identifier, tex_sanitizing(node.beschreibung)))
             elif depth == 5:
-                string += "\paragraph*{%s: %s}\n" % (node.identifier, tex_sanitizing(node.beschreibung))
+                fragments.append("\\paragraph*{%s: %s}\n" % (node.identifier, tex_sanitizing(node.beschreibung)))
             else:
-                string += "\subparagraph*{%s: %s}\n" % (node.identifier, tex_sanitizing(node.beschreibung))
+                fragments.append("\\subparagraph*{%s: %s}\n" % (node.identifier, tex_sanitizing(node.beschreibung)))
             
-        for child in node.children:
-            string += self._get_string(child)
-        return string
+        return "".join(fragments)
+
+class SystematikTexTree(SystematikTree, SystematikTexRenderer):
+
+
+    def __init__(self, node_hash):
+        
+        super().__init__(node_hash)
+        
+        self.itemlist_open = False
+        self.descriptionlist_open = False
+    
+    def write(self, output, start_node=None):
+        """
+        Writes the document to the file-like object output, node by
+        node in preorder. With start_node only this subtree is written
+        (below the title of the whole Systematik).
+        """
+        
+        self.itemlist_open = False
+        self.descriptionlist_open = False
+        output.write(self.get_prefix())
+        if start_node is not None and start_node is not self.rootnode:
+            output.write(self.get_node_tex(self.rootnode))
+        for node in self.traverse(TRAVERSAL_PREORDER, start_node):
+            output.write(self.get_node_tex(node))
+        output.write(self.get_postfix())
+    
+    def write_parallel(self, output, part_cache=None, max_workers=None):
+        """
+        Writes the same document as write(), but renders every part
+        (the subtree of a node on depth 1) in its own process. Parts
+        are cached by their content, only changed parts are rendered
+        again. Parts no longer in the document are removed from the
+        cache.
+        """
+        
+        self.itemlist_open = False
+        self.descriptionlist_open = False
+        output.write(self.get_prefix())
+        output.write(self.get_node_tex(self.rootnode))
+        
+        parts = [get_part_records(node) for node in self.rootnode.children]
+        keys = [get_part_key(records) for records in parts]
+        rendered = {}
+        if part_cache is not None:
+            for key in keys:
+                if key not in rendered:
+                    part = part_cache.get(key)
+                    if part is not None:
+                        rendered[key] = part
+        missing = dict([(key, records) for key, records in zip(keys, parts) if key not in rendered])
+        if len(missing) > 0:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                for key, part in zip(missing.keys(), executor.map(render_part, missing.values())):
+                    rendered[key] = part
+                    if part_cache is not None:
+                        part_cache.put(key, part)
+        
+        for key in keys:
+            tex, itemlist_open, descriptionlist_open = rendered[key]
+            # The part starts with a normal point that closes the lists
+            # of the part before, like get_node_tex() would do
+            output.write(self.get_closing_tex())
+            output.write(tex)
+            self.itemlist_open = itemlist_open
+            self.descriptionlist_open = descriptionlist_open
+        output.write(self.get_postfix())
+        if part_cache is not None:
+            part_cache.purge(keys)
     
     def __str__(self):
         
-        return self.get_prefix() + self._get_string(self.rootnode) + self.get_postfix()
+        output = io.StringIO()
+        self.write(output)
+        return output.getvalue()
+
+def get_part_records(node):
+    """
+    The subtree of node as flat list of (identifier, beschreibung)
+    tuples in preorder, cheap to hash and to send to another process.
+    """
+    
+    records = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        records.append(("%s" % node.identifier, node.beschreibung))
+        stack.extend(reversed(node.children))
+    return records
+
+def get_part_key(records):
+    
+    part_hash = hashlib.sha256(("%d" % TEX_PART_VERSION).encode('utf-8'))
+    for identifier, beschreibung in records:
+        part_hash.update(b'\0')
+        part_hash.update(identifier.encode('utf-8'))
+        part_hash.update(b'\0')
+        part_hash.update(beschreibung.encode('utf-8'))
+    return part_hash.hexdigest()
+
+def render_part(records):
+    """
+    Runs in the worker processes. Returns the LaTeX of the part
+    and the state of the lists at the end of the part.
+    """
+    
+    renderer = SystematikTexRenderer()
+    tex = "".join([renderer.get_node_tex(SystematikNode(SystematikIdentifier(identifier), beschreibung))
+                   for identifier, beschreibung in records])
+    return tex, renderer.itemlist_open, renderer.descriptionlist_open
+
+class SystematikTexPartCache:
+    """
+    One file per rendered part, named after the content hash. Files
+    that can't be read are rendered again.
+    """
+    
+    def __init__(self, directory=None):
+        
+        if directory is None:
+            directory = os.path.join(get_cache_directory(), 'tex')
+        self.directory = directory
+        
+    def _get_path(self, key):
+        
+        return os.path.join(self.directory, "%s.part" % key)
+    
+    def get(self, key):
+        
+        try:
+            with open(self._get_path(key), 'rb') as part_file:
+                tex, itemlist_open, descriptionlist_open = marshal.load(part_file)
+        except (OSError, ValueError, EOFError, TypeError):
+            return None
+        return tex, itemlist_open, descriptionlist_open
+    
+    def put(self, key, part):
+        
+        path = self._get_path(key)
+        temporary_path = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temporary_path, 'wb') as part_file:
+                marshal.dump(tuple(part), part_file)
+            os.replace(temporary_path, path)
+        except OSError:
+            return False
+        return True
+    
+    def purge(self, keep_keys):
+        """
+        Removes the cached parts that are not in keep_keys.
+        """
+        
+        keep_files = set(["%s.part" % key for key in keep_keys])
+        try:
+            file_names = os.listdir(self.directory)
+        except OSError:
+            return
+        for file_name in file_names:
+            if file_name.endswith('.part') and file_name not in keep_files:
+                try:
+                    os.remove(os.path.join(self.directory, file_name))
+                except OSError:
+                    pass
 
 
 if __name__ == '__main__':
  
+    parser = argparse.ArgumentParser(description="Erzeugt die LaTeX-Fassung der Systematik")
+    parser.add_argument('-o', '--output', default="/tmp/systematik.tex", help="Ausgabedatei, - für die Standardausgabe")
+    parser.add_argument('-s', '--subtree', help="Nur diesen Systematikpunkt mit seinen Unterpunkten ausgeben")
+    parser.add_argument('-p', '--parallel', action='store_true',
+                        help="Teile parallel erzeugen, unveränderte Teile aus dem Cache nehmen")
+    parser.add_argument('-j', '--jobs', type=int, help="Anzahl der Prozesse für --parallel")
+    args = parser.parse_args()
+    
     injector = Injector([AlexandriaDbModule])
     dao = injector.get(SystematikDao)
-    tree = dao.fetch_tree(SystematikTexTree)
-    tex_file = open("/tmp/systematik.tex", "w")
-    tex_file.write("%s" % tree)
-    tex_file.close()
+    tree = injector.get(SystematikSnapshotStore).fetch_tree(dao, SystematikTexTree)
+    start_node = None
+    if args.subtree is not None:
+        start_node = tree.find_node(SystematikIdentifier(args.subtree))
+        if start_node is None:
+            print("Systematikpunkt %s existiert nicht" % args.subtree)
+            sys.exit(1)
+    if args.parallel and start_node is None:
+        part_cache = SystematikTexPartCache()
+        write = lambda output: tree.write_parallel(output, part_cache, args.jobs)
+    else:
+        write = lambda output: tree.write(output, start_node)
+    if args.output == '-':
+        write(sys.stdout)
+    else:
+        with open(args.output, "w") as tex_file:
+            write(tex_file)
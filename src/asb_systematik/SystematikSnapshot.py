@@ -0,0 +1,134 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import hashlib
+import marshal
+import os
+import struct
+import zlib
+from injector import singleton
+from asb_systematik.SystematikDao import SystematikDao, create_nodes, node_to_row,\
+    TRAVERSAL_PREORDER
+
+SNAPSHOT_MAGIC = b'ASBSYST'
+SNAPSHOT_FORMAT_VERSION = 1
+
+# magic, format version, marshal version, fingerprint (count, max id, checksum)
+SNAPSHOT_HEADER = struct.Struct('>7sHHqqq')
+
+def get_cache_directory():
+    """
+    SYSTEMATIK_SNAPSHOT_DIR or ~/.cache/asb_systematik.
+    """
+
+    return os.environ.get('SYSTEMATIK_SNAPSHOT_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'asb_systematik'))
+
+def get_default_snapshot_path():
+    """
+    One snapshot per database in the cache directory.
+    """
+
+    directory = get_cache_directory()
+    database = hashlib.sha1(os.environ['DB_URL'].encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directory, "systematik-%s.snapshot" % database)
+
+@singleton
+class SystematikSnapshotStore:
+    """
+    Keeps the rows of the last tree read from the database in a local
+    file: a fixed header with the fingerprint of the table, followed by
+    the zlib compressed marshal dump of the rows in tree order. The
+    snapshot is valid as long as SystematikDao.fetch_fingerprint()
+    returns the same fingerprint. A damaged or outdated file is just
+    ignored.
+    """
+
+    def __init__(self, path=None):
+
+        if path is None:
+            path = get_default_snapshot_path()
+        self.path = path
+
+    def read_fingerprint(self):
+
+        try:
+            with open(self.path, 'rb') as snapshot_file:
+                header = self._read_header(snapshot_file)
+        except (OSError, struct.error):
+            return None
+        return header
+
+    def _read_header(self, snapshot_file):
+
+        magic, format_version, marshal_version, count, max_id, checksum = \
+            SNAPSHOT_HEADER.unpack(snapshot_file.read(SNAPSHOT_HEADER.size))
+        if magic != SNAPSHOT_MAGIC or format_version != SNAPSHOT_FORMAT_VERSION or marshal_version != marshal.version:
+            return None
+        return (count, max_id, checksum)
+
+    def load_tree(self, tree_implementation, fingerprint=None):
+        """
+        Returns the tree of the snapshot or None if there is no usable
+        snapshot. If fingerprint is given, the snapshot must match it.
+        """
+
+        try:
+            with open(self.path, 'rb') as snapshot_file:
+                header = self._read_header(snapshot_file)
+                if header is None or (fingerprint is not None and header != tuple(fingerprint)):
+                    return None
+                rows = marshal.loads(zlib.decompress(snapshot_file.read()))
+        except (OSError, struct.error, zlib.error, ValueError, EOFError, TypeError):
+            return None
+        return tree_implementation(create_nodes(rows))
+
+    def save(self, fingerprint, tree):
+
+        rows = [node_to_row(node) for node in tree.traverse(TRAVERSAL_PREORDER) if node is not tree.rootnode]
+        rows.extend([node_to_row(node) for node in tree.orphans])
+        rows.extend([node_to_row(node) for node in tree.build_result.duplicates])
+        count, max_id, checksum = fingerprint
+        data = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, marshal.version,
+                                    count, max_id, checksum) +\
+            zlib.compress(marshal.dumps(rows))
+        temporary_path = "%s.%d.tmp" % (self.path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temporary_path, 'wb') as snapshot_file:
+                snapshot_file.write(data)
+            os.replace(temporary_path, self.path)
+        except OSError:
+            # Without snapshot the next start reads the database
+            return False
+        return True
+
+    def fetch_tree(self, dao: SystematikDao, tree_implementation):
+        """
+        Returns the tree from the snapshot if it matches the database,
+        otherwise reads it from the database and writes a new snapshot.
+        """
+
+        with dao.unit_of_work():
+            fingerprint = dao.fetch_fingerprint()
+            tree = self.load_tree(tree_implementation, fingerprint)
+            if tree is None:
+                tree = dao.fetch_tree(tree_implementation)
+                self.save(fingerprint, tree)
+        return tree
+
+    def refresh(self, dao: SystematikDao, tree_implementation):
+        """
+        Compares the snapshot with the database and returns the new tree
+        if the snapshot was outdated, otherwise None.
+        """
+
+        with dao.unit_of_work():
+            fingerprint = dao.fetch_fingerprint()
+            if self.read_fingerprint() == fingerprint:
+                return None
+            tree = dao.fetch_tree(tree_implementation)
+        self.save(fingerprint, tree)
+        return tree
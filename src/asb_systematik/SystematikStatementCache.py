@@ -0,0 +1,150 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import re
+import threading
+from sqlalchemy.sql.expression import text
+
+BIND_PATTERN = re.compile(r'%\((\w+)\)s')
+
+PREPARED_STATEMENTS_KEY = 'systematik_prepared_statements'
+
+class UnknownStatementException(Exception):
+    pass
+
+class SystematikStatementCache:
+    """
+    Builds every registered statement once with bind parameters and
+    reuses it. Reused statement objects are found in the compiled
+    cache of the engine, so executing a statement again skips the
+    compilation. hits and misses count the statement lookups,
+    compiled_hits and compiled_misses the compiled cache of the
+    engine.
+
+    With prepare set, statements are prepared on PostgreSQL servers
+    once per database connection (PREPARE) and run with EXECUTE.
+    Other databases, statements with expanding parameters and
+    streaming statements are executed normally: psycopg2 streams
+    with DECLARE ... CURSOR FOR, which does not accept EXECUTE.
+    """
+
+    def __init__(self, prepare=False):
+
+        self.prepare = prepare
+        self.hits = 0
+        self.misses = 0
+        self.prepared = 0
+        self.compiled_hits = 0
+        self.compiled_misses = 0
+        self._factories = {}
+        self._statements = {}
+        self._prepared_forms = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory, preparable=True):
+        """
+        factory is called without arguments on first use and
+        returns the statement.
+        """
+
+        self._factories[name] = (factory, preparable)
+
+    def get_statement(self, name):
+
+        statement = self._statements.get(name)
+        if statement is not None:
+            self.hits += 1
+            return statement
+        with self._lock:
+            statement = self._statements.get(name)
+            if statement is None:
+                try:
+                    factory = self._factories[name][0]
+                except KeyError:
+                    raise UnknownStatementException("Unbekanntes Statement: %s" % name)
+                statement = factory()
+                self._statements[name] = statement
+                self.misses += 1
+            else:
+                self.hits += 1
+        return statement
+
+    def execute(self, connection, name, parameters=None):
+
+        statement = self.get_statement(name)
+        if self.prepare and self._factories[name][1] and connection.dialect.name == 'postgresql' and \
+                not statement.get_execution_options().get('stream_results', False):
+            return self._execute_prepared(connection, name, statement, parameters)
+        return self._count(connection, statement, parameters)
+
+    def _count(self, connection, statement, parameters):
+
+        if parameters is None:
+            result = connection.execute(statement)
+        else:
+            result = connection.execute(statement, parameters)
+        if result.context.cache_hit == connection.dialect.CACHE_HIT:
+            self.compiled_hits += 1
+        else:
+            self.compiled_misses += 1
+        return result
+
+    def _execute_prepared(self, connection, name, statement, parameters):
+
+        prepare_sql, execute_statement = self._get_prepared_form(connection.dialect, name, statement)
+        # connection.connection.info lives as long as the database connection
+        prepared_names = connection.connection.info.setdefault(PREPARED_STATEMENTS_KEY, set())
+        if name not in prepared_names:
+            # Without parameters the driver does no % formatting
+            connection.execution_options(no_parameters=True).exec_driver_sql(prepare_sql)
+            prepared_names.add(name)
+            self.prepared += 1
+        return self._count(connection, execute_statement, parameters)
+
+    def _get_prepared_form(self, dialect, name, statement):
+        """
+        Translates the statement into a PREPARE statement with
+        positional parameters and the matching EXECUTE statement.
+        """
+
+        prepared_form = self._prepared_forms.get(name)
+        if prepared_form is not None:
+            return prepared_form
+
+        parameter_names = []
+
+        def replace_parameter(match):
+            parameter_name = match.group(1)
+            if parameter_name not in parameter_names:
+                parameter_names.append(parameter_name)
+            return "$%d" % (parameter_names.index(parameter_name) + 1)
+
+        sql = statement.compile(dialect=dialect).string
+        sql = BIND_PATTERN.sub(replace_parameter, sql).replace('%%', '%')
+        prepared_name = "systematik_%s" % name
+        prepare_sql = "PREPARE %s AS %s" % (prepared_name, sql)
+        if len(parameter_names) == 0:
+            execute_sql = "EXECUTE %s" % prepared_name
+        else:
+            execute_sql = "EXECUTE %s(%s)" % (prepared_name,
+                                              ", ".join([":%s" % parameter_name for parameter_name in parameter_names]))
+        prepared_form = (prepare_sql, text(execute_sql).execution_options(**statement.get_execution_options()))
+        self._prepared_forms[name] = prepared_form
+        return prepared_form
+
+    def get_statistics(self):
+
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'prepared': self.prepared,
+                'compiled_hits': self.compiled_hits,
+                'compiled_misses': self.compiled_misses,
+                'statements': len(self._statements)}
+
+    def clear(self):
+
+        with self._lock:
+            self._statements = {}
+            self._prepared_forms = {}
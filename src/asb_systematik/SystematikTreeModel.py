@@ -0,0 +1,685 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import time
+from PyQt5.QtCore import QAbstractItemModel, QModelIndex, Qt, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QTreeView, QAbstractItemView
+from asb_systematik.SystematikDao import SystematikTree, SystematikNode,\
+    SystematikUsage
+from asb_systematik.SystematikFilter import SystematikFilterEngine
+from asb_systematik.SystematikInstrumentation import INSTRUMENTATION
+
+def format_display_text(node: SystematikNode):
+
+    if node.beschreibung is None:
+        desc = "Keine Beschreibung!"
+    else:
+        desc = node.beschreibung
+
+    if node.kommentar is not None:
+        desc = "* %s" % desc
+
+    if node.startjahr is not None or node.endjahr is not None:
+        if node.startjahr is None:
+            desc = "%s (bis %d)" % (desc, node.endjahr)
+        elif node.endjahr is None:
+            desc = "%s (ab %d)" % (desc, node.startjahr)
+        elif node.endjahr == node.startjahr:
+            desc = "%s (%d)" % (desc, node.startjahr)
+        else:
+            desc = "%s (%d - %d)" % (desc, node.startjahr, node.endjahr)
+
+    return desc
+
+class NoSelectionException(Exception):
+
+    pass
+
+class SystematikNodeItem:
+    """
+    Editing access to the SystematikNode behind a GUI item, all
+    None values in the SystematikNode object need to be replaced
+    by empty strings. Subclasses update their display in
+    _display_changed().
+    """
+
+    NODE_TYPES = ("Gliederungspunkt", "Physischer Bestand", "Digitaler Bestand")
+    DIGITALISIERUNGS_STATUS = ("nicht digitalisiert", "teilweise digitalisiert", "vollständig digitalisiert")
+
+    def _display_changed(self):
+
+        pass
+
+    def set_description(self, new_description):
+
+        if new_description.strip() == "":
+            self.systematik_node.beschreibung = None
+        else:
+            self.systematik_node.beschreibung = new_description
+        self._display_changed()
+
+    def get_description(self):
+
+        if self.systematik_node.beschreibung is None:
+            return ""
+        else:
+            return self.systematik_node.beschreibung
+
+    def set_kommentar(self, new_comment):
+
+        if new_comment.strip() == "":
+            self.systematik_node.kommentar = None
+        else:
+            self.systematik_node.kommentar = new_comment
+        self._display_changed()
+
+    def get_kommentar(self):
+
+        if self.systematik_node.kommentar is None:
+            return ""
+        else:
+            return self.systematik_node.kommentar
+
+    def set_entfernt(self, new_entfernt):
+
+        if new_entfernt.strip() == "":
+            self.systematik_node.entfernt = None
+        else:
+            self.systematik_node.entfernt = new_entfernt
+        self._display_changed()
+
+    def get_entfernt(self):
+
+        if self.systematik_node.entfernt is None:
+            return ""
+        else:
+            return self.systematik_node.entfernt
+
+    def set_startjahr(self, new_startjahr):
+
+        self.systematik_node.startjahr = new_startjahr
+        self._display_changed()
+
+    def get_startjahr(self):
+
+        return self.systematik_node.startjahr
+
+    def set_endjahr(self, new_endjahr):
+
+        self.systematik_node.endjahr = new_endjahr
+        self._display_changed()
+
+    def get_endjahr(self):
+
+        return self.systematik_node.endjahr
+
+    def set_nodetype(self, nodetype):
+
+        self.systematik_node.nodetype = nodetype
+
+    def get_nodetype(self):
+
+        return self.systematik_node.nodetype
+
+    def _get_display_text(self):
+
+        return format_display_text(self.systematik_node)
+
+    beschreibung = property(get_description, set_description)
+    kommentar = property(get_kommentar, set_kommentar)
+    entfernt = property(get_entfernt, set_entfernt)
+    startjahr = property(get_startjahr, set_startjahr)
+    endjahr = property(get_endjahr, set_endjahr)
+    display_text = property(_get_display_text)
+    nodetype = property(get_nodetype, set_nodetype)
+
+class SystematikTreeModel(QAbstractItemModel):
+    """
+    Item model on top of a SystematikTree. The children of a node
+    become rows only when the view fetches them (usually on expanding
+    the parent), the display texts are formatted on first use and
+    cached until node_changed() is called for the node.
+    """
+
+    COLUMN_PUNKT, COLUMN_BESCHREIBUNG, COLUMN_VERWENDUNGEN = range(3)
+    HEADER_LABELS = ("Systematikpunkt", "Beschreibung", "Verwendungen")
+
+    def __init__(self, tree: SystematikTree, parent=None):
+
+        super().__init__(parent)
+        self._hidden = set()
+        self.usage_map = None
+        self._set_tree(tree)
+
+    def set_usage_map(self, usage_map):
+        """
+        Usage counts (see SystematikDao.fetch_usage_map) for
+        the third column.
+        """
+
+        self.usage_map = usage_map
+        for node in self.get_fetched_nodes():
+            rows = self._rows[node]
+            if len(rows) == 0:
+                continue
+            self.dataChanged.emit(self.createIndex(0, self.COLUMN_VERWENDUNGEN, rows[0]),
+                                  self.createIndex(len(rows) - 1, self.COLUMN_VERWENDUNGEN, rows[-1]))
+
+    def get_usage(self, node):
+        """
+        Returns the SystematikUsage of the node or None if
+        no usage map is set.
+        """
+
+        if self.usage_map is None:
+            return None
+        usage = self.usage_map.get(node.identifier)
+        if usage is None:
+            return SystematikUsage()
+        return usage
+
+    def _set_tree(self, tree):
+
+        self.tree = tree
+        # Rows of the fetched nodes
+        self._rows = {}
+        self._row_numbers = {}
+        self._display_texts = {}
+        self._store_rows(tree.rootnode, self._shown_children(tree.rootnode))
+
+    def set_tree(self, tree: SystematikTree):
+
+        self.beginResetModel()
+        self._hidden = set()
+        self._set_tree(tree)
+        self.endResetModel()
+
+    def set_visibility(self, changes):
+        """
+        Shows or hides nodes, changes are (node, visible) tuples as
+        returned by SystematikFilterResult.get_changed_nodes(). Only the
+        rows of fetched parents are adjusted, rows that are fetched later
+        pick up the visibility anyway.
+        """
+
+        parents = {}
+        for node, is_visible in changes:
+            if is_visible:
+                self._hidden.discard(node)
+            else:
+                self._hidden.add(node)
+            parents[node.parent] = True
+        for parent in parents:
+            if parent is not None:
+                self.refresh_children(parent)
+
+    def get_hidden_nodes(self):
+
+        return self._hidden
+
+    def _is_shown(self, node):
+
+        return node not in self._hidden
+
+    def _shown_children(self, node):
+
+        if len(self._hidden) == 0:
+            return list(node.children)
+        return [child for child in node.children if child not in self._hidden]
+
+    def _store_rows(self, node, rows):
+
+        self._rows[node] = rows
+        for row, child in enumerate(rows):
+            self._row_numbers[child] = row
+
+    def _forget_rows(self, node):
+
+        stack = [node]
+        while stack:
+            rows = self._rows.pop(stack.pop(), None)
+            if rows is not None:
+                stack.extend(rows)
+
+    def get_node(self, index: QModelIndex) -> SystematikNode:
+
+        if not index.isValid():
+            return self.tree.rootnode
+        return index.internalPointer()
+
+    def is_fetched(self, node):
+
+        return node in self._rows
+
+    def get_fetched_nodes(self):
+
+        return list(self._rows.keys())
+
+    def index_for_node(self, node, column=0) -> QModelIndex:
+        """
+        Returns the index of the node, the rows on the way down are
+        fetched if necessary. The index is invalid if the node is not
+        shown.
+        """
+
+        if node is None or node is self.tree.rootnode:
+            return QModelIndex()
+        path = []
+        while node is not self.tree.rootnode:
+            if node is None or not self._is_shown(node):
+                return QModelIndex()
+            path.append(node)
+            node = node.parent
+        index = QModelIndex()
+        for node in reversed(path):
+            parent_node = node.parent
+            if parent_node not in self._rows:
+                self.fetchMore(index)
+            if node not in self._row_numbers:
+                return QModelIndex()
+            index = self.createIndex(self._row_numbers[node], 0, node)
+        if column != 0:
+            index = self.createIndex(index.row(), column, node)
+        return index
+
+    def node_changed(self, node):
+
+        self._display_texts.pop(node, None)
+        if node.parent in self._rows and node in self._row_numbers:
+            row = self._row_numbers[node]
+            self.dataChanged.emit(self.createIndex(row, 0, node),
+                                  self.createIndex(row, len(self.HEADER_LABELS) - 1, node))
+
+    def refresh_children(self, node):
+        """
+        Adjusts the rows of a node after children have been added
+        or removed in the tree.
+        """
+
+        if node not in self._rows:
+            if node is not self.tree.rootnode and node.parent in self._rows and node in self._row_numbers:
+                # The expansion indicator might have changed
+                self.node_changed(node)
+            return
+        old_rows = self._rows[node]
+        new_rows = self._shown_children(node)
+        if old_rows == new_rows:
+            return
+        if node is self.tree.rootnode:
+            parent_index = QModelIndex()
+        else:
+            parent_index = self.index_for_node(node)
+
+        new_set = set(new_rows)
+        kept_rows = [row for row in old_rows if row in new_set]
+        old_set = set(kept_rows)
+        if kept_rows != [row for row in new_rows if row in old_set]:
+            # The order has changed, all rows are replaced
+            kept_rows = []
+            old_set = set()
+
+        # Removed from the end, so the row numbers of the runs still hold
+        rows = list(old_rows)
+        for first, last in reversed(self._get_runs(old_rows, old_set)):
+            self.beginRemoveRows(parent_index, first, last)
+            for removed in rows[first:last + 1]:
+                self._forget_rows(removed)
+                self._row_numbers.pop(removed, None)
+                self._display_texts.pop(removed, None)
+            del rows[first:last + 1]
+            self._store_rows(node, rows)
+            self.endRemoveRows()
+        for first, last in self._get_runs(new_rows, old_set):
+            self.beginInsertRows(parent_index, first, last)
+            rows[first:first] = new_rows[first:last + 1]
+            self._store_rows(node, rows)
+            self.endInsertRows()
+
+    def _get_runs(self, rows, kept):
+        """
+        (first, last) row numbers of the runs of rows not in kept.
+        """
+
+        runs = []
+        first = None
+        for row, child in enumerate(rows):
+            if child in kept:
+                if first is not None:
+                    runs.append((first, row - 1))
+                    first = None
+            elif first is None:
+                first = row
+        if first is not None:
+            runs.append((first, len(rows) - 1))
+        return runs
+
+    def index(self, row, column, parent=QModelIndex()):
+
+        rows = self._rows.get(self.get_node(parent))
+        if rows is None or row < 0 or row >= len(rows) or column < 0 or column >= len(self.HEADER_LABELS):
+            return QModelIndex()
+        return self.createIndex(row, column, rows[row])
+
+    def parent(self, index):
+
+        if not index.isValid():
+            return QModelIndex()
+        parent_node = index.internalPointer().parent
+        if parent_node is None or parent_node is self.tree.rootnode:
+            return QModelIndex()
+        return self.createIndex(self._row_numbers[parent_node], 0, parent_node)
+
+    def rowCount(self, parent=QModelIndex()):
+
+        if parent.column() > 0:
+            return 0
+        rows = self._rows.get(self.get_node(parent))
+        if rows is None:
+            return 0
+        return len(rows)
+
+    def columnCount(self, parent=QModelIndex()):
+
+        return len(self.HEADER_LABELS)
+
+    def hasChildren(self, parent=QModelIndex()):
+
+        if parent.column() > 0:
+            return False
+        node = self.get_node(parent)
+        rows = self._rows.get(node)
+        if rows is not None:
+            return len(rows) > 0
+        for child in node.children:
+            if self._is_shown(child):
+                return True
+        return False
+
+    def canFetchMore(self, parent):
+
+        node = self.get_node(parent)
+        return node not in self._rows and len(node.children) > 0
+
+    def fetchMore(self, parent):
+
+        node = self.get_node(parent)
+        if node in self._rows:
+            return
+        rows = self._shown_children(node)
+        if len(rows) == 0:
+            self._rows[node] = rows
+            return
+        self.beginInsertRows(parent, 0, len(rows) - 1)
+        self._store_rows(node, rows)
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        node = index.internalPointer()
+        if index.column() == self.COLUMN_PUNKT:
+            return "%s" % node.identifier
+        if index.column() == self.COLUMN_VERWENDUNGEN:
+            usage = self.get_usage(node)
+            if usage is None:
+                return ""
+            return "%d" % usage.get_total()
+        text = self._display_texts.get(node)
+        if text is None:
+            text = format_display_text(node)
+            self._display_texts[node] = text
+        return text
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADER_LABELS[section]
+        return None
+
+class SystematikTreeViewItem(SystematikNodeItem):
+    """
+    Item handle for a node in the SystematikTreeView, so dialogs
+    and the window can handle both widget items and view items.
+    """
+
+    def __init__(self, view, systematik_node: SystematikNode):
+
+        self.view = view
+        self.systematik_node = systematik_node
+
+    def _display_changed(self):
+
+        self.view.model().node_changed(self.systematik_node)
+
+    def setExpanded(self, expanded):
+
+        index = self.view.model().index_for_node(self.systematik_node)
+        if index.isValid():
+            self.view.setExpanded(index, expanded)
+
+class SystematikTreeView(QTreeView):
+    """
+    Lazy tree view of the window. The filter can be applied synchronously
+    with filter() or with schedule_filter(), which waits until the input
+    pauses and then runs the filter pass in short time slices, so the
+    event loop keeps running. Every new query gets a new generation, a
+    pass of an older generation stops at its next slice.
+
+    The pass only shows or hides the nodes whose visibility changes.
+    Branches that are hidden while expanded are expanded again when
+    they are shown.
+    """
+
+    FILTER_DELAY_MS = 150
+    FILTER_SLICE_SECONDS = 0.02
+    FILTER_CHUNK_SIZE = 256
+
+    node_selected = pyqtSignal(object)
+
+    def __init__(self, model: SystematikTreeModel, filter_engine: SystematikFilterEngine):
+
+        super().__init__()
+        self.filter_engine = filter_engine
+        self.setModel(model)
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.setUniformRowHeights(True)
+
+        # Expanded nodes whose rows have been removed by the filter
+        self._expanded_hidden = set()
+
+        # What the model shows, by position in the flat preorder array
+        self._displayed = None
+        self._displayed_version = None
+
+        self._pending_filter = None
+        self._filter_generation = 0
+        self._filter_pass = None
+        self._delay_timer = QTimer(self)
+        self._delay_timer.setSingleShot(True)
+        self._delay_timer.timeout.connect(self._start_filter_pass)
+        self._slice_timer = QTimer(self)
+        self._slice_timer.setInterval(0)
+        self._slice_timer.timeout.connect(self._apply_filter_slice)
+
+    def set_tree(self, tree: SystematikTree):
+
+        self.cancel_filter()
+        self.filter_engine.set_tree(tree)
+        self._expanded_hidden = set()
+        self._displayed = None
+        self._displayed_version = None
+        self.model().set_tree(tree)
+        if self._pending_filter is not None:
+            self._start_filter_pass()
+
+    def filter(self, itemfilter):
+
+        assert(itemfilter == itemfilter.upper())
+
+        self.cancel_filter()
+        self._pending_filter = itemfilter
+        self._start_filter_pass(time_sliced=False)
+
+    def schedule_filter(self, itemfilter):
+
+        assert(itemfilter == itemfilter.upper())
+
+        self.cancel_filter()
+        self._pending_filter = itemfilter
+        self._delay_timer.start(self.FILTER_DELAY_MS)
+
+    def cancel_filter(self):
+        """
+        Stops the delay and drops the pass that is running. The rows
+        stay as far as the pass got, the next pass starts from there.
+        """
+
+        self._delay_timer.stop()
+        self._slice_timer.stop()
+        self._filter_generation += 1
+        self._filter_pass = None
+
+    def is_filtering(self):
+
+        return self._delay_timer.isActive() or self._filter_pass is not None
+
+    def _start_filter_pass(self, time_sliced=True):
+
+        self._filter_generation += 1
+        self._filter_pass = self._run_filter_pass(self._pending_filter, self._filter_generation)
+        if time_sliced:
+            self._slice_timer.start()
+        else:
+            self._apply_filter_slice(None)
+
+    @INSTRUMENTATION.instrument_slot('gui.filter_slice')
+    def _apply_filter_slice(self, deadline=-1):
+
+        if self._filter_pass is None:
+            self._slice_timer.stop()
+            return
+        if deadline == -1:
+            deadline = time.monotonic() + self.FILTER_SLICE_SECONDS
+        filter_pass = self._filter_pass
+        try:
+            while True:
+                next(filter_pass)
+                if deadline is not None and time.monotonic() > deadline:
+                    break
+        except StopIteration:
+            if self._filter_pass is filter_pass:
+                self._slice_timer.stop()
+                self._filter_pass = None
+
+    def _run_filter_pass(self, query, generation):
+        """
+        Generator that yields between the chunks of the pass and ends
+        as soon as a newer pass has been started.
+        """
+
+        engine = self.filter_engine
+        model = self.model()
+        version = engine.tree.version
+        displayed = self._get_displayed()
+        steps = engine.filter_steps(query, displayed)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as stop:
+                result = stop.value
+                break
+            yield
+            if generation != self._filter_generation:
+                return
+
+        changed = result.changed
+        for start in range(0, len(changed), self.FILTER_CHUNK_SIZE):
+            if generation != self._filter_generation:
+                return
+            if engine.tree.version != version:
+                # Positions are no longer valid, the query starts again
+                self._start_filter_pass(time_sliced=self._slice_timer.isActive())
+                return
+            chunk = changed[start:start + self.FILTER_CHUNK_SIZE]
+            model.set_visibility([(result.nodes[position], result.visible[position] == 1)
+                                  for position in chunk])
+            for position in chunk:
+                displayed[position] = result.visible[position]
+            yield
+
+    def _get_displayed(self):
+
+        engine = self.filter_engine
+        if self._displayed_version != engine.tree.version:
+            self._displayed = bytearray(b'\x01') * len(engine.tree.get_flat_preorder())
+            for node in self.model().get_hidden_nodes():
+                position = engine.get_position(node)
+                if position is not None:
+                    self._displayed[position] = 0
+            self._displayed_version = engine.tree.version
+        return self._displayed
+
+    def rowsAboutToBeRemoved(self, parent, start, end):
+
+        model = self.model()
+        stack = [model.index(row, 0, parent) for row in range(start, end + 1)]
+        while stack:
+            index = stack.pop()
+            if not self.isExpanded(index):
+                continue
+            node = model.get_node(index)
+            self._expanded_hidden.add(node)
+            stack.extend([model.index(row, 0, index) for row in range(0, model.rowCount(index))])
+        super().rowsAboutToBeRemoved(parent, start, end)
+
+    def rowsInserted(self, parent, start, end):
+
+        super().rowsInserted(parent, start, end)
+        if len(self._expanded_hidden) == 0:
+            return
+        model = self.model()
+        for row in range(start, end + 1):
+            index = model.index(row, 0, parent)
+            node = model.get_node(index)
+            if node in self._expanded_hidden:
+                self._expanded_hidden.discard(node)
+                # Fetches the rows, which come back here for the expanded children
+                self.setExpanded(index, True)
+
+    def expand_all(self):
+
+        self.expandAll()
+
+    def collapse_all(self):
+
+        self.collapseAll()
+
+    def first_selected(self):
+
+        selected_indexes = self.selectionModel().selectedRows()
+
+        if len(selected_indexes) == 0:
+            raise NoSelectionException("No item selected")
+
+        return SystematikTreeViewItem(self, selected_indexes[0].internalPointer())
+
+    def selectionChanged(self, selected, deselected):
+
+        super().selectionChanged(selected, deselected)
+        selected_indexes = self.selectionModel().selectedRows()
+        if len(selected_indexes) > 0:
+            self.node_selected.emit(selected_indexes[0].internalPointer())
+
+    def create_child_item(self, parent_item: SystematikTreeViewItem, node: SystematikNode):
+        """
+        The item only becomes a row when the node has been saved
+        (see SystematikTreeWidgetService.node_saved), so there is
+        nothing to discard if the dialog is canceled or saving fails.
+        """
+
+        node.parent = parent_item.systematik_node
+        return SystematikTreeViewItem(self, node)
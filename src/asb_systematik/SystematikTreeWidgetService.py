@@ -3,271 +3,332 @@ Created on 15.07.2021
 
 @author: michael
 '''
+import logging
 from asb_systematik.SystematikDao import SystematikDao, SystematikTree,\
-    SystematikNode
-from PyQt5.QtWidgets import QTreeWidget, QTreeWidgetItem
+    SystematikNode, SystematikChange, create_nodes, node_to_row
 from injector import singleton, inject
+from asb_systematik.SystematikFilter import SystematikFilterEngine
+from asb_systematik.SystematikSnapshot import SystematikSnapshotStore
+from asb_systematik.SystematikDbWorker import SystematikDbWorker
+from asb_systematik.SystematikInstrumentation import INSTRUMENTATION
+from asb_systematik.SystematikTreeModel import SystematikNodeItem,\
+    SystematikTreeModel, SystematikTreeView, NoSelectionException
 
-class NoSelectionException(Exception):
-    
-    pass
+logger = logging.getLogger(__name__)
 
-class SystematikQTreeWidgetItem(QTreeWidgetItem):
-    """
-    This is the GUI representation of a SystematikNode, all
-    None values in the SystematikNode object need to be replaced
-    by empty strings.
-    """
-    
-    NODE_TYPES = ("Gliederungspunkt", "Physischer Bestand", "Digitaler Bestand")
-    DIGITALISIERUNGS_STATUS = ("nicht digitalisiert", "teilweise digitalisiert", "vollständig digitalisiert")
+@singleton
+class SystematikTreeWidgetService:
     
-    def __init__(self, parent, systematik_node: SystematikNode):
-        
-        self.systematik_node = systematik_node
-        try:
-            self.systematik_node.parent = parent.systematik_node
-        except:
-            # Happens on root nodes - parent then is no SystematikQTreeWidgetItem
-            pass
-
-        super().__init__(parent, ("%s" % systematik_node.identifier, self.display_text))
     
-    def set_description(self, new_description):
-        
-        if new_description.strip() == "":
-            self.systematik_node.beschreibung = None
-        else:
-            self.systematik_node.beschreibung = new_description
-        self.setText(1, self.display_text)
-
-    def get_description(self):
-        
-        if self.systematik_node.beschreibung is None:
-            return ""
-        else:
-            return self.systematik_node.beschreibung
-
-    def set_kommentar(self, new_comment):
-        
-        if new_comment.strip() == "":
-            self.systematik_node.kommentar = None
-        else:
-            self.systematik_node.kommentar = new_comment
-        self.setText(1, self.display_text)
-        
-    def get_kommentar(self):
-        
-        if self.systematik_node.kommentar is None:
-            return ""
-        else:
-            return self.systematik_node.kommentar
-
-    def set_entfernt(self, new_entfernt):
-        
-        if new_entfernt.strip() == "":
-            self.systematik_node.entfernt = None
-        else:
-            self.systematik_node.entfernt = new_entfernt
-        self.setText(1, self.display_text)
-
-    def get_entfernt(self):
-        
-        if self.systematik_node.entfernt is None:
-            return ""
-        else:
-            return self.systematik_node.entfernt
-
-    def set_startjahr(self, new_startjahr):
-        
-        self.systematik_node.startjahr = new_startjahr
-        self.setText(1, self.display_text)
-
-    def get_startjahr(self):
-        
-        return self.systematik_node.startjahr
-
-    def set_endjahr(self, new_endjahr):
-        
-        self.systematik_node.endjahr = new_endjahr
-        self.setText(1, self.display_text)
-
-    def get_endjahr(self):
-        
-        return self.systematik_node.endjahr
-
-    def set_nodetype(self, nodetype):
-        
-        self.systematik_node.nodetype = nodetype
+    @inject
+    def __init__(self, systematik_dao: SystematikDao, snapshot_store: SystematikSnapshotStore,
+                 db_worker: SystematikDbWorker):
         
-    def get_nodetype(self):
+        self.dao = systematik_dao
+        self.snapshot_store = snapshot_store
+        self.db_worker = db_worker
+        self._tree = None
+        self._snapshot_versions = None
+        self.watermark = None
+        self._tree_models = []
+        self._reload_listeners = []
+        self._poll_listeners = []
+        self._reload_task = None
+        
+    def add_poll_listener(self, listener):
+        """
+        listener is called without arguments when the changes
+        of the change log should be read at once.
+        """
+        
+        self._poll_listeners.append(listener)
+        
+    def create_tree_view(self):
+        
+        tree_model = SystematikTreeModel(self.tree)
+        self._tree_models.append(tree_model)
+        tree_view = SystematikTreeView(tree_model, SystematikFilterEngine(self.tree))
+        tree_view.setColumnWidth(0,240)
+        self._reload_listeners.append(tree_view.set_tree)
+        return tree_view
+    
+    def _get_tree(self):
         
-        return self.systematik_node.nodetype
-
-    def _get_display_text(self):
-
-        if self.systematik_node.beschreibung is None:
-            desc = "Keine Beschreibung!"
-        else:
-            desc = self.systematik_node.beschreibung
-
-        if self.systematik_node.kommentar is not None:
-            desc = "* %s" % desc
-            
-        if self.systematik_node.startjahr is not None or self.systematik_node.endjahr is not None:
-            if self.systematik_node.startjahr is None:
-                desc = "%s (bis %d)" % (desc, self.systematik_node.endjahr)
-            elif self.systematik_node.endjahr is None:
-                desc = "%s (ab %d)" % (desc, self.systematik_node.startjahr)
-            elif self.systematik_node.endjahr == self.systematik_node.startjahr:
-                desc = "%s (%d)" % (desc, self.systematik_node.startjahr)
+        if self._tree is None:
+            self._tree = self.snapshot_store.load_tree(SystematikTree)
+            if self._tree is None:
+                self._tree, self.watermark = self._fetch_tree(self.dao)
             else:
-                desc = "%s (%d - %d)" % (desc, self.systematik_node.startjahr, self.systematik_node.endjahr)
-                
-        return desc
-
-    beschreibung = property(get_description, set_description)        
-    kommentar = property(get_kommentar, set_kommentar)        
-    entfernt = property(get_entfernt, set_entfernt)        
-    startjahr = property(get_startjahr, set_startjahr)        
-    endjahr = property(get_endjahr, set_endjahr)        
-    display_text = property(_get_display_text)
-    nodetype = property(get_nodetype, set_nodetype)
-
-class SystematikQTreeWidget(QTreeWidget):
+                self._snapshot_versions = (self._tree.version, self._tree.content_version)
+        return self._tree
     
-    def filter(self, itemfilter):
+    def _fetch_tree(self, dao):
+        """
+        Returns the tree and the watermark of the change log. The
+        watermark is read first, so no change can get lost.
+        """
         
-        assert(itemfilter == itemfilter.upper())
+        with dao.unit_of_work():
+            watermark = self._fetch_watermark(dao)
+            return self.snapshot_store.fetch_tree(dao, SystematikTree), watermark
         
-        for index in range(0, self.topLevelItemCount()):
-            self._evaluate_filter(self.topLevelItem(index), itemfilter)
-            
-    def _evaluate_filter(self, item, itemfilter):
-        if itemfilter == "":
-            is_visible = True
-        else:
-            is_visible = item.systematik_node.is_visible(itemfilter)
-        item.setHidden(not is_visible)
-        if is_visible:
-            for index in range(0, item.childCount()):
-                self._evaluate_filter(item.child(index), itemfilter)
-
-    def expand_all(self):
+    def _fetch_watermark(self, dao):
         
-        for index in range(0, self.topLevelItemCount()):
-            self.expand(self.topLevelItem(index))
-            
-    def expand_selected(self):
-        
-        selected_items = self.selectedItems()
-        if len(selected_items) == 0:
-            self.expand_all()
-        else:
-            for item in selected_items:
-                self.expand(item)
-
-    def expand(self, item: SystematikQTreeWidgetItem):
+        if not dao.has_change_tracking():
+            return None
+        return dao.fetch_watermark()
+    
+    def reload_tree(self):
+        """
+        Reads the whole tree again and hands it to the views.
+        """
         
-        item.setExpanded(True)
-        for index in range(0, item.childCount()):
-            self.expand(item.child(index))
+        tree, watermark = self._fetch_tree(self.dao)
+        self._set_tree(tree, watermark)
         
-    def collapse_all(self):
+    def _set_tree(self, tree, watermark):
         
-        for index in range(0, self.topLevelItemCount()):
-            self.collapse(self.topLevelItem(index))
+        self._tree = tree
+        self._snapshot_versions = None
+        self.watermark = watermark
+        for listener in self._reload_listeners:
+            listener(self._tree)
             
-    def collapse_selected(self):
+    def is_from_snapshot(self):
+        """
+        True as long as the tree has been read from the snapshot
+        and has not been reconciled with the database.
+        """
         
-        selected_items = self.selectedItems()
-        if len(selected_items) == 0:
-            self.collapse_all()
+        return self._snapshot_versions is not None
+    
+    def reconcile_tree(self, dao=None):
+        """
+        Background part of the reconciliation: returns the tree of
+        the database (None if the snapshot was up to date) and the
+        watermark of the change log.
+        """
+        
+        if dao is None:
+            dao = self.dao
+        with dao.unit_of_work():
+            watermark = self._fetch_watermark(dao)
+            return self.snapshot_store.refresh(dao, SystematikTree), watermark
+    
+    def tree_reconciled(self, result):
+        """
+        GUI part of the reconciliation. If the tree has been edited
+        in the meantime, the new tree might miss these edits, so it
+        is read again.
+        """
+        
+        if self._snapshot_versions is None:
+            return
+        tree, watermark = result
+        if tree is None:
+            self._snapshot_versions = None
+            self.watermark = watermark
+            return
+        if self._snapshot_versions != (self._tree.version, self._tree.content_version):
+            self.reload_tree()
         else:
-            for item in selected_items:
-                self.collapse(item)
-
-    def collapse(self, item: SystematikQTreeWidgetItem):
-        
-        item.setExpanded(False)
-        for index in range(0, item.childCount()):
-            self.collapse(item.child(index))
+            self._set_tree(tree, watermark)
             
-    def first_selected(self):
-
-        selected_items = self.selectedItems()
-
-        if len(selected_items) == 0:
-            raise NoSelectionException("No item selected")
-        
-        return selected_items[0]
-        
-@singleton
-class SystematikTreeWidgetService:
+    def fetch_changes(self, watermark, dao=None):
+        """
+        Background part of the change polling, returns the new
+        watermark and the changes after the given one.
+        """
+        
+        if dao is None:
+            dao = self.dao
+        return dao.fetch_changes_since(watermark)
     
+    def apply_changes(self, changes, watermark):
+        """
+        GUI part of the change polling: applies the changes to the
+        tree and updates the rows of the tree views.
+        """
+        
+        if self.watermark is None:
+            # The tree is not yet in line with the database
+            return
+        self._apply_to_tree(changes)
+        self.watermark = max(self.watermark, watermark)
+        
+    def _apply_to_tree(self, changes):
+        
+        parents, changed_nodes = self.tree.apply_changes(changes)
+        for tree_model in self._tree_models:
+            for parent in set(parents):
+                tree_model.refresh_children(parent)
+            for node in changed_nodes:
+                tree_model.node_changed(node)
+            
+    def fetch_fingerprint(self, dao=None):
+        """
+        Background part of verify_tree() after an edit. Returns None
+        if the change log is followed, the fingerprint is not needed
+        then.
+        """
+        
+        if dao is None:
+            dao = self.dao
+        if self._is_following_changes():
+            return None
+        return dao.fetch_fingerprint()
     
-    @inject
-    def __init__(self, systematik_dao: SystematikDao):
+    def _is_following_changes(self):
         
-        self.dao = systematik_dao
-        self._tree = None
-        
-    def create_tree_widget(self):
-
-        tree_widget = SystematikQTreeWidget()
-        tree_widget.setColumnCount(2)
-        tree_widget.setColumnWidth(0,240)
-        tree_widget.setHeaderLabels(("Systematikpunkt", "Beschreibung"))
-
-        root_widget_items = []
-        for root_node in self.tree.rootnode.children:
-            root_widget_item = (SystematikQTreeWidgetItem(tree_widget, root_node))
-            self._add_child_items(tree_widget, root_widget_item)
-            root_widget_items.append(root_widget_item)
-        tree_widget.insertTopLevelItems(0, root_widget_items)
-        return tree_widget
+        return self.watermark is not None and len(self._poll_listeners) > 0
+            
+    def verify_tree(self, fingerprint=None):
+        """
+        Brings the tree in line with the edits of other users after
+        an edit of our own. With change log the change poller reads
+        the log at once. Otherwise the fingerprint of the table is
+        compared with the fingerprint of the tree, so updates and
+        renames are noticed as well as new and deleted rows, and on a
+        difference the tree is read again in the background. Returns
+        False if the tree is known to differ from the database. The
+        fingerprint may be passed if it has already been queried in
+        the background (see fetch_fingerprint()).
+        """
+        
+        if self._is_following_changes():
+            for listener in self._poll_listeners:
+                listener()
+            return True
+        if fingerprint is None:
+            fingerprint = self.dao.fetch_fingerprint()
+        if tuple(fingerprint) == self.tree.get_fingerprint():
+            return True
+        if self.is_from_snapshot():
+            # The reconciliation will bring the tree in line
+            return False
+        self.reload_tree_in_background()
+        return False
     
-    def _add_child_items(self, tree_widget, parent: SystematikQTreeWidgetItem):
-        
-        for child in parent.systematik_node.children:
-            widget_item = SystematikQTreeWidgetItem(parent, child)
-            self._add_child_items(tree_widget, widget_item)
-
-    def _get_tree(self):
+    def reload_tree_in_background(self):
+        """
+        Like reload_tree(), but reads the tree with the db worker.
+        """
+        
+        if self._reload_task is not None and not self._reload_task.done:
+            return
+        versions = (self.tree.version, self.tree.content_version)
+        self._reload_task = self.db_worker.submit(lambda dao, task: self._fetch_tree(dao),
+                                                  lambda result: self._tree_reloaded(result, versions),
+                                                  self._reload_failed)
+        
+    def _tree_reloaded(self, result, versions):
+        
+        if versions != (self.tree.version, self.tree.content_version):
+            # Edited in the meantime, the edit might be missing
+            self._reload_task = None
+            self.reload_tree_in_background()
+        else:
+            self._set_tree(*result)
+            
+    def _reload_failed(self, exception):
         
-        if self._tree is None:
-            self._tree = self.dao.fetch_tree(SystematikTree)
-        return self._tree
+        logger.error("Fehler beim Neuladen der Systematik: %s", exception)
     
-    def is_used(self, item_widget: SystematikQTreeWidget):
+    def is_used(self, item_widget: SystematikNodeItem):
         
         return self.dao.is_used(item_widget.systematik_node.identifier)
     
-    def first_usage(self, item_widget: SystematikQTreeWidget):
+    def first_usage(self, item_widget: SystematikNodeItem):
         
         return self.dao.get_first_usage(item_widget.systematik_node.identifier)
+    
+    def get_usage(self, node: SystematikNode, dao=None, task=None):
+        """
+        Returns the description of the first usage or None if the
+        node is not used. May run in the background with its own dao,
+        the task may be cancelled while the query is running.
+        """
+        
+        if dao is None:
+            dao = self.dao
+        if task is not None:
+            task.check_cancelled()
+        return dao.find_first_usage(node.identifier)
 
-    def save(self, item_widget: SystematikQTreeWidget):
-        
-        if self.dao.exists(item_widget.systematik_node.identifier):
-            self.dao.update_node(item_widget.systematik_node)
+    def save(self, item_widget: SystematikNodeItem):
+        
+        inserted = self.write_node(item_widget.systematik_node)
+        self.node_saved(item_widget, inserted)
+        
+    def write_node(self, node: SystematikNode, dao=None):
+        """
+        Database part of save(), returns True if the node
+        has been inserted.
+        """
+        
+        if dao is None:
+            dao = self.dao
+        with dao.unit_of_work():
+            if dao.exists(node.identifier):
+                dao.update_node(node)
+                return False
+            dao.insert_node(node)
+            return True
+    
+    def node_saved(self, item_widget: SystematikNodeItem, inserted, fingerprint=None, tree=None):
+        """
+        Tree part of save(), must run on the GUI thread. tree is the
+        tree the node was edited in, if it has been replaced in the
+        meantime, the saved row is applied to the current tree instead.
+        """
+        
+        node = item_widget.systematik_node
+        if tree is not None and tree is not self.tree:
+            self._apply_to_tree([self._create_change(node)])
+        elif inserted:
+            self.tree.add_node(node)
+            for tree_model in self._tree_models:
+                tree_model.refresh_children(node.parent)
         else:
-            self.dao.insert_node(item_widget.systematik_node)
-            new_node = item_widget.systematik_node
-            parent = new_node.parent
-            if len(parent.children) != 0:
-                previous_sibling = parent.children[-1]
-                new_node.previous_sibling = previous_sibling
-                previous_sibling.next_sibling = new_node
-            item_widget.systematik_node.parent.children.append(item_widget.systematik_node)
-        self._tree = None
+            self.tree.mark_content_changed(node)
+            for tree_model in self._tree_models:
+                tree_model.node_changed(node)
+        self.verify_tree(fingerprint)
         
-    def delete(self, item_widget: SystematikQTreeWidget):
+    def delete(self, item_widget: SystematikNodeItem):
 
-        if item_widget.systematik_node.previous_sibling != None:
-            item_widget.systematik_node.previous_sibling.next_sibling = None
-        item_widget.systematik_node.parent.children.remove(item_widget.systematik_node)
         self.dao.delete_node(item_widget.systematik_node)
-        self._tree = None
+        self.node_deleted(item_widget)
+        
+    def node_deleted(self, item_widget: SystematikNodeItem, fingerprint=None, tree=None):
+        """
+        Tree part of delete(), must run on the GUI thread. tree
+        is handled like in node_saved().
+        """
+        
+        node = item_widget.systematik_node
+        if tree is not None and tree is not self.tree:
+            self._apply_to_tree([self._create_change(node, deleted=True)])
+        else:
+            parent = node.parent
+            self.tree.remove_node(node)
+            for tree_model in self._tree_models:
+                tree_model.refresh_children(parent)
+        self.verify_tree(fingerprint)
+        
+    def _create_change(self, node: SystematikNode, deleted=False):
+        """
+        The change of our own write in the form of the change log, for
+        a tree that does not contain node. The tree gets a copy of the
+        current node, so no node of the replaced tree ends up in it.
+        """
+        
+        change = SystematikChange(node.id)
+        change.old_identifiers = [node.identifier]
+        if not deleted:
+            change.node = next(create_nodes([node_to_row(node)]))
+        return change
     
     tree = property(_get_tree)
+
+INSTRUMENTATION.instrument_class(SystematikTreeWidgetService, 'service')
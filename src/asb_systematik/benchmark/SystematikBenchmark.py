@@ -0,0 +1,199 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import datetime
+import sqlalchemy
+from sqlalchemy.engine.create import create_engine
+from asb_systematik.SystematikDao import SystematikDao, SystematikTree, SystematikTreeIterator,\
+    TRAVERSAL_PREORDER, TRAVERSAL_POSTORDER, TRAVERSAL_LEVELORDER, create_nodes, node_to_row
+from asb_systematik.SystematikFilter import SystematikFilterEngine
+from asb_systematik.benchmark.SystematikGenerator import SystematikGenerator
+
+# Typed letter by letter into the filter field
+FILTER_QUERIES = ("Gewerkschaft", "Umwelt", "Frauen")
+
+IS_USED_SAMPLE_SIZE = 200
+
+class SystematikBenchmark:
+    """
+    Timed scenarios on a generated database. Every scenario is run
+    repeat times, the result contains all run times in seconds.
+    """
+
+    def __init__(self, engine, repeat=5):
+
+        self.engine = engine
+        self.dao = SystematikDao(engine)
+        self.repeat = repeat
+        self.scenarios = [
+            ('load', self.load),
+            ('build', self.build),
+            ('traverse_preorder', lambda: self.traverse(TRAVERSAL_PREORDER)),
+            ('traverse_postorder', lambda: self.traverse(TRAVERSAL_POSTORDER)),
+            ('traverse_levelorder', lambda: self.traverse(TRAVERSAL_LEVELORDER)),
+            ('filter_as_you_type', self.filter_as_you_type),
+            ('is_visible', self.is_visible),
+            ('render', self.render),
+            ('is_used', self.is_used),
+            ('is_used_many', self.is_used_many),
+            ('usage_map', self.usage_map),
+        ]
+
+    def setup(self):
+
+        self.tree = self.dao.fetch_tree(SystematikTree)
+        self.rows = [node_to_row(node) for node in self.tree.traverse() if node is not self.tree.rootnode]
+        self.identifiers = [node.identifier for node in self.tree.traverse() if node is not self.tree.rootnode]
+        self.sample = random.Random(1).sample(self.identifiers, min(IS_USED_SAMPLE_SIZE, len(self.identifiers)))
+
+    def load(self):
+
+        return len(self.dao.fetch_tree(SystematikTree).get_flat_preorder())
+
+    def build(self):
+
+        return len(SystematikTree(create_nodes(self.rows)).get_flat_preorder())
+
+    def traverse(self, order):
+
+        count = 0
+        for _ in SystematikTreeIterator(self.tree.rootnode, order):
+            count += 1
+        return count
+
+    def filter_as_you_type(self):
+
+        # A new engine, so the preparation is measured as well
+        filter_engine = SystematikFilterEngine(self.tree)
+        count = 0
+        for query in FILTER_QUERIES:
+            for length in range(1, len(query) + 1):
+                filter_engine.filter(query[:length])
+                count += 1
+            filter_engine.filter("")
+        return count
+
+    def is_visible(self):
+
+        count = 0
+        for query in FILTER_QUERIES:
+            query = query.upper()
+            for length in range(1, len(query) + 1):
+                for node in self.tree.rootnode.children:
+                    node.is_visible(query[:length])
+                count += 1
+        return count
+
+    def render(self):
+
+        # The import sets the German locale
+        from asb_systematik.SystematikReporting import SystematikTexTree
+        output = io.StringIO()
+        SystematikTexTree(create_nodes(self.rows)).write(output)
+        return len(output.getvalue())
+
+    def is_used(self):
+
+        for identifier in self.sample:
+            self.dao.is_used(identifier)
+        return len(self.sample)
+
+    def is_used_many(self):
+
+        return len(self.dao.is_used_many(self.identifiers))
+
+    def usage_map(self):
+
+        return len(self.dao.fetch_usage_map())
+
+    def run(self, selected=None):
+
+        self.setup()
+        results = {}
+        for name, scenario in self.scenarios:
+            if selected is not None and name not in selected:
+                continue
+            times = []
+            try:
+                for _ in range(self.repeat):
+                    start = time.perf_counter()
+                    size = scenario()
+                    times.append(time.perf_counter() - start)
+            except Exception as e:
+                results[name] = {'error': "%s: %s" % (e.__class__.__name__, e)}
+                continue
+            results[name] = {'size': size,
+                             'times': times,
+                             'min': min(times),
+                             'median': statistics.median(times),
+                             'mean': statistics.mean(times)}
+        return results
+
+def get_environment(engine):
+
+    return {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'database': engine.dialect.name}
+
+def compare(results, baseline):
+    """
+    Lines with the median of every scenario compared
+    to the baseline run.
+    """
+
+    lines = []
+    for name, result in results['scenarios'].items():
+        if 'median' not in result:
+            lines.append("%-20s %s" % (name, result.get('error')))
+            continue
+        old_result = baseline['scenarios'].get(name, {})
+        if 'median' in old_result and old_result['median'] > 0:
+            lines.append("%-20s %10.4f s  %10.4f s  %6.2fx" % (name, old_result['median'], result['median'],
+                                                               result['median'] / old_result['median']))
+        else:
+            lines.append("%-20s %10s    %10.4f s" % (name, "-", result['median']))
+    return lines
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Misst die Laufzeiten der Systematik-Operationen")
+    parser.add_argument('--db-url', default=os.environ.get('BENCHMARK_DB_URL', 'sqlite:////tmp/systematik-benchmark.db'))
+    parser.add_argument('--generate', type=int, metavar='NODES',
+                        help="Vorher eine Systematik mit so vielen Punkten erzeugen (löscht vorhandene Tabellen)")
+    parser.add_argument('--repeat', type=int, default=5, help="Wiederholungen pro Szenario")
+    parser.add_argument('--scenario', nargs='+', help="Nur diese Szenarien")
+    parser.add_argument('-o', '--output', help="Ergebnisse als JSON in diese Datei schreiben")
+    parser.add_argument('--compare', help="JSON-Datei eines früheren Laufs zum Vergleich")
+    args = parser.parse_args()
+
+    engine = create_engine(args.db_url)
+    results = {'created': datetime.datetime.now().isoformat(),
+               'environment': get_environment(engine)}
+    if args.generate is not None:
+        generator = SystematikGenerator(args.generate)
+        generator.load(engine, replace=True)
+        results['generator'] = generator.get_config()
+    results['scenarios'] = SystematikBenchmark(engine, args.repeat).run(args.scenario)
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            for line in compare(results, json.load(baseline_file)):
+                print(line, file=sys.stderr)
@@ -0,0 +1,201 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import argparse
+import os
+import random
+from sqlalchemy import inspect
+from sqlalchemy.engine.create import create_engine
+from sqlalchemy.sql.expression import insert, text
+from asb_systematik.SystematikDao import SYSTEMATIK_TABLE, SystematikIdentifier,\
+    REFERENCE_INDEX_STATEMENTS
+
+USAGE_TABLE_STATEMENTS = (
+    "create table broschueren (id integer primary key, titel varchar, systematik1 varchar, systematik2 varchar)",
+    "create table zeitschriften (id integer primary key, titel varchar, " +
+    "systematik1 varchar, systematik2 varchar, systematik3 varchar)",
+    "create table dokument (hauptnr integer primary key, standort varchar)",
+    "create table sverweis (hauptnr integer, systematik varchar, roemisch integer, sub integer)"
+) + REFERENCE_INDEX_STATEMENTS
+
+GENERATED_TABLES = ('systematik', 'broschueren', 'zeitschriften', 'dokument', 'sverweis')
+
+WORDS = ("Arbeit", "Frauen", "Frieden", "Umwelt", "Stadt", "Bewegung", "Gewerkschaft", "Schule",
+         "Wohnen", "Energie", "Kultur", "Presse", "Internationales", "Antifaschismus", "Gesundheit",
+         "Jugend", "Verkehr", "Landwirtschaft", "Migration", "Recht", "Medien", "Geschichte")
+
+INSERT_BATCH_SIZE = 5000
+
+class DatabaseNotEmptyException(Exception):
+    pass
+
+class SystematikGenerator:
+    """
+    Creates a random, but reproducible Systematik with the given number
+    of points and matching usage tables. roman_share and sub_share are
+    the shares of roman and sub points below normal points, gap_share is
+    the probability that a number is left out between two siblings.
+    """
+
+    def __init__(self, node_count=10000, max_depth=6, roman_share=0.1, sub_share=0.2, gap_share=0.05,
+                 broschueren=20000, zeitschriften=5000, dokumente=50000, verweise=2000, seed=1):
+
+        self.node_count = node_count
+        self.max_depth = max_depth
+        self.roman_share = roman_share
+        self.sub_share = sub_share
+        self.gap_share = gap_share
+        self.broschueren = broschueren
+        self.zeitschriften = zeitschriften
+        self.dokumente = dokumente
+        self.verweise = verweise
+        self.seed = seed
+
+    def get_config(self):
+
+        return dict(self.__dict__)
+
+    def generate_identifiers(self):
+        """
+        Returns the identifiers in creation order, parents
+        always before their children.
+        """
+
+        generator = random.Random(self.seed)
+        identifiers = []
+        # Points that may get children: normal points up to
+        # max_depth and roman points (for sub points)
+        candidates = [SystematikIdentifier(None)]
+        counters = {}
+
+        def next_number(key):
+            number = counters.get(key, 0) + 1
+            if generator.random() < self.gap_share:
+                number += 1
+            counters[key] = number
+            return number
+
+        while len(identifiers) < self.node_count:
+            parent = generator.choice(candidates)
+            if parent.punkt is None:
+                identifier = SystematikIdentifier("%d" % next_number((parent, 'punkt')))
+            elif parent.roemisch is not None:
+                identifier = SystematikIdentifier(parent.punkt, parent.roemisch, next_number((parent, 'sub')))
+            else:
+                choice = generator.random()
+                depth = len(parent.punkt.split('.'))
+                if choice < self.roman_share:
+                    identifier = SystematikIdentifier(parent.punkt, next_number((parent, 'roemisch')))
+                elif choice < self.roman_share + self.sub_share or depth >= self.max_depth:
+                    identifier = SystematikIdentifier(parent.punkt, None, next_number((parent, 'sub')))
+                else:
+                    identifier = SystematikIdentifier("%s.%d" % (parent.punkt, next_number((parent, 'punkt'))))
+            identifiers.append(identifier)
+            if identifier.sub is None:
+                candidates.append(identifier)
+        return identifiers
+
+    def generate_rows(self, identifiers):
+
+        generator = random.Random(self.seed + 1)
+        return [{'id': row_id,
+                 'punkt': identifier.punkt,
+                 'roemisch': identifier.db_roemisch,
+                 'sub': identifier.db_sub,
+                 'beschreibung': "%s %s %d" % (generator.choice(WORDS), generator.choice(WORDS), row_id),
+                 'kommentar': None,
+                 'entfernt': None,
+                 'startjahr': None,
+                 'endjahr': None,
+                 'nodetype': 0,
+                 'digistate': None} for row_id, identifier in enumerate(identifiers, 1)]
+
+    def generate_usages(self, identifiers):
+        """
+        Returns the rows of the usage tables. Only part of
+        the points is used, like in the real data.
+        """
+
+        generator = random.Random(self.seed + 2)
+        used = [identifier for identifier in identifiers if generator.random() < 0.3]
+        if len(used) == 0:
+            used = identifiers
+        references = ["%s" % identifier for identifier in used]
+        choose = generator.choice
+        return {
+            'broschueren': [{'id': row_id, 'titel': "Broschüre %d" % row_id,
+                             'systematik1': choose(references),
+                             'systematik2': choose(references) if generator.random() < 0.3 else None}
+                            for row_id in range(1, self.broschueren + 1)],
+            'zeitschriften': [{'id': row_id, 'titel': "Zeitschrift %d" % row_id,
+                               'systematik1': choose(references),
+                               'systematik2': choose(references) if generator.random() < 0.3 else None,
+                               'systematik3': choose(references) if generator.random() < 0.1 else None}
+                              for row_id in range(1, self.zeitschriften + 1)],
+            'dokument': [{'hauptnr': row_id, 'standort': choose(references)}
+                         for row_id in range(1, self.dokumente + 1)],
+            'sverweis': [dict([('hauptnr', row_id)] + list(zip(('systematik', 'roemisch', 'sub'),
+                                                               self._get_verweis(choose(used)))))
+                         for row_id in range(1, self.verweise + 1)]
+        }
+
+    def _get_verweis(self, identifier):
+
+        return identifier.punkt, identifier.db_roemisch, identifier.db_sub
+
+    def load(self, engine, replace=False):
+        """
+        Creates the tables and writes the generated data. Existing
+        tables are only dropped with replace=True. Returns the
+        generated identifiers.
+        """
+
+        existing = [table for table in GENERATED_TABLES if inspect(engine).has_table(table)]
+        if len(existing) > 0 and not replace:
+            raise DatabaseNotEmptyException("Tabellen existieren schon: %s" % ", ".join(existing))
+        identifiers = self.generate_identifiers()
+        usages = self.generate_usages(identifiers)
+        with engine.begin() as connection:
+            for table in existing:
+                connection.execute(text("drop table %s" % table))
+            SYSTEMATIK_TABLE.create(connection)
+            for statement in USAGE_TABLE_STATEMENTS:
+                connection.execute(text(statement))
+            self._insert(connection, insert(SYSTEMATIK_TABLE), self.generate_rows(identifiers))
+            for table, rows in usages.items():
+                if len(rows) == 0:
+                    continue
+                columns = list(rows[0].keys())
+                self._insert(connection, text("insert into %s (%s) values (%s)" %
+                                              (table, ", ".join(columns), ", ".join([":%s" % column for column in columns]))),
+                             rows)
+        return identifiers
+
+    def _insert(self, connection, statement, rows):
+
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            connection.execute(statement, rows[start:start + INSERT_BATCH_SIZE])
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Erzeugt eine zufällige Systematik für Messungen")
+    parser.add_argument('--db-url', default=os.environ.get('BENCHMARK_DB_URL', 'sqlite:////tmp/systematik-benchmark.db'))
+    parser.add_argument('--nodes', type=int, default=10000, help="Anzahl der Systematikpunkte")
+    parser.add_argument('--depth', type=int, default=6, help="Maximale Tiefe")
+    parser.add_argument('--roman', type=float, default=0.1, help="Anteil der römischen Punkte")
+    parser.add_argument('--sub', type=float, default=0.2, help="Anteil der Unterpunkte")
+    parser.add_argument('--gaps', type=float, default=0.05, help="Wahrscheinlichkeit einer Lücke in der Nummerierung")
+    parser.add_argument('--broschueren', type=int, default=20000)
+    parser.add_argument('--zeitschriften', type=int, default=5000)
+    parser.add_argument('--dokumente', type=int, default=50000)
+    parser.add_argument('--verweise', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--replace', action='store_true', help="Vorhandene Tabellen löschen")
+    args = parser.parse_args()
+
+    generator = SystematikGenerator(args.nodes, args.depth, args.roman, args.sub, args.gaps,
+                                    args.broschueren, args.zeitschriften, args.dokumente, args.verweise, args.seed)
+    identifiers = generator.load(create_engine(args.db_url), args.replace)
+    print("%d Systematikpunkte in %s geschrieben" % (len(identifiers), args.db_url))
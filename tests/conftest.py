@@ -0,0 +1,9 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
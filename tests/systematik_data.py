@@ -0,0 +1,72 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+
+Small Systematik trees and SQLite databases for the tests.
+'''
+from sqlalchemy.engine.create import create_engine
+from sqlalchemy.sql.expression import text
+from asb_systematik.SystematikDao import SystematikNode, SystematikIdentifier,\
+    SystematikTree, SYSTEMATIK_TABLE
+
+# (identifier, beschreibung)
+SAMPLE_POINTS = (
+    ("0", "Allgemeines"),
+    ("0.1", "Geschichte"),
+    ("0.1.1", "Frühgeschichte"),
+    ("0.2", "Müll und Recycling"),
+    ("1", "Frauen"),
+    ("1.1", "Frauenbewegung"),
+    ("1.I", "Regionales"),
+    ("1.I-1", "Berlin"),
+    ("1.I-2", "Hamburg"),
+    ("1.II", "International"),
+    ("1-1", "Sonstiges"),
+    ("2", "Umwelt"),
+    ("2.1", "Atomkraft"),
+    ("2.10", "Verkehr"),
+    ("2.2", "Wasser"),
+)
+
+USAGE_TABLE_STATEMENTS = (
+    "create table broschueren (id integer primary key, titel varchar, systematik1 varchar, systematik2 varchar)",
+    "create table zeitschriften (id integer primary key, titel varchar, " +
+    "systematik1 varchar, systematik2 varchar, systematik3 varchar)",
+    "create table dokument (hauptnr integer primary key, standort varchar)",
+    "create table sverweis (hauptnr integer, systematik varchar, roemisch integer, sub integer)",
+)
+
+def create_nodes(points=SAMPLE_POINTS):
+    """
+    New nodes with ids in the order of points.
+    """
+
+    return [SystematikNode(SystematikIdentifier(identifier), beschreibung, id=position + 1)
+            for position, (identifier, beschreibung) in enumerate(points)]
+
+def create_tree(points=SAMPLE_POINTS):
+
+    return SystematikTree(create_nodes(points))
+
+def create_database(path, points=SAMPLE_POINTS):
+    """
+    SQLite database with the systematik table and the usage tables.
+    Returns the engine.
+    """
+
+    engine = create_engine("sqlite:///%s" % path)
+    SYSTEMATIK_TABLE.create(engine)
+    with engine.begin() as connection:
+        for statement in USAGE_TABLE_STATEMENTS:
+            connection.execute(text(statement))
+        for node in create_nodes(points):
+            identifier = node.identifier
+            connection.execute(SYSTEMATIK_TABLE.insert().values(
+                id=node.id, punkt=identifier.punkt, roemisch=identifier.db_roemisch,
+                sub=identifier.db_sub, beschreibung=node.beschreibung))
+    return engine
+
+def identifiers(nodes):
+
+    return ["%s" % node.identifier for node in nodes]
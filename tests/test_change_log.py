@@ -0,0 +1,174 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import unittest
+from asb_systematik.SystematikDao import SystematikTree, SystematikNode, SystematikIdentifier,\
+    SystematikChange
+from asb_systematik.SystematikChangeTracking import install_change_tracking, purge_changes
+from systematik_data import create_nodes, create_tree, identifiers
+from test_dao import DatabaseTestCase
+
+def change(systematik_id, old_identifiers, node=None):
+
+    systematik_change = SystematikChange(systematik_id)
+    systematik_change.old_identifiers = [SystematikIdentifier(identifier) for identifier in old_identifiers]
+    systematik_change.node = node
+    return systematik_change
+
+class ApplyChangesTest(unittest.TestCase):
+    """
+    After applying the changes the tree has to look like a
+    tree freshly read from the changed table.
+    """
+
+    def setUp(self):
+
+        self.tree = create_tree()
+        self.rows = dict([(node.id, node) for node in create_nodes()])
+
+    def apply(self, changes):
+
+        for systematik_change in changes:
+            if systematik_change.node is None:
+                del(self.rows[systematik_change.systematik_id])
+            else:
+                self.rows[systematik_change.systematik_id] = systematik_change.node
+        return self.tree.apply_changes(changes)
+
+    def assert_like_fresh_load(self):
+
+        fresh = SystematikTree([SystematikNode(node.identifier, node.beschreibung, id=node.id)
+                                for node in self.rows.values()])
+        self.assertEqual("%s" % self.tree, "%s" % fresh)
+        self.assertEqual(sorted(identifiers(self.tree.orphans)), sorted(identifiers(fresh.orphans)))
+        self.assertEqual(self.tree.get_node_count(), fresh.get_node_count())
+
+    def test_update(self):
+
+        parents, changed_nodes = self.apply([change(13, ["2.1"], SystematikNode(SystematikIdentifier("2.1"),
+                                                                                 "Atomkraft? Nein danke", id=13))])
+        node = self.tree.find_node(SystematikIdentifier("2.1"))
+        self.assertEqual(node.beschreibung, "Atomkraft? Nein danke")
+        self.assertEqual(changed_nodes, [node])
+        self.assertEqual(parents, [])
+        self.assert_like_fresh_load()
+
+    def test_insert_and_delete(self):
+
+        parents, changed_nodes = self.apply([change(100, [], SystematikNode(SystematikIdentifier("2.3"), "Neu", id=100)),
+                                             change(4, ["0.2"])])
+        self.assertIsNone(self.tree.find_node(SystematikIdentifier("0.2")))
+        self.assertIsNotNone(self.tree.find_node(SystematikIdentifier("2.3")))
+        self.assertEqual(set(identifiers(parents)), set(["0", "2"]))
+        self.assert_like_fresh_load()
+
+    def test_rename_keeps_the_rows_below(self):
+
+        # 1.I becomes 1.III, its sub points stay 1.I-1 and 1.I-2
+        self.apply([change(7, ["1.I"], SystematikNode(SystematikIdentifier("1.III"), "Regionales", id=7))])
+        self.assertIsNotNone(self.tree.find_node(SystematikIdentifier("1.III")))
+        self.assertEqual(sorted(identifiers(self.tree.orphans)), ["1.I-1", "1.I-2"])
+        self.assert_like_fresh_load()
+
+        # Renamed back, the orphans find their parent again
+        self.apply([change(7, ["1.III"], SystematikNode(SystematikIdentifier("1.I"), "Regionales", id=7))])
+        self.assertEqual(self.tree.orphans, [])
+        self.assertEqual(identifiers(self.tree.find_node(SystematikIdentifier("1.I")).children), ["1.I-1", "1.I-2"])
+        self.assert_like_fresh_load()
+
+    def test_parent_arriving_after_the_child(self):
+
+        self.apply([change(100, [], SystematikNode(SystematikIdentifier("3.1"), "Kind", id=100))])
+        self.assertEqual(identifiers(self.tree.orphans), ["3.1"])
+        self.apply([change(101, [], SystematikNode(SystematikIdentifier("3"), "Eltern", id=101))])
+        self.assertEqual(self.tree.orphans, [])
+        self.assert_like_fresh_load()
+
+    def test_duplicate_identifier(self):
+
+        self.apply([change(100, [], SystematikNode(SystematikIdentifier("2.1"), "Doppelt", id=100))])
+        self.assertEqual(self.tree.find_node(SystematikIdentifier("2.1")).id, 13)
+        self.assert_like_fresh_load()
+
+    def test_applying_twice_does_no_harm(self):
+
+        changes = [change(7, ["1.I"], SystematikNode(SystematikIdentifier("1.III"), "Regionales", id=7)),
+                   change(100, [], SystematikNode(SystematikIdentifier("2.3"), "Neu", id=100))]
+        self.apply(changes)
+        text = "%s" % self.tree
+        version = self.tree.version
+        self.tree.apply_changes([change(7, ["1.I"], SystematikNode(SystematikIdentifier("1.III"), "Regionales", id=7)),
+                                 change(100, [], SystematikNode(SystematikIdentifier("2.3"), "Neu", id=100))])
+        self.assertEqual("%s" % self.tree, text)
+        self.assertEqual(self.tree.version, version)
+        self.assert_like_fresh_load()
+
+class ChangeLogTest(DatabaseTestCase):
+
+    def setUp(self):
+
+        super().setUp()
+        install_change_tracking(self.engine)
+        # May be installed again
+        install_change_tracking(self.engine)
+        self.watermark = self.dao.fetch_watermark()
+
+    def fetch_changes(self):
+
+        watermark, changes = self.dao.fetch_changes_since(self.watermark)
+        return watermark, dict([(systematik_change.systematik_id, systematik_change) for systematik_change in changes])
+
+    def test_empty_log(self):
+
+        self.assertTrue(self.dao.has_change_tracking())
+        self.assertEqual(self.watermark, 0)
+        self.assertEqual(self.dao.fetch_changes_since(0), (0, []))
+
+    def test_insert_update_and_delete(self):
+
+        self.execute("insert into systematik (id, punkt, roemisch, sub, beschreibung) values (100, '2.3', 0, 0, 'Neu')")
+        self.execute("update systematik set beschreibung = 'Atom' where id = 13")
+        self.execute("delete from systematik where id = 4")
+        watermark, changes = self.fetch_changes()
+        self.assertEqual(watermark, self.dao.fetch_watermark())
+        self.assertEqual(sorted(changes.keys()), [4, 13, 100])
+        self.assertEqual(changes[100].node.identifier, SystematikIdentifier("2.3"))
+        self.assertEqual(changes[100].old_identifiers, [])
+        self.assertEqual(changes[13].node.beschreibung, "Atom")
+        self.assertEqual(changes[13].old_identifiers, [SystematikIdentifier("2.1")])
+        self.assertIsNone(changes[4].node)
+        self.assertEqual(changes[4].old_identifiers, [SystematikIdentifier("0.2")])
+        self.assertEqual(self.dao.fetch_changes_since(watermark), (watermark, []))
+
+    def test_row_changed_several_times_appears_once(self):
+
+        self.execute("update systematik set punkt = '1', roemisch = 3, sub = 0 where id = 7")
+        self.execute("update systematik set beschreibung = 'Regional' where id = 7")
+        watermark, changes = self.fetch_changes()
+        self.assertEqual(list(changes.keys()), [7])
+        self.assertEqual(changes[7].node.identifier, SystematikIdentifier("1.III"))
+        self.assertEqual(changes[7].node.beschreibung, "Regional")
+        self.assertIn(SystematikIdentifier("1.I"), changes[7].old_identifiers)
+
+    def test_changes_make_the_tree_like_a_fresh_load(self):
+
+        tree = self.dao.fetch_tree(SystematikTree)
+        self.execute("update systematik set punkt = '1', roemisch = 3, sub = 0 where id = 7")
+        self.execute("insert into systematik (id, punkt, roemisch, sub, beschreibung) values (100, '3', 0, 0, 'Drei')")
+        self.execute("delete from systematik where id = 4")
+        tree.apply_changes(self.fetch_changes()[1].values())
+        self.assertEqual("%s" % tree, "%s" % self.dao.fetch_tree(SystematikTree))
+        self.assertEqual(sorted(identifiers(tree.orphans)), ["1.I-1", "1.I-2"])
+
+    def test_purge(self):
+
+        self.execute("update systematik set beschreibung = 'Atom' where id = 13")
+        watermark = self.dao.fetch_watermark()
+        self.execute("update systematik set beschreibung = 'Wasser!' where id = 15")
+        purge_changes(self.engine, watermark)
+        self.assertEqual(list(self.fetch_changes()[1].keys()), [15])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import unittest
+from asb_systematik.SystematikChangeTracking import install_change_tracking
+from test_tree_service import ServiceTestCase
+from asb_systematik.SystematikChangePoller import SystematikChangePoller
+
+class SystematikChangePollerTest(ServiceTestCase):
+
+    def setUp(self):
+
+        super().setUp()
+        install_change_tracking(self.engine)
+        # The view of the base class has read the tree without change log
+        self.service.reload_tree()
+        self.reloads = 0
+        self.poller = SystematikChangePoller(self.service, self.db_worker)
+
+    def poll(self):
+
+        self.poller.poll()
+        self.wait_for_worker()
+
+    def test_changes_of_other_users_are_applied(self):
+
+        self.execute("update systematik set beschreibung = 'Atom' where id = 13")
+        self.execute("delete from systematik where id = 4")
+        self.poll()
+        self.assertEqual(self.node("2.1").beschreibung, "Atom")
+        self.assertIsNone(self.node("0.2"))
+        self.assertEqual(self.service.watermark, self.dao.fetch_watermark())
+        self.assertEqual(self.reloads, 0)
+
+    def test_late_entries_below_the_watermark_are_read_again(self):
+
+        # The entry gets visible only after a later one has been read
+        self.execute("update systematik set beschreibung = 'Atom' where id = 13")
+        self.service.watermark = self.dao.fetch_watermark() + 1
+        self.poll()
+        self.assertEqual(self.node("2.1").beschreibung, "Atom")
+
+    def test_without_overlap_late_entries_are_lost(self):
+
+        self.poller.OVERLAP = 0
+        self.execute("update systematik set beschreibung = 'Atom' where id = 13")
+        self.service.watermark = self.dao.fetch_watermark() + 1
+        self.poll()
+        self.assertEqual(self.node("2.1").beschreibung, "Atomkraft")
+
+    def test_no_poll_without_change_log_watermark(self):
+
+        self.service.watermark = None
+        self.poller.poll()
+        self.assertIsNone(self.poller._task)
+
+if __name__ == '__main__':
+    unittest.main()
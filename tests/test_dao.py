@@ -0,0 +1,101 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import os
+import tempfile
+import unittest
+from injector import Injector
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.sql.expression import text
+from asb_systematik.SystematikDao import SystematikDao, SystematikTree, SystematikIdentifier,\
+    JoinChecker, DeletionForbiddenException
+from systematik_data import create_database
+
+class DatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_database(os.path.join(self.directory.name, 'systematik.db'))
+        self.dao = SystematikDao(self.engine)
+
+    def tearDown(self):
+
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def execute(self, statement, parameters=None):
+
+        with self.engine.begin() as connection:
+            connection.execute(text(statement), parameters or {})
+
+class SystematikDaoTest(DatabaseTestCase):
+
+    def test_fetch_tree(self):
+
+        tree = self.dao.fetch_tree(SystematikTree)
+        self.assertEqual(tree.get_node_count(), self.dao.count_nodes())
+        self.assertEqual(tree.find_node(SystematikIdentifier("1.I-2")).beschreibung, "Hamburg")
+
+    def test_usage_map_normalizes_the_references(self):
+
+        self.execute("insert into broschueren (titel, systematik1, systematik2) values ('B', '1.I-1', ' 2.1 ')")
+        self.execute("insert into dokument (hauptnr, standort) values (1, '2.1.')")
+        self.execute("insert into sverweis (hauptnr, systematik, roemisch, sub) values (1, '1', 1, 1)")
+        usage_map = self.dao.fetch_usage_map()
+        self.assertEqual(usage_map[SystematikIdentifier("1.I-1")].broschueren, 1)
+        self.assertEqual(usage_map[SystematikIdentifier("1.I-1")].verweise, 1)
+        self.assertEqual(usage_map[SystematikIdentifier("2.1")].get_total(), 2)
+
+    def test_usage_checks_agree_with_the_usage_map(self):
+
+        self.execute("insert into broschueren (titel, systematik1, systematik2) values ('B', ' 2.1 ', null)")
+        self.execute("insert into dokument (hauptnr, standort) values (1, '2.10.')")
+        self.execute("insert into sverweis (hauptnr, systematik, roemisch, sub) values (2, '0.2.', null, null)")
+        self.execute("insert into dokument (hauptnr, standort) values (3, '1.I-0')")
+        usage_map = self.dao.fetch_usage_map()
+        for identifier in [SystematikIdentifier(point) for point in ("2.1", "2.10", "0.2", "1.I", "2.2")]:
+            self.assertEqual(self.dao.is_used(identifier), identifier in usage_map, identifier)
+            self.assertEqual(self.dao.find_first_usage(identifier) is not None, identifier in usage_map, identifier)
+        self.assertNotIn(SystematikIdentifier("1.I"), usage_map)
+        self.assertEqual(self.dao.find_first_usage(SystematikIdentifier("2.10")), "Alexandria-Dokument Nr. 1")
+
+    def test_delete_used_node_is_forbidden(self):
+
+        tree = self.dao.fetch_tree(SystematikTree)
+        self.execute("insert into dokument (hauptnr, standort) values (1, '2.10 ')")
+        with self.assertRaises(DeletionForbiddenException) as context:
+            self.dao.delete_node(tree.find_node(SystematikIdentifier("2.10")))
+        self.assertNotEqual("%s" % context.exception, "")
+        self.assertTrue(self.dao.exists(SystematikIdentifier("2.10")))
+
+class JoinCheckerTest(DatabaseTestCase):
+
+    def create_injector(self):
+
+        return Injector([lambda binder: binder.bind(Engine, to=self.engine)])
+
+    def test_singleton(self):
+
+        injector = self.create_injector()
+        self.assertIs(injector.get(JoinChecker), injector.get(JoinChecker))
+
+    def test_malformed_and_dangling_references(self):
+
+        self.execute("insert into broschueren (titel, systematik1, systematik2) values ('A', '1.I-1', '1.IV-x')")
+        self.execute("insert into broschueren (titel, systematik1, systematik2) values ('B', ' 1.I-1 ', '9.9')")
+        self.execute("insert into dokument (hauptnr, standort) values (1, '2.2')")
+        self.execute("insert into dokument (hauptnr, standort) values (2, '1.I-0')")
+        results = dict([("%s.%s" % (result.table, result.column), result)
+                        for result in self.create_injector().get(JoinChecker).check()])
+        self.assertTrue(results['broschueren.systematik1'].is_ok())
+        self.assertEqual(results['broschueren.systematik1'].rows, 2)
+        self.assertEqual([value for value, count, error in results['broschueren.systematik2'].malformed], ['1.IV-x'])
+        self.assertEqual(results['broschueren.systematik2'].dangling, [('9.9', 1)])
+        self.assertEqual([(value, error) for value, count, error in results['dokument.standort'].malformed],
+                         [('1.I-0', "Schreibweise von 1.I")])
+
+if __name__ == '__main__':
+    unittest.main()
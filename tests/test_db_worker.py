@@ -0,0 +1,118 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import os
+import tempfile
+import threading
+import unittest
+from asb_systematik.SystematikDao import SystematikDao
+from systematik_data import create_database
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+try:
+    from PyQt5.QtWidgets import QApplication
+    from asb_systematik.SystematikDbWorker import SystematikDbWorker
+except ImportError:
+    raise unittest.SkipTest("The worker tests need PyQt5")
+
+APPLICATION = QApplication.instance() or QApplication([])
+
+class SystematikDbWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_database(os.path.join(self.directory.name, 'systematik.db'))
+        self.worker = SystematikDbWorker(SystematikDao(self.engine))
+        self.events = []
+
+    def tearDown(self):
+
+        self.worker.wait_for_done()
+        APPLICATION.processEvents()
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def submit(self, operation):
+
+        return self.worker.submit(operation,
+                                  lambda result: self.events.append(('finished', result)),
+                                  lambda exception: self.events.append(('failed', type(exception).__name__)),
+                                  lambda: self.events.append(('cancelled',)),
+                                  lambda done, total: self.events.append(('progress', done, total)))
+
+    def wait(self, task):
+
+        while not task.done:
+            self.worker.wait_for_done()
+            APPLICATION.processEvents()
+
+    def test_result_and_progress_on_the_gui_thread(self):
+
+        def count(dao, task):
+            task.report_progress(0, 1)
+            return dao.count_nodes()
+
+        task = self.submit(count)
+        self.wait(task)
+        self.assertEqual(self.events, [('progress', 0, 1), ('finished', 15)])
+
+    def test_failure(self):
+
+        def fail(dao, task):
+            raise ValueError("kaputt")
+
+        task = self.submit(fail)
+        self.wait(task)
+        self.assertEqual(self.events, [('failed', 'ValueError')])
+
+    def test_cancel_while_running(self):
+
+        started = threading.Event()
+        cancelled = threading.Event()
+
+        def wait_for_cancel(dao, task):
+            started.set()
+            cancelled.wait(5)
+            task.report_progress(1, 2)
+            task.check_cancelled()
+            return dao.count_nodes()
+
+        task = self.submit(wait_for_cancel)
+        started.wait(5)
+        task.cancel()
+        cancelled.set()
+        self.wait(task)
+        self.assertEqual(self.events, [('cancelled',)])
+
+    def test_cancelled_task_is_not_run(self):
+
+        block = threading.Event()
+        runs = []
+        blockers = [self.worker.submit(lambda dao, task: block.wait(5)) for _ in range(self.worker.MAX_THREADS)]
+        task = self.submit(lambda dao, task: runs.append(True))
+        task.cancel()
+        block.set()
+        self.wait(task)
+        for blocker in blockers:
+            self.wait(blocker)
+        self.assertEqual(runs, [])
+        self.assertEqual(self.events, [('cancelled',)])
+
+    def test_writes_of_a_cancelled_task_are_rolled_back(self):
+
+        def delete_all(dao, task):
+            dao.connection.exec_driver_sql("delete from systematik")
+            task.cancel()
+            task.check_cancelled()
+
+        task = self.submit(delete_all)
+        self.wait(task)
+        self.assertEqual(self.events, [('cancelled',)])
+        self.assertEqual(SystematikDao(self.engine).count_nodes(), 15)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import unittest
+from asb_systematik.SystematikDao import SystematikIdentifier
+from asb_systematik.SystematikExport import export, HtmlExporter, MarkdownExporter,\
+    CsvExporter, JsonExporter
+from systematik_data import create_tree
+
+def run_export(exporter_class, start_identifier=None):
+
+    tree = create_tree()
+    output = io.StringIO()
+    start_node = None
+    if start_identifier is not None:
+        start_node = tree.find_node(SystematikIdentifier(start_identifier))
+    export(tree, [exporter_class(output)], start_node)
+    return output.getvalue()
+
+class SystematikExportTest(unittest.TestCase):
+
+    def test_json_is_nested_like_the_tree(self):
+
+        root = json.loads(run_export(JsonExporter))
+        self.assertIsNone(root['systematikpunkt'])
+        self.assertEqual([child['systematikpunkt'] for child in root['children']], ["0", "1", "2"])
+        roman = root['children'][1]['children'][1]
+        self.assertEqual(roman['systematikpunkt'], "1.I")
+        self.assertEqual([child['beschreibung'] for child in roman['children']], ["Berlin", "Hamburg"])
+
+    def test_csv_has_all_points_with_depth(self):
+
+        rows = list(csv.reader(io.StringIO(run_export(CsvExporter)), delimiter=';'))
+        self.assertEqual(rows[0][0], 'systematikpunkt')
+        self.assertEqual(len(rows), 16)
+        self.assertIn(["1.I-2", "Hamburg", "", "", "", "", "", "3"], rows)
+
+    def test_html_lists_are_balanced(self):
+
+        html = run_export(HtmlExporter)
+        self.assertEqual(html.count("<ul>"), html.count("</ul>"))
+        self.assertEqual(html.count("<li "), html.count("</li>"))
+        self.assertIn("<li id=\"2.10\">2.10: Verkehr</li>", html)
+
+    def test_markdown_lists(self):
+
+        lines = run_export(MarkdownExporter).split("\n")
+        self.assertIn("- **1.I**: Regionales", lines)
+        # Sub points are nested below roman points only
+        self.assertIn("    - 1.I-1: Berlin", lines)
+        self.assertIn("- 1-1: Sonstiges", lines)
+        # A heading after a list item ends the list
+        heading = lines.index("### 1.1: Frauenbewegung")
+        self.assertEqual(lines[heading - 1], "")
+
+    def test_subtree(self):
+
+        root = json.loads(run_export(JsonExporter, "2"))
+        self.assertEqual(root['systematikpunkt'], "2")
+        self.assertEqual(len(root['children']), 3)
+
+    def test_reporting_is_not_imported(self):
+
+        # It sets the locale on import. Checked in a new interpreter,
+        # the other tests may have imported it already.
+        result = subprocess.run([sys.executable, "-c",
+                                 "import sys; import asb_systematik.SystematikExport; " +
+                                 "print('asb_systematik.SystematikReporting' in sys.modules)"],
+                                env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+                                stdout=subprocess.PIPE, check=True, universal_newlines=True)
+        self.assertEqual(result.stdout.strip(), "False")
+
+if __name__ == '__main__':
+    unittest.main()
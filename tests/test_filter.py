@@ -0,0 +1,64 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import unittest
+from asb_systematik.SystematikDao import SystematikIdentifier
+from asb_systematik.SystematikFilter import SystematikFilterEngine, normalize_text
+from systematik_data import create_tree
+
+class SystematikFilterEngineTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tree = create_tree()
+        self.engine = SystematikFilterEngine(self.tree)
+
+    def visible_identifiers(self, result):
+
+        return ["%s" % node.identifier for node, is_visible in zip(result.nodes, result.visible)
+                if is_visible and node is not self.tree.rootnode]
+
+    def test_normalize_text(self):
+
+        self.assertEqual(normalize_text("Müll"), "MULL")
+        self.assertEqual(normalize_text(None), "")
+
+    def test_ancestors_of_matches_are_visible(self):
+
+        result = self.engine.filter("hamburg")
+        self.assertEqual(self.visible_identifiers(result), ["1", "1.I", "1.I-2"])
+
+    def test_diacritics_are_ignored(self):
+
+        self.assertEqual(self.visible_identifiers(self.engine.filter("MULL")), ["0", "0.2"])
+
+    def test_empty_query_shows_everything(self):
+
+        result = self.engine.filter("")
+        self.assertTrue(all(result.visible))
+
+    def test_extended_query_searches_the_previous_matches(self):
+
+        self.engine.filter("R")
+        self.assertEqual(self.visible_identifiers(self.engine.filter("RE")),
+                         self.visible_identifiers(SystematikFilterEngine(self.tree).filter("RE")))
+
+    def test_changed_positions(self):
+
+        self.engine.filter("hamburg")
+        result = self.engine.filter("berlin")
+        self.assertEqual(sorted(["%s" % node.identifier for node, is_visible in result.get_changed_nodes()]),
+                         ["1.I-1", "1.I-2"])
+
+    def test_content_changes_are_picked_up(self):
+
+        self.engine.filter("bremen")
+        node = self.tree.find_node(SystematikIdentifier("1.I-2"))
+        node.beschreibung = "Bremen"
+        self.tree.mark_content_changed(node)
+        self.assertEqual(self.visible_identifiers(self.engine.filter("bremen")), ["1", "1.I", "1.I-2"])
+
+if __name__ == '__main__':
+    unittest.main()
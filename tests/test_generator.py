@@ -0,0 +1,56 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import os
+import tempfile
+import unittest
+from sqlalchemy.engine.create import create_engine
+from asb_systematik.SystematikDao import SystematikDao, SystematikTree, JoinChecker
+from asb_systematik.benchmark.SystematikGenerator import SystematikGenerator,\
+    DatabaseNotEmptyException
+
+class SystematikGeneratorTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_engine("sqlite:///%s" % os.path.join(self.directory.name, 'generated.db'))
+        self.generator = SystematikGenerator(node_count=500, broschueren=200, zeitschriften=50,
+                                             dokumente=300, verweise=40)
+
+    def tearDown(self):
+
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def test_generated_data_is_reproducible(self):
+
+        self.assertEqual(self.generator.generate_identifiers(), SystematikGenerator(node_count=500).generate_identifiers())
+        self.assertNotEqual(self.generator.generate_identifiers(),
+                            SystematikGenerator(node_count=500, seed=2).generate_identifiers())
+
+    def test_load_gives_a_complete_tree(self):
+
+        self.generator.load(self.engine)
+        dao = SystematikDao(self.engine)
+        tree = dao.fetch_tree(SystematikTree)
+        self.assertEqual(tree.get_node_count(), 500)
+        self.assertEqual(tree.orphans, [])
+        self.assertEqual(tree.build_result.duplicates, [])
+        self.assertEqual(sum([usage.verweise for usage in dao.fetch_usage_map().values()]), 40)
+        for check_result in JoinChecker(self.engine).check():
+            self.assertTrue(check_result.is_ok(), "%s" % check_result)
+
+    def test_existing_tables_are_only_replaced_on_request(self):
+
+        self.generator.load(self.engine)
+        with self.assertRaises(DatabaseNotEmptyException):
+            self.generator.load(self.engine)
+        SystematikGenerator(node_count=100, broschueren=10, zeitschriften=10, dokumente=10,
+                            verweise=10).load(self.engine, replace=True)
+        self.assertEqual(SystematikDao(self.engine).count_nodes(), 100)
+
+if __name__ == '__main__':
+    unittest.main()
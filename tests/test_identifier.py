@@ -0,0 +1,31 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import unittest
+from asb_systematik.SystematikDao import SystematikIdentifier
+
+class SystematikIdentifierTest(unittest.TestCase):
+
+    def test_string_and_database_form_are_the_same_identifier(self):
+
+        self.assertIs(SystematikIdentifier("1.2.IV-3"), SystematikIdentifier("1.2", 4, 3))
+        self.assertIs(SystematikIdentifier("1.2", 0, 0), SystematikIdentifier("1.2"))
+        self.assertEqual("%s" % SystematikIdentifier("1.2", 4, 3), "1.2.IV-3")
+
+    def test_parent(self):
+
+        self.assertIs(SystematikIdentifier("1.2.IV-3").parent, SystematikIdentifier("1.2.IV"))
+        self.assertIs(SystematikIdentifier("1.2.IV").parent, SystematikIdentifier("1.2"))
+        self.assertIs(SystematikIdentifier("1.2").parent, SystematikIdentifier("1"))
+        self.assertIs(SystematikIdentifier("1").parent, SystematikIdentifier(None))
+
+    def test_natural_order(self):
+
+        identifiers = [SystematikIdentifier(string) for string in ("2.10", "1.I", "2.2", "1", "1-1", "1.1")]
+        self.assertEqual(["%s" % identifier for identifier in sorted(identifiers)],
+                         ["1", "1-1", "1.I", "1.1", "2.2", "2.10"])
+
+if __name__ == '__main__':
+    unittest.main()
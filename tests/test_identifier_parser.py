@@ -0,0 +1,58 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import unittest
+from asb_systematik.SystematikIdentifierParser import parse_identifier_string,\
+    parse_many, to_roman, from_roman, IdentifierParseError
+from asb_systematik.SystematikDao import SystematikIdentifier
+
+class IdentifierParserTest(unittest.TestCase):
+
+    def test_plain_point(self):
+
+        self.assertEqual(parse_identifier_string("1.2.3"), ("1.2.3", None, None))
+
+    def test_whitespace_and_trailing_dot(self):
+
+        self.assertEqual(parse_identifier_string(" 1. 2 ."), ("1.2", None, None))
+
+    def test_roman_and_sub(self):
+
+        self.assertEqual(parse_identifier_string("1.2.IV-3"), ("1.2", 4, 3))
+        self.assertEqual(parse_identifier_string("1.2.IV"), ("1.2", 4, None))
+        self.assertEqual(parse_identifier_string("1.2-3"), ("1.2", None, 3))
+
+    def test_sub_zero_is_no_sub(self):
+
+        self.assertEqual(parse_identifier_string("1.IV-0"), ("1", 4, None))
+
+    def test_malformed(self):
+
+        for string in ("1.IV-1-2", "1.IV-x", "IV", "1.IIII"):
+            with self.assertRaises(IdentifierParseError, msg=string):
+                parse_identifier_string(string)
+
+    def test_roman_numerals(self):
+
+        self.assertEqual(to_roman(1994), "MCMXCIV")
+        self.assertEqual(from_roman("MCMXCIV"), 1994)
+        with self.assertRaises(IdentifierParseError):
+            to_roman(0)
+
+    def test_parse_many_reports_errors_per_item(self):
+
+        results = parse_many(["1.I", "1.IV-x", None, "2"])
+        self.assertEqual([result.is_valid() for result in results], [True, False, False, True])
+        self.assertEqual(results[0].identifier, ("1", 1, None))
+        self.assertIsNotNone(results[1].error)
+
+    def test_parse_many_creates_identifiers(self):
+
+        results = SystematikIdentifier.parse_many(["1.I-2", "1.I-x"])
+        self.assertIs(results[0].identifier, SystematikIdentifier("1", 1, 2))
+        self.assertFalse(results[1].is_valid())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import io
+import os
+import tempfile
+import unittest
+from asb_systematik.SystematikDao import SystematikDao, SystematikTree, SystematikIdentifier,\
+    SystematikNode
+from asb_systematik.SystematikImporter import SystematikImporter, SystematikImportException
+from systematik_data import create_database, create_tree
+
+class SystematikImporterTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_database(os.path.join(self.directory.name, 'systematik.db'))
+        self.dao = SystematikDao(self.engine)
+        self.importer = SystematikImporter(self.dao)
+
+    def tearDown(self):
+
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def test_read_csv(self):
+
+        records = self.importer.read_csv(io.StringIO("Systematikpunkt;Beschreibung;Startjahr\n2.3;Neu;1980\n"))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].line, 2)
+        self.assertEqual(records[0].raw_identifier, "2.3")
+        self.assertEqual(records[0].values, {'beschreibung': "Neu", 'startjahr': "1980"})
+
+    def test_validate_collects_all_errors(self):
+
+        records = self.importer.read_json(io.StringIO(
+            '[{"systematikpunkt": "1.IV-x", "beschreibung": "Kaputt"},' +
+            ' {"systematikpunkt": "2.3", "beschreibung": "Neu", "startjahr": "bald"},' +
+            ' {"systematikpunkt": "2.4", "beschreibung": ""},' +
+            ' {"systematikpunkt": "7.1", "beschreibung": "Ohne Eltern"},' +
+            ' {"systematikpunkt": "2.5", "beschreibung": "Einmal"},' +
+            ' {"systematikpunkt": "2.5", "beschreibung": "Zweimal"},' +
+            ' {"beschreibung": "Ohne Punkt"}]'))
+        nodes, errors = self.importer.validate(records, create_tree())
+        self.assertEqual(sorted([error.line for error in errors]), [1, 2, 3, 4, 6, 7])
+        self.assertEqual(["%s" % node.identifier for node in nodes], ["7.1", "2.5"])
+
+    def test_parent_in_the_same_file(self):
+
+        records = self.importer.read_json(io.StringIO(
+            '[{"systematikpunkt": "3.1", "beschreibung": "Kind"}, {"systematikpunkt": "3", "beschreibung": "Eltern"}]'))
+        nodes, errors = self.importer.validate(records, create_tree())
+        self.assertEqual(errors, [])
+        self.assertEqual(len(nodes), 2)
+
+    def test_import_inserts_and_updates(self):
+
+        records = self.importer.read_csv(io.StringIO(
+            "systematikpunkt,beschreibung,kommentar\n2.3,Neu,\n2.1,Atomkraft,Nein danke\n"))
+        inserted, updated = self.importer.import_records(records)
+        self.assertEqual(["%s" % node.identifier for node in inserted], ["2.3"])
+        self.assertEqual(["%s" % node.identifier for node in updated], ["2.1"])
+        tree = self.dao.fetch_tree(SystematikTree)
+        self.assertEqual(tree.find_node(SystematikIdentifier("2.3")).beschreibung, "Neu")
+        self.assertIsNone(tree.find_node(SystematikIdentifier("2.3")).kommentar)
+        self.assertEqual(tree.find_node(SystematikIdentifier("2.1")).kommentar, "Nein danke")
+
+    def test_nothing_is_written_on_errors(self):
+
+        count = self.dao.count_nodes()
+        records = self.importer.read_csv(io.StringIO("systematikpunkt,beschreibung\n2.3,Neu\n8.1,Ohne Eltern\n"))
+        with self.assertRaises(SystematikImportException) as context:
+            self.importer.import_records(records)
+        self.assertEqual(len(context.exception.errors), 1)
+        self.assertEqual(self.dao.count_nodes(), count)
+
+    def test_dry_run(self):
+
+        count = self.dao.count_nodes()
+        records = self.importer.read_csv(io.StringIO("systematikpunkt,beschreibung\n2.3,Neu\n"))
+        inserted, updated = self.importer.import_records(records, dry_run=True)
+        self.assertEqual(len(inserted), 1)
+        self.assertEqual(self.dao.count_nodes(), count)
+
+class BulkWriteTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_database(os.path.join(self.directory.name, 'systematik.db'))
+        self.dao = SystematikDao(self.engine)
+
+    def tearDown(self):
+
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def test_insert_nodes_reads_the_ids(self):
+
+        nodes = [SystematikNode(SystematikIdentifier(identifier), "Neu") for identifier in ("2.3", "2.3.1", "0-2")]
+        self.dao.insert_nodes(nodes)
+        for node in nodes:
+            self.assertEqual(self.dao.fetch_by_id(node.id).identifier, node.identifier)
+        self.dao.insert_nodes([])
+        self.assertEqual(self.dao.count_nodes(), 18)
+
+    def test_upsert_nodes(self):
+
+        updated_node = SystematikNode(SystematikIdentifier("2.1"), "Atomkraft? Nein danke")
+        new_node = SystematikNode(SystematikIdentifier("2.3"), "Neu")
+        inserted, updated = self.dao.upsert_nodes([updated_node, new_node])
+        self.assertEqual((inserted, updated), ([new_node], [updated_node]))
+        self.assertEqual(updated_node.id, 13)
+        self.assertEqual(self.dao.fetch_by_id(13).beschreibung, "Atomkraft? Nein danke")
+        self.assertEqual(self.dao.fetch_by_identifier_object(SystematikIdentifier("2.3")).id, new_node.id)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import json
+import os
+import tempfile
+import unittest
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine.create import create_engine
+from sqlalchemy.sql.expression import text
+from asb_systematik.SystematikInstrumentation import SystematikInstrumentation
+
+class SystematikInstrumentationTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'statistics.json')
+        # Not installed: the events are registered for the engine of
+        # the test only, and nothing is dumped at exit
+        self.instrumentation = SystematikInstrumentation(self.path, slow_statement_seconds=10)
+        self.engine = create_engine("sqlite://")
+        event.listen(self.engine, 'before_cursor_execute', self.instrumentation._before_cursor_execute)
+        event.listen(self.engine, 'after_cursor_execute', self.instrumentation._after_cursor_execute)
+
+    def tearDown(self):
+
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def query(self, value=1):
+
+        with self.engine.connect() as connection:
+            return connection.execute(text("select :value"), {'value': value}).scalar()
+
+    def get_operation(self, name):
+
+        return self.instrumentation.get_statistics()['operations'][name]
+
+    def test_disabled_instrumentation_changes_nothing(self):
+
+        def query():
+            return self.query()
+
+        instrumentation = SystematikInstrumentation()
+        self.assertIs(instrumentation.instrument('dao.query')(query), query)
+        self.assertIs(instrumentation.instrument_class(SystematikInstrumentationTest, 'test'), SystematikInstrumentationTest)
+
+    def test_calls_errors_and_queries(self):
+
+        @self.instrumentation.instrument('service.load')
+        def load(fail=False):
+            self.query()
+            nested()
+            if fail:
+                raise ValueError("kaputt")
+
+        @self.instrumentation.instrument('dao.fetch')
+        def nested():
+            self.query()
+
+        load()
+        with self.assertRaises(ValueError):
+            load(True)
+        load_statistics = self.get_operation('service.load')
+        self.assertEqual((load_statistics['calls'], load_statistics['errors']), (2, 1))
+        self.assertEqual(load_statistics['queries'], 4)
+        self.assertEqual(self.get_operation('dao.fetch')['queries'], 2)
+        self.assertGreaterEqual(load_statistics['max_wall_time'], load_statistics['mean_wall_time'])
+
+    def test_generators_are_measured_while_consumed(self):
+
+        @self.instrumentation.instrument('dao.iterate')
+        def iterate():
+            for value in range(0, 3):
+                yield self.query(value)
+
+        generator = iterate()
+        self.assertNotIn('dao.iterate', self.instrumentation.operations)
+        self.assertEqual(list(generator), [0, 1, 2])
+        self.assertEqual(self.get_operation('dao.iterate')['queries'], 3)
+
+    def test_slow_statements_are_logged(self):
+
+        self.instrumentation.slow_statement_seconds = 0
+        with self.assertLogs('asb_systematik.SystematikInstrumentation', 'WARNING'):
+            with self.instrumentation.measure('gui.save'):
+                self.query(42)
+        slow_statement = self.instrumentation.slow_statements[-1]
+        self.assertEqual(slow_statement['operation'], 'gui.save')
+        self.assertIn('42', slow_statement['parameters'])
+
+    def test_instrument_class(self):
+
+        class Dao:
+
+            def fetch(self):
+                return 1
+
+            def _private(self):
+                return 2
+
+            @contextmanager
+            def unit_of_work(self):
+                yield
+
+        fetch = Dao.fetch
+        self.instrumentation.instrument_class(Dao, 'dao')
+        self.assertIsNot(Dao.fetch, fetch)
+        self.assertEqual(Dao().fetch(), 1)
+        self.assertEqual(Dao()._private(), 2)
+        with Dao().unit_of_work():
+            pass
+        self.assertEqual(list(self.instrumentation.operations.keys()), ['dao.fetch'])
+
+    def test_slot_drops_the_surplus_signal_arguments(self):
+
+        calls = []
+
+        @self.instrumentation.instrument_slot('gui.click')
+        def clicked():
+            calls.append(True)
+
+        clicked(False)
+        self.assertEqual(calls, [True])
+        self.assertEqual(self.get_operation('gui.click')['calls'], 1)
+
+    def test_dump(self):
+
+        self.instrumentation.add_statistics_provider('statement_cache', lambda: {'hits': 3})
+        with self.instrumentation.measure('dao.count'):
+            self.query()
+        self.instrumentation.dump()
+        with open(self.path) as statistics_file:
+            statistics = json.load(statistics_file)
+        self.assertEqual(statistics['operations']['dao.count']['queries'], 1)
+        self.assertEqual(statistics['statement_cache'], {'hits': 3})
+        self.assertEqual(statistics['slow_statements'], [])
+        self.assertEqual(statistics['profiles'], {})
+
+if __name__ == '__main__':
+    unittest.main()
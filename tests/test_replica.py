@@ -0,0 +1,204 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import os
+import tempfile
+import unittest
+from sqlalchemy.engine.create import create_engine
+from sqlalchemy.sql.expression import text
+from asb_systematik.SystematikDao import SystematikDao, SystematikTree, SystematikIdentifier,\
+    SystematikNode, USAGE_CHANGE_TABLE
+from asb_systematik.SystematikChangeTracking import install_change_tracking,\
+    install_usage_change_tracking, purge_changes
+from asb_systematik.SystematikReplica import create_replica_dao, ReadOnlyReplicaException,\
+    ReplicaNotInitializedException
+from systematik_data import create_database
+
+VERWEISE = ((1, '1', 1, 1), (1, '1', 1, 1), (1, '2.1', 0, 0), (2, '2.2', None, None))
+
+class ReplicaTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.primary_engine = create_database(os.path.join(self.directory.name, 'primary.db'))
+        self.execute("insert into broschueren (id, titel, systematik1, systematik2) values (1, 'Broschüre', '2.1', null)")
+        self.execute("insert into dokument (hauptnr, standort) values (1, '2.10')")
+        for row in VERWEISE:
+            self.execute("insert into sverweis (hauptnr, systematik, roemisch, sub) values (:hauptnr, :systematik, :roemisch, :sub)",
+                         dict(zip(('hauptnr', 'systematik', 'roemisch', 'sub'), row)))
+        self.replica_path = os.path.join(self.directory.name, 'replica.db')
+        self.dao = None
+
+    def tearDown(self):
+
+        if self.dao is not None:
+            self.dao.engine.dispose()
+        self.primary_engine.dispose()
+        self.directory.cleanup()
+
+    def execute(self, statement, parameters=None, engine=None):
+
+        with (engine or self.primary_engine).begin() as connection:
+            connection.execute(text(statement), parameters or {})
+
+    def fetch_rows(self, statement, engine):
+
+        with engine.connect() as connection:
+            return sorted([tuple(row) for row in connection.execute(text(statement))], key=repr)
+
+    def assert_copy_equals_primary(self):
+
+        for statement in ("select * from systematik", "select id, titel, systematik1, systematik2 from broschueren",
+                          "select hauptnr, standort from dokument",
+                          "select hauptnr, systematik, roemisch, sub from sverweis"):
+            self.assertEqual(self.fetch_rows(statement, self.dao.engine), self.fetch_rows(statement, self.primary_engine))
+
+    def create_dao(self, route_writes=False):
+
+        self.dao = create_replica_dao(self.primary_engine, self.replica_path, route_writes)
+        return self.dao
+
+class SystematikReplicaTest(ReplicaTestCase):
+
+    def test_first_sync_copies_everything(self):
+
+        dao = self.create_dao()
+        self.assert_copy_equals_primary()
+        self.assertEqual(dao.fetch_tree(SystematikTree).get_node_count(), 15)
+        self.assertTrue(dao.is_used(SystematikIdentifier("1.I-1")))
+
+    def test_writes_are_refused(self):
+
+        dao = self.create_dao()
+        node = dao.fetch_by_id(13)
+        node.beschreibung = "Atom"
+        with self.assertRaises(ReadOnlyReplicaException):
+            dao.update_node(node)
+
+    def test_routed_writes(self):
+
+        dao = self.create_dao(route_writes=True)
+        tree = dao.fetch_tree(SystematikTree)
+        node = tree.find_node(SystematikIdentifier("2.1"))
+        node.beschreibung = "Atom"
+        dao.update_node(node)
+        new_node = SystematikNode(SystematikIdentifier("2.3"), "Neu")
+        dao.insert_node(new_node)
+        dao.delete_node(tree.find_node(SystematikIdentifier("0.2")))
+        self.assertEqual(SystematikDao(self.primary_engine).fetch_by_id(13).beschreibung, "Atom")
+        self.assert_copy_equals_primary()
+        self.assertEqual(dao.fetch_by_identifier_object(SystematikIdentifier("2.3")).id, new_node.id)
+
+    def test_sverweis_is_compared_as_multiset(self):
+
+        dao = self.create_dao()
+        self.assertEqual(dao.sync(True), 0)
+        self.execute("delete from sverweis where rowid = (select min(rowid) from sverweis where systematik = '1')")
+        self.execute("insert into sverweis (hauptnr, systematik, roemisch, sub) values (3, '2.2', null, null)")
+        self.assertEqual(dao.sync(True), 2)
+        self.assert_copy_equals_primary()
+
+    def test_usage_tables_only_on_full_sync_without_change_log(self):
+
+        dao = self.create_dao()
+        self.execute("update dokument set standort = '2.2' where hauptnr = 1")
+        self.assertEqual(dao.sync(False), 0)
+        self.assertEqual(dao.sync(True), 1)
+        self.assert_copy_equals_primary()
+
+    def test_offline(self):
+
+        dao = self.create_dao()
+        dao.replica.primary_dao = SystematikDao(create_engine("sqlite:///%s" % os.path.join(
+            self.directory.name, 'missing', 'primary.db')))
+        with self.assertLogs('asb_systematik.SystematikReplica', 'WARNING'):
+            self.assertFalse(dao.try_sync())
+        self.assertFalse(dao.online)
+        self.assertEqual(dao.count_nodes(), 15)
+
+    def test_first_start_needs_the_primary_database(self):
+
+        with self.assertRaises(ReplicaNotInitializedException):
+            create_replica_dao(create_engine("sqlite:///%s" % os.path.join(self.directory.name, 'missing', 'primary.db')),
+                               self.replica_path)
+
+    def test_malformed_rows_are_reported_not_copied(self):
+
+        self.execute("insert into systematik (id, punkt, roemisch, sub, beschreibung) values (100, '1-a', 0, 0, 'Kaputt')")
+        with self.assertLogs('asb_systematik.SystematikReplica', 'WARNING') as logs:
+            dao = self.create_dao()
+        self.assertIn("100", logs.output[0])
+        self.assertEqual([row_id for row_id, error in dao.replica.malformed_rows], [100])
+        self.assertEqual(dao.count_nodes(), 15)
+
+    def test_poll_reads_only_the_copy(self):
+
+        dao = self.create_dao()
+        watermark = dao.fetch_watermark()
+        self.execute("update systematik set beschreibung = 'Atom' where id = 13")
+        self.assertEqual(dao.fetch_changes_since(watermark), (watermark, []))
+        dao.sync(True)
+        watermark, changes = dao.fetch_changes_since(watermark)
+        self.assertEqual([change.node.beschreibung for change in changes], ["Atom"])
+
+class ChangeLogReplicaTest(ReplicaTestCase):
+
+    def setUp(self):
+
+        super().setUp()
+        install_change_tracking(self.primary_engine)
+        install_usage_change_tracking(self.primary_engine)
+        self.compared = []
+
+    def count_comparisons(self, dao):
+
+        compare_table = dao.replica._compare_table
+
+        def count_comparison(connection, primary_connection, table, key, columns):
+            self.compared.append(table)
+            return compare_table(connection, primary_connection, table, key, columns)
+        dao.replica._compare_table = count_comparison
+
+    def test_only_logged_rows_are_copied(self):
+
+        dao = self.create_dao()
+        self.count_comparisons(dao)
+        self.execute("update systematik set beschreibung = 'Atom' where id = 13")
+        self.execute("update broschueren set systematik2 = '2.2' where id = 1")
+        self.execute("delete from dokument where hauptnr = 1")
+        self.execute("insert into zeitschriften (id, titel, systematik1) values (1, 'Zeitschrift', '0.1')")
+        self.execute("delete from sverweis where hauptnr = 2")
+        self.execute("insert into sverweis (hauptnr, systematik, roemisch, sub) values (1, '1', 1, 1)")
+        self.assertEqual(dao.sync(False), 6)
+        self.assertEqual(self.compared, [])
+        self.assert_copy_equals_primary()
+        self.assertEqual(dao.sync(False), 0)
+
+    def test_malformed_row_in_the_change_log(self):
+
+        dao = self.create_dao()
+        self.execute("update systematik set punkt = '2-a' where id = 15")
+        with self.assertLogs('asb_systematik.SystematikDao', 'WARNING'):
+            dao.sync(False)
+        self.assertFalse(dao.exists(SystematikIdentifier("2.2")))
+        self.assertEqual(dao.count_nodes(), 14)
+
+    def test_purged_log_leads_to_a_comparison(self):
+
+        dao = self.create_dao()
+        self.count_comparisons(dao)
+        self.execute("update dokument set standort = '2.2' where hauptnr = 1")
+        self.execute("update dokument set standort = '2.1' where hauptnr = 1")
+        with self.primary_engine.connect() as connection:
+            watermark = connection.execute(text("select max(id) from %s" % USAGE_CHANGE_TABLE)).scalar()
+        purge_changes(self.primary_engine, watermark, USAGE_CHANGE_TABLE)
+        self.execute("update dokument set standort = '0.1' where hauptnr = 1")
+        dao.sync(False)
+        self.assertEqual(self.compared, ['broschueren', 'zeitschriften', 'dokument', 'sverweis'])
+        self.assert_copy_equals_primary()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import os
+import unittest
+from asb_systematik.SystematikDao import SystematikDao, SystematikIdentifier
+from asb_systematik.SystematikSnapshot import SystematikSnapshotStore
+from test_replica import ReplicaTestCase
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+try:
+    from PyQt5.QtWidgets import QApplication
+    from asb_systematik.SystematikDbWorker import SystematikDbWorker
+    from asb_systematik.SystematikTreeWidgetService import SystematikTreeWidgetService
+    from asb_systematik.SystematikChangePoller import SystematikChangePoller
+    from asb_systematik.SystematikReplicaSyncer import SystematikReplicaSyncer
+except ImportError:
+    raise unittest.SkipTest("The syncer tests need PyQt5")
+
+APPLICATION = QApplication.instance() or QApplication([])
+
+class SystematikReplicaSyncerTest(ReplicaTestCase):
+
+    def setUp(self):
+
+        super().setUp()
+        dao = self.create_dao()
+        self.db_worker = SystematikDbWorker(dao)
+        self.service = SystematikTreeWidgetService(
+            dao, SystematikSnapshotStore(os.path.join(self.directory.name, 'systematik.snapshot')), self.db_worker)
+        self.poller = SystematikChangePoller(self.service, self.db_worker)
+        self.syncer = SystematikReplicaSyncer(dao, self.db_worker, self.poller)
+        self.service.tree
+
+    def tearDown(self):
+
+        self.db_worker.wait_for_done()
+        APPLICATION.processEvents()
+        super().tearDown()
+
+    def wait_for_worker(self):
+
+        while len(self.db_worker._running_tasks) > 0:
+            self.db_worker.wait_for_done()
+            APPLICATION.processEvents()
+
+    def test_sync_in_the_background_reaches_the_tree(self):
+
+        self.execute("update systematik set beschreibung = 'Atom' where id = 13")
+        self.dao.replica.last_full_sync = None
+        self.syncer.sync()
+        self.wait_for_worker()
+        self.assertEqual(self.service.tree.find_node(SystematikIdentifier("2.1")).beschreibung, "Atom")
+
+    def test_only_one_sync_at_a_time(self):
+
+        self.syncer.sync()
+        task = self.syncer._task
+        self.syncer.sync()
+        self.assertIs(self.syncer._task, task)
+        self.wait_for_worker()
+
+    def test_inactive_without_replica(self):
+
+        syncer = SystematikReplicaSyncer(SystematikDao(self.primary_engine), self.db_worker, self.poller)
+        self.assertFalse(syncer.is_active())
+        syncer.start()
+        syncer.sync()
+        self.assertFalse(syncer.timer.isActive())
+        self.assertIsNone(syncer._task)
+
+if __name__ == '__main__':
+    unittest.main()
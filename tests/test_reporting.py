@@ -0,0 +1,142 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import io
+import locale
+import os
+import tempfile
+import unittest
+from asb_systematik.SystematikDao import SystematikIdentifier
+from asb_systematik.SystematikExport import export, TexExporter
+from systematik_data import SAMPLE_POINTS, create_nodes
+
+try:
+    from asb_systematik.SystematikReporting import SystematikTexTree, SystematikTexPartCache,\
+        get_part_records, get_part_key, render_part
+except locale.Error:
+    raise unittest.SkipTest("SystematikReporting needs the locale de_DE.UTF-8")
+
+class SystematikTexPartCacheTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = SystematikTexPartCache(os.path.join(self.directory.name, 'tex'))
+
+    def tearDown(self):
+
+        self.directory.cleanup()
+
+    def test_put_and_get(self):
+
+        self.assertIsNone(self.cache.get('a'))
+        self.assertTrue(self.cache.put('a', ("\\item A", True, False)))
+        self.assertEqual(self.cache.get('a'), ("\\item A", True, False))
+
+    def test_unreadable_part_is_missing(self):
+
+        self.cache.put('a', ("\\item A", True, False))
+        with open(os.path.join(self.cache.directory, 'a.part'), 'wb') as part_file:
+            part_file.write(b'kaputt')
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_purge(self):
+
+        self.cache.put('a', ("A", False, False))
+        self.cache.put('b', ("B", False, False))
+        self.cache.purge(['b'])
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('b'))
+
+class RecordingOutput(io.StringIO):
+
+    def __init__(self):
+
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+
+        self.writes += 1
+        return super().write(text)
+
+class SystematikTexTreeTest(unittest.TestCase):
+
+    def create_tree(self, points=SAMPLE_POINTS):
+
+        return SystematikTexTree(create_nodes(points))
+
+    def test_document_is_written_node_by_node(self):
+
+        tree = self.create_tree()
+        output = RecordingOutput()
+        tree.write(output)
+        self.assertEqual(output.writes, tree.get_node_count() + 3)
+        self.assertEqual(output.getvalue(), "%s" % tree)
+        self.assertTrue(output.getvalue().startswith("\\documentclass"))
+        self.assertTrue(output.getvalue().rstrip().endswith("\\end{document}"))
+
+    def test_write_twice_gives_the_same_document(self):
+
+        tree = self.create_tree()
+        self.assertEqual("%s" % tree, "%s" % tree)
+
+    def test_start_node(self):
+
+        tree = self.create_tree()
+        output = io.StringIO()
+        tree.write(output, tree.find_node(SystematikIdentifier("2")))
+        self.assertIn("Atomkraft", output.getvalue())
+        self.assertNotIn("Hamburg", output.getvalue())
+
+    def test_tex_exporter_equals_the_document(self):
+
+        tree = self.create_tree()
+        document = io.StringIO()
+        tree.write(document)
+        exported = io.StringIO()
+        export(tree, [TexExporter(exported)])
+        self.assertEqual(exported.getvalue(), document.getvalue())
+
+    def test_part_key_depends_on_the_content(self):
+
+        tree = self.create_tree()
+        records = get_part_records(tree.rootnode.children[1])
+        self.assertEqual(records[0], ("1", "Frauen"))
+        self.assertEqual(get_part_key(records), get_part_key(list(records)))
+        self.assertNotEqual(get_part_key(records), get_part_key(records[:-1]))
+
+    def test_render_part(self):
+
+        tree = self.create_tree()
+        records = get_part_records(tree.rootnode.children[1])
+        tex, itemlist_open, descriptionlist_open = render_part(records)
+        self.assertIn("Hamburg", tex)
+
+    def test_parallel_output_equals_serial_output(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SystematikTexPartCache(directory)
+            tree = self.create_tree()
+            serial = io.StringIO()
+            tree.write(serial)
+            parallel = io.StringIO()
+            tree.write_parallel(parallel, cache, max_workers=2)
+            self.assertEqual(parallel.getvalue(), serial.getvalue())
+            self.assertEqual(len(os.listdir(directory)), len(tree.rootnode.children))
+
+            # Only the changed part is rendered again, the others come from the cache
+            points = [(identifier, "Energie" if identifier == "2.1" else beschreibung)
+                      for identifier, beschreibung in SAMPLE_POINTS]
+            tree = self.create_tree(points)
+            serial = io.StringIO()
+            tree.write(serial)
+            parallel = io.StringIO()
+            tree.write_parallel(parallel, cache, max_workers=2)
+            self.assertEqual(parallel.getvalue(), serial.getvalue())
+            self.assertEqual(len(os.listdir(directory)), len(tree.rootnode.children))
+
+if __name__ == '__main__':
+    unittest.main()
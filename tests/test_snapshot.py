@@ -0,0 +1,82 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import os
+import unittest
+from asb_systematik.SystematikDao import SystematikTree, SystematikIdentifier
+from asb_systematik.SystematikSnapshot import SystematikSnapshotStore, SNAPSHOT_HEADER
+from systematik_data import create_tree, identifiers
+from test_dao import DatabaseTestCase
+
+class SystematikSnapshotStoreTest(DatabaseTestCase):
+
+    def setUp(self):
+
+        super().setUp()
+        self.store = SystematikSnapshotStore(os.path.join(self.directory.name, 'cache', 'systematik.snapshot'))
+        self.database_reads = 0
+        fetch_tree = self.dao.fetch_tree
+
+        def count_database_reads(tree_implementation):
+            self.database_reads += 1
+            return fetch_tree(tree_implementation)
+        self.dao.fetch_tree = count_database_reads
+
+    def test_round_trip_keeps_orphans_and_duplicates(self):
+
+        tree = create_tree((("1", "Eins"), ("1.1", "Eins Eins"), ("3.1", "Ohne Eltern"), ("1", "Doppelt")))
+        self.assertTrue(self.store.save((4, 4, 0), tree))
+        loaded = self.store.load_tree(SystematikTree)
+        self.assertEqual(identifiers(loaded.traverse()), identifiers(tree.traverse()))
+        self.assertEqual(identifiers(loaded.orphans), ["3.1"])
+        self.assertEqual([node.beschreibung for node in loaded.build_result.duplicates], ["Doppelt"])
+        self.assertEqual(self.store.read_fingerprint(), (4, 4, 0))
+
+    def test_matching_snapshot_is_used(self):
+
+        self.store.fetch_tree(self.dao, SystematikTree)
+        tree = self.store.fetch_tree(self.dao, SystematikTree)
+        self.assertEqual(self.database_reads, 1)
+        self.assertEqual(tree.find_node(SystematikIdentifier("1.I-2")).beschreibung, "Hamburg")
+        self.assertIsNone(self.store.refresh(self.dao, SystematikTree))
+
+    def test_changed_content_invalidates_the_snapshot(self):
+
+        self.store.fetch_tree(self.dao, SystematikTree)
+        fingerprint = self.dao.fetch_fingerprint()
+        self.execute("update systematik set beschreibung = 'Atom' where id = 13")
+        self.assertEqual(self.dao.fetch_fingerprint()[:2], fingerprint[:2])
+        self.assertIsNone(self.store.load_tree(SystematikTree, self.dao.fetch_fingerprint()))
+        tree = self.store.fetch_tree(self.dao, SystematikTree)
+        self.assertEqual(self.database_reads, 2)
+        self.assertEqual(tree.find_node(SystematikIdentifier("2.1")).beschreibung, "Atom")
+        self.assertEqual(self.store.read_fingerprint(), self.dao.fetch_fingerprint())
+
+    def test_refresh_returns_the_new_tree(self):
+
+        self.store.fetch_tree(self.dao, SystematikTree)
+        self.execute("delete from systematik where id = 4")
+        tree = self.store.refresh(self.dao, SystematikTree)
+        self.assertIsNone(tree.find_node(SystematikIdentifier("0.2")))
+        self.assertEqual(self.store.read_fingerprint(), self.dao.fetch_fingerprint())
+        self.assertIsNone(self.store.refresh(self.dao, SystematikTree))
+
+    def test_damaged_snapshot_is_ignored(self):
+
+        self.store.fetch_tree(self.dao, SystematikTree)
+        with open(self.store.path, 'r+b') as snapshot_file:
+            snapshot_file.seek(SNAPSHOT_HEADER.size)
+            snapshot_file.write(b'kaputt')
+        self.assertIsNone(self.store.load_tree(SystematikTree))
+        self.assertEqual(self.store.fetch_tree(self.dao, SystematikTree).get_node_count(), 15)
+        self.assertEqual(self.database_reads, 2)
+
+    def test_missing_snapshot(self):
+
+        self.assertIsNone(self.store.read_fingerprint())
+        self.assertIsNone(self.store.load_tree(SystematikTree))
+
+if __name__ == '__main__':
+    unittest.main()
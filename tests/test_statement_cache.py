@@ -0,0 +1,125 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import unittest
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+from sqlalchemy.engine.create import create_engine
+from sqlalchemy.sql.expression import text, bindparam
+from asb_systematik.SystematikStatementCache import SystematikStatementCache,\
+    UnknownStatementException
+
+class RecordingResult:
+
+    def __init__(self, dialect):
+
+        self.context = self
+        self.cache_hit = dialect.CACHE_HIT
+
+class RecordingConnection:
+    """
+    Stands in for a connection to a PostgreSQL server and records
+    the statements instead of executing them.
+    """
+
+    def __init__(self):
+
+        self.dialect = PGDialect_psycopg2()
+        self.connection = self
+        self.info = {}
+        self.driver_sql = []
+        self.executed = []
+
+    def execution_options(self, **options):
+
+        return self
+
+    def exec_driver_sql(self, sql):
+
+        self.driver_sql.append(sql)
+
+    def execute(self, statement, parameters=None):
+
+        self.executed.append(("%s" % statement, parameters))
+        return RecordingResult(self.dialect)
+
+class SystematikStatementCacheTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.factory_calls = 0
+        self.cache = SystematikStatementCache()
+        self.cache.register('answer', self.create_statement)
+
+    def create_statement(self):
+
+        self.factory_calls += 1
+        return text("select :value + 1")
+
+    def test_statement_is_built_once(self):
+
+        statement = self.cache.get_statement('answer')
+        self.assertIs(self.cache.get_statement('answer'), statement)
+        self.assertEqual(self.factory_calls, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        with self.assertRaises(UnknownStatementException):
+            self.cache.get_statement('question')
+
+    def test_compiled_cache_of_the_engine_is_hit(self):
+
+        engine = create_engine("sqlite://")
+        with engine.connect() as connection:
+            for value in range(0, 3):
+                self.assertEqual(self.cache.execute(connection, 'answer', {'value': value}).scalar(), value + 1)
+        statistics = self.cache.get_statistics()
+        self.assertEqual((statistics['hits'], statistics['misses']), (2, 1))
+        self.assertEqual((statistics['compiled_hits'], statistics['compiled_misses']), (2, 1))
+        self.assertEqual(statistics['prepared'], 0)
+
+    def test_prepared_once_per_connection_on_postgresql(self):
+
+        self.cache.prepare = True
+        self.cache.register('twice', lambda: text("select * from systematik where punkt = :punkt or kommentar = :punkt " +
+                                                  "and sub = :sub"))
+        connection = RecordingConnection()
+        self.cache.execute(connection, 'twice', {'punkt': '1', 'sub': 0})
+        self.cache.execute(connection, 'twice', {'punkt': '2', 'sub': 0})
+        self.assertEqual(connection.driver_sql, [
+            "PREPARE systematik_twice AS select * from systematik where punkt = $1 or kommentar = $1 and sub = $2"])
+        self.assertEqual(connection.executed, [("EXECUTE systematik_twice(:punkt, :sub)", {'punkt': '1', 'sub': 0}),
+                                               ("EXECUTE systematik_twice(:punkt, :sub)", {'punkt': '2', 'sub': 0})])
+        other_connection = RecordingConnection()
+        self.cache.execute(other_connection, 'twice', {'punkt': '3', 'sub': 0})
+        self.assertEqual(len(other_connection.driver_sql), 1)
+        self.assertEqual(self.cache.prepared, 2)
+
+    def test_not_preparable_statements_are_executed_directly(self):
+
+        self.cache.prepare = True
+        self.cache.register('many', lambda: text("select * from systematik where punkt in :punkte").bindparams(
+            bindparam('punkte', expanding=True)), preparable=False)
+        connection = RecordingConnection()
+        self.cache.execute(connection, 'many', {'punkte': ['1', '2']})
+        self.assertEqual(connection.driver_sql, [])
+        self.assertEqual(self.cache.prepared, 0)
+
+    def test_streaming_statements_are_not_prepared(self):
+
+        self.cache.prepare = True
+        self.cache.register('fetch_all', lambda: text("select * from systematik").execution_options(stream_results=True))
+        connection = RecordingConnection()
+        self.cache.execute(connection, 'fetch_all')
+        self.assertEqual(connection.driver_sql, [])
+        self.assertEqual(connection.executed, [("select * from systematik", None)])
+
+    def test_no_prepare_on_other_databases(self):
+
+        self.cache.prepare = True
+        engine = create_engine("sqlite://")
+        with engine.connect() as connection:
+            self.assertEqual(self.cache.execute(connection, 'answer', {'value': 1}).scalar(), 2)
+        self.assertEqual(self.cache.prepared, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import unittest
+from asb_systematik.SystematikDao import SystematikIdentifier,\
+    TRAVERSAL_PREORDER, TRAVERSAL_POSTORDER, TRAVERSAL_LEVELORDER
+from systematik_data import create_tree, identifiers
+
+class SystematikTreeTest(unittest.TestCase):
+
+    def test_traversal_orders(self):
+
+        tree = create_tree((("1", "Eins"), ("1.1", "Eins eins"), ("1.2", "Eins zwei"), ("2", "Zwei")))
+        self.assertEqual(identifiers(tree.traverse(TRAVERSAL_PREORDER)), ["Rootnode", "1", "1.1", "1.2", "2"])
+        self.assertEqual(identifiers(tree.traverse(TRAVERSAL_POSTORDER)), ["1.1", "1.2", "1", "2", "Rootnode"])
+        self.assertEqual(identifiers(tree.traverse(TRAVERSAL_LEVELORDER)), ["Rootnode", "1", "2", "1.1", "1.2"])
+
+    def test_flat_preorder_is_cached_until_the_tree_changes(self):
+
+        tree = create_tree()
+        flat = tree.get_flat_preorder()
+        self.assertIs(tree.get_flat_preorder(), flat)
+        self.assertEqual([entry[0] for entry in flat], list(tree.traverse()))
+        for node, depth, parent_index in flat[1:]:
+            self.assertIs(flat[parent_index][0], node.parent)
+            self.assertEqual(depth, flat[parent_index][1] + 1)
+        tree.remove_node(tree.find_node(SystematikIdentifier("2.2")))
+        self.assertIsNot(tree.get_flat_preorder(), flat)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import unittest
+from asb_systematik.SystematikDao import SystematikTreeBuilder, SystematikNode, SystematikIdentifier
+from systematik_data import create_nodes, create_tree, identifiers
+
+class SystematikTreeBuilderTest(unittest.TestCase):
+
+    def test_children_in_natural_order_whatever_the_input_order(self):
+
+        nodes = create_nodes()
+        rootnode = SystematikNode(SystematikIdentifier(None), "Root")
+        result = SystematikTreeBuilder().build(rootnode, reversed(nodes))
+        self.assertTrue(result.is_complete())
+        self.assertEqual(identifiers(rootnode.children), ["0", "1", "2"])
+        self.assertEqual(identifiers(rootnode.children[2].children), ["2.1", "2.2", "2.10"])
+        self.assertEqual(identifiers(rootnode.children[1].children), ["1-1", "1.I", "1.II", "1.1"])
+
+    def test_siblings_are_linked(self):
+
+        tree = create_tree()
+        first = tree.find_node(SystematikIdentifier("2.1"))
+        self.assertIsNone(first.previous_sibling)
+        self.assertIs(first.next_sibling, tree.find_node(SystematikIdentifier("2.2")))
+        self.assertIs(first.next_sibling.previous_sibling, first)
+        self.assertIsNone(tree.find_node(SystematikIdentifier("2.10")).next_sibling)
+
+    def test_orphans_and_duplicates(self):
+
+        nodes = create_nodes((("1", "Eins"), ("1.1", "Eins eins"), ("3.1", "Ohne Eltern"), ("1.1", "Doppelt")))
+        rootnode = SystematikNode(SystematikIdentifier(None), "Root")
+        result = SystematikTreeBuilder().build(rootnode, nodes)
+        self.assertFalse(result.is_complete())
+        self.assertEqual(identifiers(result.orphans), ["3.1"])
+        self.assertEqual([node.beschreibung for node in result.duplicates], ["Doppelt"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import unittest
+from asb_systematik.SystematikDao import SystematikTreeIndex, SystematikNode, SystematikIdentifier
+from systematik_data import create_tree, identifiers
+
+class SystematikTreeIndexTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tree = create_tree()
+        self.index = self.tree.index
+
+    def test_descendants(self):
+
+        self.assertEqual(identifiers(self.index.get_descendants(SystematikIdentifier("1"))),
+                         ["1-1", "1.I", "1.I-1", "1.I-2", "1.II", "1.1"])
+        self.assertTrue(self.index.is_descendant(SystematikIdentifier("1.I-2"), SystematikIdentifier("1")))
+        self.assertFalse(self.index.is_descendant(SystematikIdentifier("1"), SystematikIdentifier("1")))
+        self.assertFalse(self.index.is_descendant(SystematikIdentifier("2.1"), SystematikIdentifier("1")))
+
+    def test_add_without_renumbering(self):
+
+        node = SystematikNode(SystematikIdentifier("2.3"), "Neu")
+        node.parent = self.tree.find_node(SystematikIdentifier("2"))
+        self.tree.add_node(node)
+        self.assertIs(self.index.get(node.identifier), node)
+        self.assertTrue(self.index.is_descendant(node.identifier, SystematikIdentifier("2")))
+        self.assertEqual(identifiers(self.index.get_descendants(SystematikIdentifier("2"))),
+                         ["2.1", "2.2", "2.3", "2.10"])
+
+    def test_remove_takes_the_subtree(self):
+
+        self.tree.remove_node(self.tree.find_node(SystematikIdentifier("1.I")))
+        for identifier in ("1.I", "1.I-1", "1.I-2"):
+            self.assertNotIn(SystematikIdentifier(identifier), self.index)
+        self.assertEqual(identifiers(self.index.get_descendants(SystematikIdentifier("1"))), ["1-1", "1.II", "1.1"])
+
+    def test_renumber_when_gaps_are_used_up(self):
+
+        parent = self.tree.find_node(SystematikIdentifier("0.1.1"))
+        for number in range(1, 200):
+            node = SystematikNode(SystematikIdentifier("0.1.1.%d" % number), "Punkt %d" % number)
+            node.parent = parent
+            self.tree.add_node(node)
+        rebuilt = SystematikTreeIndex(self.tree.rootnode)
+        self.assertEqual(self.index.get_descendants(SystematikIdentifier("0")),
+                         rebuilt.get_descendants(SystematikIdentifier("0")))
+
+if __name__ == '__main__':
+    unittest.main()
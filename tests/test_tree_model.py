@@ -0,0 +1,111 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import os
+import unittest
+from asb_systematik.SystematikDao import SystematikIdentifier, SystematikNode,\
+    SystematikUsage
+from asb_systematik.SystematikFilter import SystematikFilterEngine
+from systematik_data import create_tree
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+try:
+    from PyQt5.QtCore import QModelIndex
+    from PyQt5.QtWidgets import QApplication
+    from asb_systematik.SystematikTreeModel import SystematikTreeModel, SystematikTreeView
+except ImportError:
+    raise unittest.SkipTest("The model tests need PyQt5")
+
+APPLICATION = QApplication.instance() or QApplication([])
+
+class SystematikTreeModelTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tree = create_tree()
+        self.model = SystematikTreeModel(self.tree)
+
+    def node(self, identifier):
+
+        return self.tree.find_node(SystematikIdentifier(identifier))
+
+    def test_rows_are_fetched_lazily(self):
+
+        self.assertEqual(self.model.rowCount(), 3)
+        index = self.model.index(1, 0)
+        self.assertIs(self.model.get_node(index), self.node("1"))
+        self.assertTrue(self.model.hasChildren(index))
+        self.assertTrue(self.model.canFetchMore(index))
+        self.assertEqual(self.model.rowCount(index), 0)
+        self.model.fetchMore(index)
+        self.assertEqual(self.model.rowCount(index), 4)
+        self.assertEqual(self.model.get_fetched_nodes(), [self.tree.rootnode, self.node("1")])
+
+    def test_index_for_node_fetches_the_path(self):
+
+        index = self.model.index_for_node(self.node("1.I-2"), SystematikTreeModel.COLUMN_BESCHREIBUNG)
+        self.assertEqual(self.model.data(index), "Hamburg")
+        self.assertEqual(self.model.data(self.model.parent(index)), "1.I")
+        self.assertTrue(self.model.is_fetched(self.node("1.I")))
+        self.assertFalse(self.model.is_fetched(self.node("2")))
+
+    def test_refresh_children_after_add_and_remove(self):
+
+        parent = self.node("2")
+        self.model.fetchMore(self.model.index_for_node(parent))
+        node = SystematikNode(SystematikIdentifier("2.3"), "Neu", id=100)
+        node.parent = parent
+        self.tree.add_node(node)
+        inserted = []
+        self.model.rowsInserted.connect(lambda index, first, last: inserted.append((first, last)))
+        self.model.refresh_children(parent)
+        self.assertEqual(inserted, [(2, 2)])
+        self.assertEqual(self.model.index_for_node(node).row(), 2)
+
+        self.tree.remove_node(self.node("2.1"))
+        self.model.refresh_children(parent)
+        self.assertEqual([self.model.get_node(self.model.index(row, 0, self.model.index_for_node(parent))).beschreibung
+                          for row in range(0, 3)], ["Wasser", "Neu", "Verkehr"])
+
+    def test_display_text_is_cached_until_the_node_changes(self):
+
+        node = self.node("2.1")
+        index = self.model.index_for_node(node, SystematikTreeModel.COLUMN_BESCHREIBUNG)
+        self.assertEqual(self.model.data(index), "Atomkraft")
+        node.startjahr = 1975
+        self.assertEqual(self.model.data(index), "Atomkraft")
+        self.model.node_changed(node)
+        self.assertEqual(self.model.data(index), "Atomkraft (ab 1975)")
+
+    def test_usage_column(self):
+
+        index = self.model.index_for_node(self.node("2.1"), SystematikTreeModel.COLUMN_VERWENDUNGEN)
+        self.assertEqual(self.model.data(index), "")
+        usage = SystematikUsage()
+        usage.dokumente = 2
+        self.model.set_usage_map({SystematikIdentifier("2.1"): usage})
+        self.assertEqual(self.model.data(index), "2")
+        self.assertEqual(self.model.data(self.model.index_for_node(self.node("2"), 2)), "0")
+
+class SystematikTreeViewItemTest(unittest.TestCase):
+
+    def test_child_item_becomes_a_row_only_when_added(self):
+
+        tree = create_tree()
+        model = SystematikTreeModel(tree)
+        view = SystematikTreeView(model, SystematikFilterEngine(tree))
+        view.setCurrentIndex(model.index_for_node(tree.find_node(SystematikIdentifier("2"))))
+        parent_item = view.first_selected()
+        item = view.create_child_item(parent_item, SystematikNode(SystematikIdentifier("2.3"), None))
+        self.assertIs(item.systematik_node.parent, parent_item.systematik_node)
+        self.assertNotIn(item.systematik_node, parent_item.systematik_node.children)
+        item.beschreibung = "Neu"
+        self.assertEqual(item.display_text, "Neu")
+        self.assertFalse(model.index_for_node(item.systematik_node).isValid())
+        self.assertEqual(model.rowCount(QModelIndex()), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import os
+import tempfile
+import unittest
+from sqlalchemy.sql.expression import text
+from asb_systematik.SystematikDao import SystematikDao, SystematikIdentifier,\
+    SystematikNode
+from asb_systematik.SystematikSnapshot import SystematikSnapshotStore
+from systematik_data import create_database, create_tree
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+try:
+    from PyQt5.QtWidgets import QApplication
+    from asb_systematik.SystematikDbWorker import SystematikDbWorker
+    from asb_systematik.SystematikTreeModel import SystematikTreeViewItem
+    from asb_systematik.SystematikTreeWidgetService import SystematikTreeWidgetService
+except ImportError:
+    raise unittest.SkipTest("The service tests need PyQt5")
+
+APPLICATION = QApplication.instance() or QApplication([])
+
+class ServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_database(os.path.join(self.directory.name, 'systematik.db'))
+        self.dao = SystematikDao(self.engine)
+        self.db_worker = SystematikDbWorker(self.dao)
+        self.service = SystematikTreeWidgetService(
+            self.dao, SystematikSnapshotStore(os.path.join(self.directory.name, 'systematik.snapshot')),
+            self.db_worker)
+        self.view = self.service.create_tree_view()
+        self.reloads = 0
+        self.service._reload_listeners.append(self.count_reload)
+
+    def tearDown(self):
+
+        self.db_worker.wait_for_done()
+        APPLICATION.processEvents()
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def count_reload(self, tree):
+
+        self.reloads += 1
+
+    def execute(self, statement, parameters=None):
+
+        with self.engine.begin() as connection:
+            connection.execute(text(statement), parameters or {})
+
+    def node(self, identifier):
+
+        return self.service.tree.find_node(SystematikIdentifier(identifier))
+
+    def item(self, node):
+
+        return SystematikTreeViewItem(self.view, node)
+
+    def wait_for_worker(self):
+
+        while len(self.db_worker._running_tasks) > 0:
+            self.db_worker.wait_for_done()
+            APPLICATION.processEvents()
+
+class SystematikTreeFingerprintTest(unittest.TestCase):
+
+    def test_node_count_includes_orphans_and_duplicates(self):
+
+        tree = create_tree((("1", "Eins"), ("3.1", "Ohne Eltern"), ("1", "Doppelt")))
+        self.assertEqual(tree.get_node_count(), 3)
+
+    def test_fingerprint_follows_the_content(self):
+
+        tree = create_tree()
+        fingerprint = tree.get_fingerprint()
+        node = tree.find_node(SystematikIdentifier("2.1"))
+        node.beschreibung = "Atomkraft? Nein danke"
+        tree.mark_content_changed(node)
+        self.assertEqual(tree.get_fingerprint()[:2], fingerprint[:2])
+        self.assertNotEqual(tree.get_fingerprint(), fingerprint)
+
+class VerifyTreeTest(ServiceTestCase):
+
+    def test_tree_fingerprint_equals_the_table_fingerprint(self):
+
+        self.assertEqual(self.service.tree.get_fingerprint(), self.dao.fetch_fingerprint())
+
+    def test_own_edits_keep_the_tree_in_line(self):
+
+        node = self.node("2.1")
+        node.beschreibung = "Atomkraft? Nein danke"
+        self.service.save(self.item(node))
+        child = SystematikNode(SystematikIdentifier("2.3"), "Neu")
+        child.parent = self.node("2")
+        self.service.save(self.item(child))
+        self.service.delete(self.item(self.node("0.2")))
+        self.assertTrue(self.service.verify_tree())
+        self.wait_for_worker()
+        self.assertEqual(self.reloads, 0)
+
+    def test_update_of_another_user_is_noticed(self):
+
+        self.service.tree
+        self.execute("update systematik set beschreibung = 'Atom' where id = 13")
+        self.assertFalse(self.service.verify_tree())
+        self.wait_for_worker()
+        self.assertEqual(self.reloads, 1)
+        self.assertEqual(self.node("2.1").beschreibung, "Atom")
+
+    def test_rename_and_insert_with_the_same_count_are_noticed(self):
+
+        self.service.tree
+        self.execute("update systematik set punkt = '2', roemisch = 0, sub = 1 where id = 15")
+        self.execute("delete from systematik where id = 14")
+        self.execute("insert into systematik (id, punkt, roemisch, sub, beschreibung) values (14, '2.10', 0, 0, 'Verkehr')")
+        self.assertFalse(self.service.verify_tree(self.dao.fetch_fingerprint()))
+        self.wait_for_worker()
+        self.assertIsNotNone(self.node("2-1"))
+        self.assertIsNone(self.node("2.2"))
+
+    def test_change_poller_is_asked_with_change_log(self):
+
+        polls = []
+        self.service.add_poll_listener(lambda: polls.append(True))
+        self.service.tree
+        self.service.watermark = 0
+        self.assertIsNone(self.service.fetch_fingerprint())
+        self.assertTrue(self.service.verify_tree())
+        self.assertEqual(polls, [True])
+
+class ReplacedTreeTest(ServiceTestCase):
+    """
+    A save or delete that finishes after the tree has been replaced
+    (by the reconciliation or a reload) must not touch the old tree.
+    """
+
+    def replace_tree(self):
+
+        old_tree = self.service.tree
+        self.service.reload_tree()
+        self.assertIsNot(self.service.tree, old_tree)
+        return old_tree
+
+    def test_insert(self):
+
+        node = SystematikNode(SystematikIdentifier("2.11"), "Neu")
+        node.parent = self.node("2")
+        old_tree = self.replace_tree()
+        inserted = self.service.write_node(node)
+        self.service.node_saved(self.item(node), inserted, tree=old_tree)
+        new_node = self.node("2.11")
+        self.assertIsNotNone(new_node)
+        self.assertIsNot(new_node, node)
+        self.assertIn(new_node, self.node("2").children)
+        self.assertNotIn(node, old_tree.find_node(SystematikIdentifier("2")).children)
+        self.assertEqual(self.service.tree.get_node_count(), self.dao.count_nodes())
+        self.assertTrue(self.service.verify_tree())
+
+    def test_insert_already_in_the_new_tree(self):
+
+        old_tree = self.service.tree
+        node = SystematikNode(SystematikIdentifier("2.11"), "Neu")
+        node.parent = self.node("2")
+        inserted = self.service.write_node(node)
+        self.service.reload_tree()
+        self.service.node_saved(self.item(node), inserted, tree=old_tree)
+        self.assertEqual(["%s" % child.identifier for child in self.node("2").children], ["2.1", "2.2", "2.10", "2.11"])
+        self.assertEqual(self.service.tree.get_node_count(), 16)
+
+    def test_update(self):
+
+        node = self.node("2.1")
+        old_tree = self.replace_tree()
+        node.beschreibung = "Atomkraft? Nein danke"
+        self.service.write_node(node)
+        self.service.node_saved(self.item(node), False, tree=old_tree)
+        self.assertEqual(self.node("2.1").beschreibung, "Atomkraft? Nein danke")
+        self.assertTrue(self.service.verify_tree())
+
+    def test_delete(self):
+
+        node = self.node("0.2")
+        old_tree = self.replace_tree()
+        self.dao.delete_node(node)
+        self.service.node_deleted(self.item(node), tree=old_tree)
+        self.assertIsNone(self.node("0.2"))
+        self.assertIs(old_tree.find_node(SystematikIdentifier("0.2")), node)
+        self.assertTrue(self.service.verify_tree())
+
+if __name__ == '__main__':
+    unittest.main()
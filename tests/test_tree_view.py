@@ -0,0 +1,132 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import os
+import unittest
+from asb_systematik.SystematikDao import SystematikIdentifier
+from asb_systematik.SystematikFilter import SystematikFilterEngine
+from systematik_data import create_tree
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+try:
+    from PyQt5.QtWidgets import QApplication
+    from asb_systematik.SystematikTreeModel import SystematikTreeModel, SystematikTreeView
+except ImportError:
+    raise unittest.SkipTest("The view tests need PyQt5")
+
+APPLICATION = QApplication.instance() or QApplication([])
+
+class SystematikTreeViewTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tree = create_tree()
+        self.model = SystematikTreeModel(self.tree)
+        self.view = SystematikTreeView(self.model, SystematikFilterEngine(self.tree))
+        self.resets = 0
+
+        def count_reset():
+            self.resets += 1
+        self.model.modelAboutToBeReset.connect(count_reset)
+
+    def node(self, identifier):
+
+        return self.tree.find_node(SystematikIdentifier(identifier))
+
+    def shown_children(self, identifier=None):
+
+        if identifier is None:
+            index = self.model.index_for_node(None)
+        else:
+            index = self.model.index_for_node(self.node(identifier))
+        self.model.fetchMore(index)
+        return ["%s" % self.model.get_node(self.model.index(row, 0, index)).identifier
+                for row in range(0, self.model.rowCount(index))]
+
+    def is_expanded(self, identifier):
+
+        return self.view.isExpanded(self.model.index_for_node(self.node(identifier)))
+
+    def test_filter_without_model_reset(self):
+
+        self.view.filter("HAMBURG")
+        self.assertEqual(self.shown_children(), ["1"])
+        self.assertEqual(self.shown_children("1"), ["1.I"])
+        self.assertEqual(self.shown_children("1.I"), ["1.I-2"])
+        self.view.filter("")
+        self.assertEqual(self.shown_children(), ["0", "1", "2"])
+        self.assertEqual(self.shown_children("1.I"), ["1.I-1", "1.I-2"])
+        self.assertEqual(self.resets, 0)
+
+    def test_only_changed_rows_are_touched(self):
+
+        self.view.filter("HAMBURG")
+        self.assertEqual(self.shown_children("1.I"), ["1.I-2"])
+        removed = []
+        self.model.rowsAboutToBeRemoved.connect(lambda parent, first, last: removed.append((first, last)))
+        self.view.filter("BERLIN")
+        self.assertEqual(self.shown_children("1.I"), ["1.I-1"])
+        self.assertEqual(removed, [(0, 0)])
+
+    def test_expanded_branches_come_back_expanded(self):
+
+        self.view.setExpanded(self.model.index_for_node(self.node("1")), True)
+        self.view.setExpanded(self.model.index_for_node(self.node("1.I")), True)
+        self.view.filter("UMWELT")
+        self.assertEqual(self.shown_children(), ["2"])
+        self.view.filter("")
+        self.assertTrue(self.is_expanded("1"))
+        self.assertTrue(self.is_expanded("1.I"))
+        self.assertFalse(self.is_expanded("2"))
+
+    def test_newer_query_drops_the_running_pass(self):
+
+        self.view.filter_engine.STEP_SIZE = 2
+        self.view.FILTER_CHUNK_SIZE = 1
+        self.view._pending_filter = "HAMBURG"
+        self.view._start_filter_pass()
+        outdated_pass = self.view._filter_pass
+        next(outdated_pass)
+        self.view.filter("WASSER")
+        self.assertFalse(self.view.is_filtering())
+        with self.assertRaises(StopIteration):
+            next(outdated_pass)
+        self.assertEqual(self.shown_children(), ["2"])
+        self.assertEqual(self.shown_children("2"), ["2.2"])
+
+    def test_scheduled_filter_runs_in_slices(self):
+
+        self.view.filter_engine.STEP_SIZE = 2
+        self.view.FILTER_CHUNK_SIZE = 1
+        self.view.FILTER_DELAY_MS = 0
+        self.view.FILTER_SLICE_SECONDS = 0
+        self.view.schedule_filter("HAMBURG")
+        self.assertEqual(self.shown_children(), ["0", "1", "2"])
+        slices = 0
+        while self.view.is_filtering():
+            APPLICATION.processEvents()
+            slices += 1
+        self.assertGreater(slices, 2)
+        self.assertEqual(self.shown_children(), ["1"])
+        self.assertEqual(self.resets, 0)
+
+    def test_tree_change_during_the_pass(self):
+
+        self.view.FILTER_CHUNK_SIZE = 1
+        self.view._pending_filter = "HAMBURG"
+        self.view._start_filter_pass()
+        filter_pass = self.view._filter_pass
+        next(filter_pass)
+        self.tree.remove_node(self.node("0.2"))
+        self.model.refresh_children(self.node("0"))
+        while self.view.is_filtering():
+            APPLICATION.processEvents()
+        self.assertEqual(self.shown_children(), ["1"])
+        self.view.filter("")
+        self.assertEqual(self.shown_children("0"), ["0.1"])
+
+if __name__ == '__main__':
+    unittest.main()
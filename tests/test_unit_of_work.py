@@ -0,0 +1,60 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import os
+import threading
+import unittest
+from unittest import mock
+from sqlalchemy.sql.expression import text
+from asb_systematik.SystematikDao import get_engine_options
+from test_dao import DatabaseTestCase
+
+class UnitOfWorkTest(DatabaseTestCase):
+
+    def test_nested_units_share_the_connection(self):
+
+        with self.dao.unit_of_work() as connection:
+            with self.dao.unit_of_work() as inner_connection:
+                self.assertIs(inner_connection, connection)
+            self.assertIs(self.dao.connection, connection)
+        self.assertIsNone(self.dao.connection)
+
+    def test_failure_rolls_the_whole_unit_back(self):
+
+        with self.assertRaises(ValueError):
+            with self.dao.unit_of_work() as connection:
+                connection.execute(text("delete from systematik where id = 4"))
+                self.assertEqual(self.dao.count_nodes(), 14)
+                raise ValueError("kaputt")
+        self.assertEqual(self.dao.count_nodes(), 15)
+
+    def test_every_thread_has_its_own_connection(self):
+
+        connections = []
+        with self.dao.unit_of_work():
+            thread = threading.Thread(target=lambda: connections.append(self.dao.connection))
+            thread.start()
+            thread.join()
+        self.assertEqual(connections, [None])
+
+class EngineOptionsTest(unittest.TestCase):
+
+    def test_pool_options_from_the_environment(self):
+
+        with mock.patch.dict(os.environ, {'DB_POOL_SIZE': '3', 'DB_MAX_OVERFLOW': '1', 'DB_POOL_PRE_PING': '0',
+                                          'DB_POOL_RECYCLE': '60', 'DB_STATEMENT_TIMEOUT': '5000'}):
+            options = get_engine_options("postgresql://alexandria@localhost/alexandria")
+        self.assertEqual(options, {'pool_pre_ping': False, 'pool_recycle': 60, 'pool_size': 3, 'max_overflow': 1,
+                                   'connect_args': {'options': '-c statement_timeout=5000'}})
+
+    def test_no_queue_pool_options_for_sqlite(self):
+
+        with mock.patch.dict(os.environ, {'DB_STATEMENT_TIMEOUT': '5000'}):
+            options = get_engine_options("sqlite:////tmp/systematik.db")
+        self.assertNotIn('pool_size', options)
+        self.assertNotIn('connect_args', options)
+
+if __name__ == '__main__':
+    unittest.main()
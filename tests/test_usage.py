@@ -0,0 +1,51 @@
+'''
+Created on 18.10.2026
+
+@author: michael
+'''
+import unittest
+from asb_systematik.SystematikDao import SystematikIdentifier
+from test_dao import DatabaseTestCase
+
+class UsageTest(DatabaseTestCase):
+
+    def setUp(self):
+
+        super().setUp()
+        self.execute("insert into broschueren (id, titel, systematik1, systematik2) values (1, 'Broschüre', '2.1', '1.I-1')")
+        self.execute("insert into zeitschriften (id, titel, systematik1, systematik2, systematik3) " +
+                     "values (1, 'Zeitschrift', null, null, '2.1')")
+        self.execute("insert into dokument (hauptnr, standort) values (7, '2.10')")
+        self.execute("insert into sverweis (hauptnr, systematik, roemisch, sub) values (8, '1', 1, 2)")
+        self.execute("insert into sverweis (hauptnr, systematik, roemisch, sub) values (9, '0', 0, 1)")
+
+    def test_is_used(self):
+
+        self.assertTrue(self.dao.is_used(SystematikIdentifier("2.1")))
+        self.assertTrue(self.dao.is_used(SystematikIdentifier("1.I-2")))
+        self.assertTrue(self.dao.is_used(SystematikIdentifier("0-1")))
+        self.assertFalse(self.dao.is_used(SystematikIdentifier("1.I")))
+        self.assertFalse(self.dao.is_used(SystematikIdentifier("2.2")))
+
+    def test_first_usage_prefers_the_earlier_sources(self):
+
+        self.assertEqual(self.dao.find_first_usage(SystematikIdentifier("2.1")), "Broschüre \"Broschüre\"")
+        self.assertEqual(self.dao.find_first_usage(SystematikIdentifier("2.10")), "Alexandria-Dokument Nr. 7")
+        self.assertEqual(self.dao.find_first_usage(SystematikIdentifier("1.I-2")), "Alexandria-Dokument Nr. 8")
+        self.assertIsNone(self.dao.find_first_usage(SystematikIdentifier("2.2")))
+
+    def test_is_used_many(self):
+
+        identifiers = [SystematikIdentifier(point) for point in ("1", "1.I", "1.I-1", "1.I-2", "0-1", "2.1", "2.10", "2.2")]
+        self.assertEqual(self.dao.is_used_many(identifiers),
+                         set([SystematikIdentifier(point) for point in ("1.I-1", "1.I-2", "0-1", "2.1", "2.10")]))
+        self.assertEqual(self.dao.is_used_many([]), set())
+
+    def test_is_used_many_agrees_with_is_used(self):
+
+        identifiers = [node.identifier for node in self.dao.iterate_nodes()]
+        self.assertEqual(self.dao.is_used_many(identifiers),
+                         set([identifier for identifier in identifiers if self.dao.is_used(identifier)]))
+
+if __name__ == '__main__':
+    unittest.main()